@@ -142,22 +142,26 @@ def get_most_recent_release(version_family=None, repo=None):
                  'from repo {repo}.'.format(
                      version=version_family,
                      repo=repo.name))
-    releases = repo.get_releases()
-    largest_version = get_largest_version(
-        [v.title for v in releases if v.title[0].isdigit()])
-    for release in releases:
-        if release.title == largest_version:
-            return release
+    # List the releases once.
+    releases = {v.title: v for v in repo.get_releases()
+                if v.title and v.title[0].isdigit()}
+    return releases.get(get_largest_version(releases))
+
+
+def version_key(version):
+    """
+    :param version: A "manager version-blueprint version" string, such as
+        '6.4.0-12'.
+    :return: A tuple that orders versions by their numbers.
+    """
+
+    manager_version, blueprint_version = version.split('-')
+    return (tuple(int(part) for part in findall(r'\d+', manager_version)),
+            int(blueprint_version))
 
 
 def get_largest_version(versions):
-    largest = '0-0'
-    for version in versions:
-        manager_version, blueprint_version = version.split('-')
-        if manager_version >= largest.split('-')[0] and \
-                int(blueprint_version) >= int(largest.split('-')[-1]):
-            largest = version
-    return largest
+    return max(versions, key=version_key, default='0-0')
 
 
 def get_pull_requests(numbers, repo=None):
@@ -14,18 +14,38 @@
 # limitations under the License.
 
 import os
-from time import sleep
 from copy import deepcopy
 from urllib.parse import urlparse
+from threading import BoundedSemaphore, local
+from concurrent.futures import ThreadPoolExecutor
 
 from . import s3
 from . import github
+from . import uploads
 from . import logging
 from . import plugins_json
 from . import marketplace
+from . import verification
+from . import plugins_json_updates
+from .plugins_index import PluginsIndex
 
 clilogger = logging.logging.getLogger('ecosystem-cli')
 clilogger.setLevel(logging.logging.DEBUG)
+# How many plugins populate_plugins_json works on at the same time, and
+# how many GitHub and S3 calls may be in flight.
+PLUGINS_JSON_WORKERS = int(os.environ.get('PLUGINS_JSON_WORKERS', 8))
+GITHUB_CONCURRENCY = int(os.environ.get('PLUGINS_JSON_GITHUB_CONCURRENCY', 4))
+S3_CONCURRENCY = int(os.environ.get('PLUGINS_JSON_S3_CONCURRENCY', 8))
+
+
+class NoLimit(object):
+    """Stands in for a semaphore when calls are not limited."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
 
 
 @github.with_github_client
@@ -43,7 +63,7 @@ def upload_assets_to_release(assets, release_name, repository=None, **_):
     :param release_name:
     :param repository:
     :param _:
-    :return:
+    :return: The AssetDiff of each source, unless the release is latest.
     """  # noqa
 
     release_name = release_name or github.get_most_recent_release(repository)
@@ -59,9 +79,14 @@ def upload_assets_to_release(assets, release_name, repository=None, **_):
         raise RuntimeError(
             'The release {release} does not exist.'.format(release=release))
 
-    for label, path, in assets.items():
-        github.upload_asset(release, path, label)
-        s3.upload_plugin_asset_to_s3(path, repository.name, release_name)
+    # The S3 uploads run in the background while GitHub uploads.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        s3_upload = executor.submit(uploads.upload_plugin_assets_to_s3,
+                                    list(assets.values()),
+                                    repository.name,
+                                    release_name)
+        github.sync_release_assets(release, assets)
+        s3_upload.result()
 
     if release_name == 'latest':
         return
@@ -74,54 +99,21 @@ def upload_assets_to_release(assets, release_name, repository=None, **_):
             os.environ.get('CIRCLE_USERNAME', 'earthmant')
         )
 
-    # Time to wait for the plugin to load
-    # And checking that everything was updated correctly
-    max_time = 360  # it should not take longer than 360 seconds.
-    min_time = 20  # It should definitely take longer than 20 seconds.
-    interval = 10  # We check every 10 seconds.
-    current = 0
-    while True:
-        if current < min_time:
-            current += interval
-            continue
-        elif current > max_time:
-            raise RuntimeError(
-                'Timed out waiting for marketplace plugin update.')
-        elif checking_the_upload_of_the_plugin(repository,
-                                               release_name,
-                                               assets):
-            logging.logger.info(
-                'Verified plugin release in {} seconds'.format(current))
-            break
-        sleep(interval)
-        current += interval
+    # Wait for the plugin to load, and check that everything was updated.
+    release_verification = verification.ReleaseVerification(
+        repository, release_name, assets)
+    elapsed = release_verification.wait()
+    logging.logger.info(
+        'Verified plugin release in {:.0f} seconds'.format(elapsed))
+    verification.log_asset_diffs(release_verification.diffs)
+    return release_verification.diffs
 
 
 def checking_the_upload_of_the_plugin(repository,
                                       release_name,
                                       asset_workspace):
-
-    # marketplace
-    # if not marketplace.get_node_types_for_plugin_version(
-    #         repository.name, release_name):
-    #     if 'fabric' not in repository.name:
-    #         return False
-
-    # github
-    latest_release = repository.get_release(release_name)
-    assets_list_github = []
-    for asset in latest_release.get_assets():
-        logging.logger.info('Asset in release: {}'.format(asset.name))
-        assets_list_github.append(asset.name)
-
-    return check_asset_problems(
-        marketplace.get_assets(repository, release_name),
-        assets_list_github,
-        s3.get_assets(repository.name, release_name),
-        list(asset_workspace.keys()),
-        repository,
-        release_name
-    )
+    return verification.ReleaseVerification(
+        repository, release_name, asset_workspace).check()
 
 
 def check_asset_problems(marketplace_assets,
@@ -130,31 +122,22 @@ def check_asset_problems(marketplace_assets,
                          assets,
                          repository,
                          version):
-    plugin_name = repository.name
-    org_name = repository.organization.login
-    problems = []
-    for asset in assets:
-        if asset.endswith('wgn.md5'):
-            continue
-        elif asset.endswith('v2_plugin.yaml'):
-            continue
-        elif asset.endswith('plugin_1_5.yaml'):
-            continue
-        marketplace_key = 'https://github.com/{}/{}/' \
-                          'releases/download/{}/{}'.format(org_name,
-                                                           plugin_name,
-                                                           version,
-                                                           asset)
-        if marketplace_key not in marketplace_assets:
-            if not plugin_name.startswith('nativeedge'):
-                problems.append('{} not found in {}'.format(
-                    marketplace_key, marketplace_assets))
-        if asset not in github_assets:
-            problems.append('{} not found in {}'.format(
-                asset, github_assets))
-        if asset not in s3_assets:
-            problems.append('{} not found in {}'.format(
-                asset, s3_assets))
+    listings = {
+        'github': verification.normalize_github_assets(github_assets),
+        's3': verification.normalize_s3_assets(s3_assets),
+    }
+    if not repository.name.startswith('nativeedge'):
+        listings['marketplace'] = \
+            verification.normalize_marketplace_assets(
+                marketplace_assets,
+                repository.organization.login,
+                repository.name,
+                version)
+    digest = verification.LocalDigests(
+        assets if isinstance(assets, dict) else {})
+    problems = verification.get_asset_problems(
+        {source: verification.diff_assets(assets, listed, digest)
+         for source, listed in listings.items()})
     if problems:
         logging.logger.error(
             'Failed to verify all assets: {}'.format(problems))
@@ -162,6 +145,59 @@ def check_asset_problems(marketplace_assets,
     return True
 
 
+@github.with_github_client
+def reconcile_release_assets(release_name=None,
+                             assets=None,
+                             repository=None,
+                             **_):
+    """Compare a release's assets on Github, S3 and the marketplace.
+
+    :param release_name: The release, by default the most recent one.
+    :param assets: A dict of asset names to local paths, which are also
+        compared by digest, or a list of asset names. By default, the
+        assets of the Github release.
+    :param repository: The plugin's Github repository.
+    :return: The AssetDiff of each source.
+    """
+
+    release_name = release_name or github.get_most_recent_release(repository)
+    if assets is None:
+        assets = [asset.name for asset in
+                  verification.get_github_assets(repository, release_name)]
+    diffs = verification.AssetReconciliation(
+        repository.name,
+        repository.organization.login,
+        release_name,
+        assets,
+        repository=repository).diff()
+    verification.log_asset_diffs(diffs)
+    return diffs
+
+
+def reconcile_plugins_json_assets(plugin_content):
+    """Compare the assets of a plugins.json entry with S3 and the
+    marketplace.
+
+    :param plugin_content: The plugin's entry in plugins.json.
+    :return: The AssetDiff of each source.
+    """
+
+    assets = [os.path.basename(plugin_content['link'])]
+    assets.extend(os.path.basename(wagon['url'])
+                  for wagon in plugin_content['wagons'])
+    # "releases" is https://github.com/{organization}/{name}/releases.
+    organization_name = urlparse(
+        plugin_content['releases']).path.split('/')[1]
+    diffs = verification.AssetReconciliation(
+        plugin_content['name'],
+        organization_name,
+        plugin_content['version'],
+        assets,
+        sources=('s3', 'marketplace')).diff()
+    verification.log_asset_diffs(diffs)
+    return diffs
+
+
 @github.with_github_client
 def get_latest_version(repository, **kwargs):
     logging.logger.info(
@@ -175,34 +211,183 @@ def get_latest_version(repository, **kwargs):
     return latest_release
 
 
-def populate_plugins_json(plugin_yaml_name='plugin.yaml'):
-    json_content = []
-    for i in range(0, len(plugins_json.JSON_TEMPLATE)):
-        plugin_content = deepcopy(plugins_json.JSON_TEMPLATE[i])
-        parsed_url = urlparse(plugin_content['releases'])
-        repository_name = parsed_url.path.split('/')[-2]
-        assert repository_name == plugin_content['name']
-        organization_name = parsed_url.path.split('/')[-3]
+def populate_plugin(template,
+                    plugin_yaml_name='plugin.yaml',
+                    github_client=None,
+                    s3_client=None,
+                    github_limit=None,
+                    s3_limit=None):
+    """
+    Fill in the version, plugin YAML and wagons of a JSON_TEMPLATE entry.
+    :param template: A JSON_TEMPLATE entry.
+    :param plugin_yaml_name: plugin.yaml or v2_plugin.yaml.
+    :param github_client: A Github client to reuse.
+    :param s3_client: A boto3 s3 resource to reuse.
+    :param github_limit: A semaphore held during GitHub calls.
+    :param s3_limit: A semaphore held during S3 calls.
+    :return: The plugins.json entry.
+    """
+
+    github_limit = github_limit or NoLimit()
+    s3_limit = s3_limit or NoLimit()
+    organization_name, repository_name = get_template_repository(template)
+    with github_limit:
         version = get_latest_version(
             repository_name=repository_name,
-            organization_name=organization_name)
-        logging.logger.info('Got this version: {}'.format(version))
+            organization_name=organization_name,
+            github_client=github_client)
+    logging.logger.info('Got this version: {}'.format(version))
+    with s3_limit:
         plugin_yaml_url = s3.get_plugin_yaml_url(
             plugin_name=repository_name,
             filename=plugin_yaml_name,
             plugin_version=version,
+            s3=s3_client
         )
+    with s3_limit:
         wagons_list = plugins_json.get_wagons_list(
             plugin_name=repository_name,
-            plugin_version=version
+            plugin_version=version,
+            s3=s3_client
         )
-        plugin_content = deepcopy(plugins_json.JSON_TEMPLATE[i])
-        plugin_content['version'] = version
-        plugin_content['link'] = plugin_yaml_url
-        plugin_content['yaml'] = plugin_yaml_url
-        plugin_content['wagons'] = wagons_list
-        json_content.append(plugin_content)
-    return json_content
+    plugin_content = deepcopy(template)
+    plugin_content['version'] = version
+    plugin_content['link'] = plugin_yaml_url
+    plugin_content['yaml'] = plugin_yaml_url
+    plugin_content['wagons'] = wagons_list
+    return plugin_content
+
+
+def get_template_repository(template):
+    """
+    :param template: A JSON_TEMPLATE entry.
+    :return: The organization and repository names of the plugin.
+    """
+
+    parsed_url = urlparse(template['releases'])
+    repository_name = parsed_url.path.split('/')[-2]
+    assert repository_name == template['name']
+    return parsed_url.path.split('/')[-3], repository_name
+
+
+def map_plugins(func, templates, workers=PLUGINS_JSON_WORKERS):
+    """
+    Call func(template, github_client, s3_client, github_limit, s3_limit)
+    for the templates concurrently. All workers share one Github client.
+    Each worker thread reuses its own boto3 resource, because boto3
+    resources are not thread safe.
+    :param func: The function to call for each template.
+    :param templates: The JSON_TEMPLATE entries.
+    :param workers: How many plugins to work on at the same time.
+    :return: The results, in templates order.
+    """
+
+    github_client = github.get_client({})
+    github_limit = BoundedSemaphore(GITHUB_CONCURRENCY)
+    s3_limit = BoundedSemaphore(S3_CONCURRENCY)
+    s3_clients = local()
+
+    def call(template):
+        if not getattr(s3_clients, 's3', None):
+            s3_clients.s3 = s3.get_client()
+        return func(template,
+                    github_client,
+                    s3_clients.s3,
+                    github_limit,
+                    s3_limit)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        return list(executor.map(call, templates))
+
+
+def populate_plugins_json(plugin_yaml_name='plugin.yaml',
+                          workers=PLUGINS_JSON_WORKERS):
+    """
+    Generate the plugins.json content, populating the plugins concurrently.
+    :param plugin_yaml_name: plugin.yaml or v2_plugin.yaml.
+    :param workers: How many plugins to populate at the same time.
+    :return: The plugins, in JSON_TEMPLATE order.
+    """
+
+    return map_plugins(
+        lambda template, *clients: populate_plugin(
+            template, plugin_yaml_name, *clients),
+        plugins_json.JSON_TEMPLATE,
+        workers)
+
+
+def update_plugin(template,
+                  record,
+                  probe,
+                  plugin_yaml_name='plugin.yaml',
+                  github_client=None,
+                  s3_client=None,
+                  github_limit=None,
+                  s3_limit=None):
+    """
+    Populate a JSON_TEMPLATE entry again only if it has a new release, or
+    if its assets in S3 changed.
+    :param template: A JSON_TEMPLATE entry.
+    :param record: The published PluginRecord of the plugin, or None.
+    :param probe: A ReleaseProbe.
+    :return: The plugins.json entry, and why it was populated again, or
+        None if the published entry was reused.
+    """
+
+    organization_name, repository_name = get_template_repository(template)
+    with github_limit or NoLimit():
+        newest_version = probe.newest_version(
+            organization_name, repository_name)
+    with s3_limit or NoLimit():
+        reason = plugins_json_updates.get_update_reason(
+            record, newest_version, plugin_yaml_name, s3_client)
+    if not reason:
+        return plugins_json_updates.reuse_plugin(template, record), None
+    logging.logger.info('Updating {} because {}.'.format(
+        template['title'], reason))
+    return populate_plugin(template,
+                           plugin_yaml_name,
+                           github_client,
+                           s3_client,
+                           github_limit,
+                           s3_limit), reason
+
+
+def update_plugins_json(previous,
+                        plugin_yaml_name='plugin.yaml',
+                        workers=PLUGINS_JSON_WORKERS,
+                        probe=None):
+    """
+    Generate the plugins.json content from the published one, populating
+    only the plugins that changed.
+    :param previous: The published plugins.json list.
+    :param plugin_yaml_name: plugin.yaml or v2_plugin.yaml.
+    :param workers: How many plugins to check at the same time.
+    :param probe: A ReleaseProbe, by default one with the Github token.
+    :return: The plugins in JSON_TEMPLATE order, and the diff report.
+    """
+
+    plugins_index = PluginsIndex(previous)
+    probe = probe or plugins_json_updates.ReleaseProbe(
+        session=github.get_session({}))
+
+    def update(template, *clients):
+        records = [r for r in plugins_index.find(template['name'])
+                   if r.title == template['title']]
+        return update_plugin(template,
+                             records[0] if records else None,
+                             probe,
+                             plugin_yaml_name,
+                             *clients)
+
+    results = map_plugins(update, plugins_json.JSON_TEMPLATE, workers)
+    probe.save()
+    plugins = [plugin for plugin, _ in results]
+    report = plugins_json_updates.get_report(
+        previous, plugins, [reason for _, reason in results])
+    logging.logger.info('Updated {} and reused {} plugins.'.format(
+        len(report['updated']), len(report['unchanged'])))
+    return plugins, report
 
 
 def check_plugins_json(plugin_name,
@@ -223,17 +408,19 @@ def check_plugins_json(plugin_name,
         filename=plugin_yaml_file_name,
         plugin_version=version,
     )
-    for plugin_content in plugins_json_content:
-        if plugin_name != plugin_content['name']:
-            continue
-        else:
-            try:
-                assert version == plugin_content['version']
-                assert plugin_yaml_url == plugin_content['link']
-                assert plugin_yaml_url == plugin_content['yaml']
-                assert wagons_list == plugin_content['wagons']
-                return True
-            except AssertionError:
-                raise RuntimeError('Plugins JSON does not contain: '
-                                   '{} {}'.format(plugin_name, version))
-    return False
+    plugins_index = PluginsIndex(plugins_json_content)
+    # A plugin can be listed once per major version, like openstack.
+    record = plugins_index.get(plugin_name, version) or \
+        plugins_index.get(plugin_name)
+    if not record:
+        return False
+    plugin_content = record.data
+    try:
+        assert version == plugin_content['version']
+        assert plugin_yaml_url == plugin_content['link']
+        assert plugin_yaml_url == plugin_content['yaml']
+        assert wagons_list == plugin_content['wagons']
+        return True
+    except AssertionError:
+        raise RuntimeError('Plugins JSON does not contain: '
+                           '{} {}'.format(plugin_name, version))
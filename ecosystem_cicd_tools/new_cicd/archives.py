@@ -0,0 +1,199 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import time
+import shutil
+import pathlib
+import tarfile
+import subprocess
+
+from .logging import logger
+
+# gz, bz2, xz, none, or pigz for parallel gzip (falls back to gz).
+COMPRESSION = os.environ.get('BUNDLE_COMPRESSION', 'gz')
+COMPRESSION_LEVEL = int(os.environ.get('BUNDLE_COMPRESSION_LEVEL', 9))
+COMPRESSION_THREADS = int(
+    os.environ.get('BUNDLE_COMPRESSION_THREADS', os.cpu_count() or 1))
+EXTENSIONS = {
+    'gz': '.tgz',
+    'pigz': '.tgz',
+    'bz2': '.tar.bz2',
+    'xz': '.tar.xz',
+    'none': '.tar',
+}
+
+
+def get_archive_path(directory, name, compression=None):
+    """
+    :return: The path of an archive, with the compression's extension.
+    """
+
+    return os.path.join(
+        directory, name + EXTENSIONS[compression or COMPRESSION])
+
+
+class StreamingTarWriter(object):
+    """Write files into a compressed tar as they become available.
+
+    Nothing is staged on disk: every member goes straight into the
+    compression stream. With "pigz", compression runs in a separate
+    process with COMPRESSION_THREADS threads.
+    """
+
+    def __init__(self,
+                 path,
+                 compression=None,
+                 level=None,
+                 threads=None):
+        self.path = path
+        self.compression = compression or COMPRESSION
+        self.level = COMPRESSION_LEVEL if level is None else level
+        self._process = None
+        self._outfile = None
+        if self.compression == 'pigz':
+            pigz = shutil.which('pigz')
+            if pigz:
+                self._outfile = open(path, 'wb')
+                self._process = subprocess.Popen(
+                    [pigz,
+                     '-{0}'.format(self.level),
+                     '-p', str(threads or COMPRESSION_THREADS)],
+                    stdin=subprocess.PIPE,
+                    stdout=self._outfile)
+                self.tar = tarfile.open(
+                    fileobj=self._process.stdin, mode='w|')
+                return
+            logger.warning('pigz is not installed, using gz.')
+            self.compression = 'gz'
+        if self.compression == 'none':
+            self.tar = tarfile.open(path, mode='w')
+        elif self.compression == 'xz':
+            self.tar = tarfile.open(path, mode='w:xz', preset=self.level)
+        else:
+            self.tar = tarfile.open(
+                path,
+                mode='w:{0}'.format(self.compression),
+                compresslevel=self.level)
+
+    def add_directory(self, arcname):
+        info = tarfile.TarInfo(arcname)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        info.mtime = time.time()
+        self.tar.addfile(info)
+
+    def add_file(self, local_path, arcname):
+        self.tar.add(local_path, arcname=arcname, recursive=False)
+
+    def add_bytes(self, data, arcname):
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mode = 0o644
+        info.mtime = time.time()
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+        if self._process:
+            self._process.stdin.close()
+            returncode = self._process.wait()
+            self._outfile.close()
+            if returncode:
+                raise RuntimeError(
+                    'pigz failed with exit code {0} writing {1}.'.format(
+                        returncode, self.path))
+
+    def abort(self):
+        """Close the archive after a failure and remove the partial file."""
+        try:
+            self.close()
+        except Exception as e:
+            logger.error('Failed to close {0}: {1}'.format(self.path, e))
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class BundleArchive(object):
+    """A plugins bundle, written while its wagons are still downloading.
+
+    Each wagon and plugin YAML is added to the tar stream as soon as it is
+    ready, and removed from the build directory, so the bundle never needs
+    scratch space for all of its plugins. METADATA is collected on the way
+    and written last.
+
+        with BundleArchive(tar_path, name, json.dumps) as archive:
+            for wagon_path, yaml_path in fetched_plugins:
+                archive.add_plugin(tempdir, wagon_path, yaml_path)
+    """
+
+    def __init__(self, path, root, dump_metadata, **compression):
+        """
+        :param path: The archive path.
+        :param root: The top directory inside the archive.
+        :param dump_metadata: Serializes the METADATA dict to a string.
+        :param compression: StreamingTarWriter compression arguments.
+        """
+
+        self.root = root
+        self.metadata = {}
+        self._dump_metadata = dump_metadata
+        self._directories = set()
+        self.writer = StreamingTarWriter(path, **compression)
+        self.path = self.writer.path
+        self._add_directory('')
+
+    def _add_directory(self, directory):
+        arcname = '/'.join(p for p in (self.root, directory) if p)
+        if arcname not in self._directories:
+            self.writer.add_directory(arcname)
+            self._directories.add(arcname)
+
+    def _add_file(self, basedir, path, remove):
+        local_path = os.path.join(basedir, path)
+        path = pathlib.PurePath(path).as_posix()
+        self._add_directory(os.path.dirname(path))
+        self.writer.add_file(local_path, '/'.join((self.root, path)))
+        if remove:
+            os.remove(local_path)
+
+    def add_plugin(self, basedir, wagon_path, yaml_path, remove=True):
+        """
+        :param basedir: The directory that the paths are relative to.
+        :param wagon_path: The wagon path in the bundle.
+        :param yaml_path: The plugin YAML path in the bundle.
+        :param remove: Delete the local files once they are archived.
+        """
+
+        self._add_file(basedir, wagon_path, remove)
+        self._add_file(basedir, yaml_path, remove)
+        self.metadata[wagon_path] = yaml_path
+
+    def close(self):
+        logger.info('Writing bundle metadata {m}'.format(m=self.metadata))
+        self.writer.add_bytes(
+            self._dump_metadata(self.metadata).encode('utf-8'),
+            '/'.join((self.root, 'METADATA')))
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type:
+            self.writer.abort()
+        else:
+            self.close()
@@ -17,13 +17,18 @@ import os
 import json
 import yaml
 import shutil
-import tarfile
 import pathlib
+from threading import local
 from tempfile import mkdtemp
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from boto3.s3.transfer import TransferConfig
 
 from . import s3
 from .logging import logger
+from .plugins_index import PluginsIndex
+from .archives import BundleArchive, get_archive_path
 
 ARM64 = 'Centos AltArch'
 CENTOS = 'Centos Core'
@@ -57,6 +62,12 @@ PLUGINS_TO_BUNDLE = [
     'helm'
 ]
 PLUGINS_BUNDLE_NAME = 'cloudify-plugins-bundle'
+# How many files are fetched at the same time, and how many multipart
+# threads each S3 download uses.
+FETCH_WORKERS = int(os.environ.get('BUNDLE_FETCH_WORKERS', 8))
+S3_DOWNLOAD_CONCURRENCY = int(
+    os.environ.get('BUNDLE_S3_DOWNLOAD_CONCURRENCY', 4))
+DOWNLOADS_DIR = '.downloads'
 
 
 def get_local_file_from_workspace(filename, workspace):
@@ -103,22 +114,20 @@ def get_metadata_mapping(data, workspace=None, plugin_yaml_name=None):
     mapping = {}
     logger.info('Get mapping from data: {}'.format(data))
 
-    for plugin in data:
-        logger.info('Creating mapping for {}'.format(plugin))
-        if plugin['title'].lower() not in PLUGINS_TO_BUNDLE:
-            continue
+    for plugin in PluginsIndex(data).with_titles(PLUGINS_TO_BUNDLE):
+        logger.info('Creating mapping for {}'.format(plugin.data))
         plugin_yaml = find_plugin_yaml_in_workspace(
                 plugin_yaml_name,
-                plugin['link'],
-                plugin['version'],
-                plugin['name'],
+                plugin.link,
+                plugin.version,
+                plugin.name,
                 workspace)
-        for wagon in plugin['wagons']:
-            if wagon['name'] in DISTROS_TO_BUNDLE:
+        for name, wagon in plugin.wagons.items():
+            if name in DISTROS_TO_BUNDLE:
                 wagon['url'] = find_wagon_in_workspace(
-                    plugin['name'],
-                    plugin['version'],
-                    DISTROS.get(wagon['name']),
+                    plugin.name,
+                    plugin.version,
+                    DISTROS.get(name),
                     workspace
                 ) or wagon['url']
                 mapping[wagon['url']] = plugin_yaml
@@ -130,7 +139,16 @@ def package_archive(mappings,
                     archive_name=None,
                     directory=None,
                     workspace=None,
-                    plugins_yaml_version=None):
+                    plugins_yaml_version=None,
+                    **compression):
+    """
+    Build a plugins bundle, adding every wagon to the archive as soon as
+    it is fetched.
+    :param compression: compression, level and threads, see
+        archives.StreamingTarWriter.
+    :return: The archive path.
+    """
+
     archive_name = archive_name or PLUGINS_BUNDLE_NAME
     if plugins_yaml_version and plugins_yaml_version != 'v1':
         archive_name += '-{}'.format(plugins_yaml_version)
@@ -141,61 +159,128 @@ def package_archive(mappings,
                     mappings))
 
     tempdir = mkdtemp()
-    create_metadata_file(mappings, tempdir, workspace)
-    tar_path = os.path.join(directory, archive_name + '.tgz')
-    tar_path = pathlib.Path(tar_path).as_posix()
-    tarfile_ = tarfile.open(tar_path, 'w:gz')
+    tar_path = pathlib.Path(get_archive_path(
+        directory, archive_name, compression.get('compression'))).as_posix()
     try:
-        tarfile_.add(tempdir, arcname=archive_name)
+        with BundleArchive(tar_path,
+                           archive_name,
+                           json.dumps,
+                           **compression) as archive:
+            for wagon_path, yaml_path in fetch_wagons_and_yamls(
+                    mappings, tempdir, workspace):
+                logger.info('Inserting '
+                            'metadata[{wagon_path}] = {yaml_path}'.format(
+                                wagon_path=wagon_path, yaml_path=yaml_path))
+                archive.add_plugin(tempdir, wagon_path, yaml_path)
     finally:
-        tarfile_.close()
         shutil.rmtree(tempdir, ignore_errors=True)
     return tar_path
 
 
-def create_metadata_file(mappings, tempdir, workspace=None):
+def fetch_wagons_and_yamls(mappings,
+                           tempdir,
+                           workspace=None,
+                           workers=FETCH_WORKERS):
+    """
+    Fetch the wagons and plugin YAMLs of the mappings concurrently.
+    Every URL is fetched once, even if a YAML is shared by several wagons.
+    :param mappings: A dict of wagon URLs to plugin YAML URLs.
+    :param tempdir: The bundle directory.
+    :param workspace: A directory with locally built wagons and YAMLs.
+    :param workers: How many files to fetch at the same time.
+    :return: Yields (wagon_path, yaml_path), relative to tempdir, as soon
+        as both files of a wagon are in place.
+    """
+
+    s3_clients = local()
 
-    metadata = {}
+    def fetch(url, download_dir):
+        # Each worker thread downloads with its own boto3 resource,
+        # because boto3 resources are not thread safe.
+        s3_client = None
+        if not in_workspace(url, workspace):
+            if not getattr(s3_clients, 's3', None):
+                s3_clients.s3 = s3.get_client()
+            s3_client = s3_clients.s3
+        return get_file_from_s3_or_workspace(
+            url, download_dir, tempdir, workspace, config, s3_client)
 
-    for wagon_path, yaml_path in mappings.items():
-        if not wagon_path or not yaml_path:
-            logger.error('Unable to download {} {}'.format(wagon_path, yaml_path))
+    pairs = []
+    for wagon_url, yaml_url in mappings.items():
+        if not wagon_url or not yaml_url:
+            logger.error('Unable to download {} {}'.format(
+                wagon_url, yaml_url))
             continue
-        wagon_path, yaml_path = download_or_find_wagon_and_yaml(
-            wagon_path, yaml_path, tempdir, workspace)
-        logger.info('Inserting '
-                     'metadata[{wagon_path}] = {yaml_path}'.format(
-                         wagon_path=wagon_path, yaml_path=yaml_path))
-        metadata[wagon_path] = yaml_path
-
-    with open(os.path.join(tempdir, 'METADATA'), 'w+') as f:
-        logger.info(
-            'create_plugin_bundle_archive writing metadata {m}'.format(
-                m=metadata))
-        json.dump(metadata, f)
-
-
-def download_or_find_wagon_and_yaml(wagon_url,
-                                    yaml_url,
-                                    tempdir,
-                                    workspace=None):
-
-    logger.info('Downloading {} and {}'.format(wagon_url, yaml_url))
-    plugin_root_dir = os.path.basename(wagon_url).rsplit('.', 1)[0]
-    plugin_root_dir = pathlib.Path(plugin_root_dir).as_posix()
+        pairs.append((wagon_url, yaml_url))
+    urls = list(dict.fromkeys(url for pair in pairs for url in pair))
+    config = TransferConfig(use_threads=True,
+                            max_concurrency=S3_DOWNLOAD_CONCURRENCY)
+
+    # Each URL gets its own download directory, so files with the same
+    # name from different URLs don't collide.
+    download_dirs = []
+    for n in range(len(urls)):
+        download_dirs.append(pathlib.Path(DOWNLOADS_DIR, str(n)).as_posix())
+        os.makedirs(os.path.join(tempdir, download_dirs[-1]))
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {
+            executor.submit(fetch, url, download_dir): url
+            for url, download_dir in zip(urls, download_dirs)}
+        downloaded = {}
+        try:
+            for future in as_completed(futures):
+                downloaded[futures[future]] = future.result()
+                for pair in [p for p in pairs
+                             if all(url in downloaded for url in p)]:
+                    pairs.remove(pair)
+                    yield place_wagon_and_yaml(
+                        downloaded[pair[0]], downloaded[pair[1]], tempdir)
+        finally:
+            for future in futures:
+                future.cancel()
+    shutil.rmtree(os.path.join(tempdir, DOWNLOADS_DIR), ignore_errors=True)
 
+
+def place_wagon_and_yaml(wagon_download, yaml_download, tempdir):
+    """
+    Move a downloaded wagon into its plugin directory, next to a copy of
+    its plugin YAML.
+    :return: (wagon_path, yaml_path), relative to tempdir.
+    """
+
+    plugin_root_dir = os.path.basename(wagon_download).rsplit('.', 1)[0]
+    plugin_root_dir = pathlib.Path(plugin_root_dir).as_posix()
     try:
         os.mkdir(os.path.join(tempdir, plugin_root_dir))
     except FileExistsError:
         pass
-    downloaded_wagon_path = get_file_from_s3_or_workspace(
-        wagon_url, plugin_root_dir, tempdir, workspace)
-    downloaded_yaml_path = get_file_from_s3_or_workspace(
-        yaml_url, plugin_root_dir, tempdir, workspace)
-    return downloaded_wagon_path, downloaded_yaml_path
+    wagon_path = pathlib.Path(
+        plugin_root_dir, os.path.basename(wagon_download)).as_posix()
+    yaml_path = pathlib.Path(
+        plugin_root_dir, os.path.basename(yaml_download)).as_posix()
+    shutil.move(os.path.join(tempdir, wagon_download),
+                os.path.join(tempdir, wagon_path))
+    shutil.copyfile(os.path.join(tempdir, yaml_download),
+                    os.path.join(tempdir, yaml_path))
+    return wagon_path, yaml_path
+
+
+def in_workspace(url, workspace):
+    """
+    :return: True if the file of the url is a locally built one.
+    """
+
+    return os.path.exists(url) and \
+        os.path.basename(urlparse(url).path[1:]) in os.listdir(workspace)
 
 
-def get_file_from_s3_or_workspace(url, plugin_root_dir, tempdir, workspace):
+def get_file_from_s3_or_workspace(url,
+                                  plugin_root_dir,
+                                  tempdir,
+                                  workspace,
+                                  config=None,
+                                  s3_client=None):
     parsed = urlparse(url)
     filename = os.path.basename(parsed.path[1:])
     destination_path = os.path.join(
@@ -203,15 +288,16 @@ def get_file_from_s3_or_workspace(url, plugin_root_dir, tempdir, workspace):
         plugin_root_dir,
         filename)
     destination_path = pathlib.Path(destination_path).as_posix()
-    if os.path.exists(url) and \
-            os.path.basename(parsed.path[1:]) in os.listdir(workspace):
+    if in_workspace(url, workspace):
         shutil.copyfile(
             os.path.join(workspace, filename),
             destination_path)
     else:
         s3.download_from_s3(
             destination_path,
-            parsed.path[1:])
+            parsed.path[1:],
+            config=config,
+            s3=s3_client)
     if not os.path.exists(destination_path):
         raise RuntimeError(
             'Unable to find file in s3 or in workspace: {} {} {}'.format(
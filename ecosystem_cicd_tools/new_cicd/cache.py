@@ -0,0 +1,331 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import requests
+from threading import Lock
+from tempfile import NamedTemporaryFile
+
+from .logging import logger
+
+CACHE_DIR = os.environ.get(
+    'ARTIFACT_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'cloudify-ecosystem'))
+# Set ARTIFACT_CACHE_MAX_BYTES to 0 to disable the cache.
+CACHE_MAX_BYTES = int(
+    os.environ.get('ARTIFACT_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+CHUNK_SIZE = 1024 * 1024
+MD5_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# The server side encryptions that keep a single part upload's ETag the
+# MD5 of the object. SSE-KMS and SSE-C ETags are not.
+MD5_ETAG_ENCRYPTIONS = (None, 'AES256')
+
+_cache = None
+_cache_lock = Lock()
+
+
+def source_key(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+class ArtifactCache(object):
+    """A content addressed store of downloaded artifacts.
+
+    Files are stored once under blobs/<md5>. Every URL or S3 key has a ref
+    under refs/ with the blob's MD5 and the ETag and Last-Modified that the
+    server returned, which are used to revalidate the ref before reuse.
+    Blobs are evicted least recently used first once the cache is larger
+    than max_bytes. All writes go to a temporary file and are renamed into
+    place, so concurrent downloads never see partial files.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or CACHE_DIR
+        self.max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.blobs_dir = os.path.join(self.directory, 'blobs')
+        self.refs_dir = os.path.join(self.directory, 'refs')
+        self.tmp_dir = os.path.join(self.directory, 'tmp')
+        self._evict_lock = Lock()
+        for directory in (self.blobs_dir, self.refs_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def _blob_path(self, md5):
+        return os.path.join(self.blobs_dir, md5)
+
+    def _ref_path(self, source):
+        return os.path.join(self.refs_dir, source_key(source) + '.json')
+
+    def _temporary_file(self):
+        return NamedTemporaryFile(dir=self.tmp_dir, delete=False)
+
+    def lookup(self, source):
+        """
+        :param source: A URL or s3://bucket/key.
+        :return: The ref of a cached source, or None.
+        """
+
+        try:
+            with open(self._ref_path(source), 'r') as f:
+                ref = json.load(f)
+        except (IOError, ValueError):
+            return
+        if ref.get('source') != source or \
+                not os.path.isfile(self._blob_path(ref['md5'])):
+            return
+        return ref
+
+    def has_blob(self, md5):
+        return os.path.isfile(self._blob_path(md5))
+
+    def copy_to(self, md5, destination):
+        """
+        Copy a blob to destination and mark it as recently used.
+        :return: destination, or None if the blob was evicted meanwhile.
+        """
+
+        blob_path = self._blob_path(md5)
+        try:
+            shutil.copyfile(blob_path, destination)
+        except FileNotFoundError:
+            if os.path.isfile(blob_path):
+                raise
+            return
+        try:
+            os.utime(blob_path)
+        except FileNotFoundError:
+            pass
+        return destination
+
+    def _copy_new_blob(self, md5, destination):
+        # Evict only after the copy, a blob may be bigger than max_bytes.
+        self.copy_to(md5, destination)
+        self.evict()
+        return destination
+
+    def add_ref(self, source, md5, **headers):
+        ref = dict(source=source, md5=md5, **headers)
+        with self._temporary_file() as f:
+            f.write(json.dumps(ref).encode('utf-8'))
+        os.replace(f.name, self._ref_path(source))
+        return ref
+
+    def add_blob(self, path, md5=None):
+        """
+        Move a downloaded file into the cache.
+        :param path: A file in the cache's tmp directory.
+        :param md5: The file's MD5, if it was hashed while downloading.
+        :return: The MD5.
+        """
+
+        if not md5:
+            md5 = file_md5(path)
+        os.replace(path, self._blob_path(md5))
+        return md5
+
+    def write_blob(self, chunks):
+        """
+        Store an iterable of bytes, hashing it on the way.
+        :return: The MD5.
+        """
+
+        md5 = hashlib.md5()
+        try:
+            with self._temporary_file() as f:
+                for chunk in chunks:
+                    if chunk:
+                        md5.update(chunk)
+                        f.write(chunk)
+        except BaseException:
+            os.remove(f.name)
+            raise
+        return self.add_blob(f.name, md5.hexdigest())
+
+    def size(self):
+        return sum(os.path.getsize(os.path.join(self.blobs_dir, n))
+                   for n in os.listdir(self.blobs_dir))
+
+    def evict(self):
+        """Remove the least recently used blobs until under max_bytes."""
+        with self._evict_lock:
+            blobs = []
+            for name in os.listdir(self.blobs_dir):
+                try:
+                    stat = os.stat(os.path.join(self.blobs_dir, name))
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in blobs)
+            for _, size, name in sorted(blobs):
+                if total <= self.max_bytes:
+                    break
+                logger.debug('Evicting {} from the artifact cache.'.format(
+                    name))
+                try:
+                    os.remove(os.path.join(self.blobs_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def fetch_url(self, url, destination, chunk_size=CHUNK_SIZE, **kwargs):
+        """
+        Download a URL, unless the cached copy is still current.
+        :param url: The URL.
+        :param destination: The local path to write to.
+        :param chunk_size: The download chunk size.
+        :param kwargs: Additional requests.get arguments.
+        :return: destination.
+        """
+
+        ref = self.lookup(url)
+        extra_headers = kwargs.pop('headers', {})
+        headers = dict(extra_headers)
+        if ref and ref.get('etag'):
+            headers['If-None-Match'] = ref['etag']
+        if ref and ref.get('last_modified'):
+            headers['If-Modified-Since'] = ref['last_modified']
+        try:
+            response = requests.get(
+                url, stream=True, headers=headers, **kwargs)
+        except requests.exceptions.ConnectionError:
+            if not ref:
+                raise
+            logger.warning('Unable to revalidate {}, using the cached '
+                           'copy.'.format(url))
+            if not self.copy_to(ref['md5'], destination):
+                raise
+            return destination
+        with response:
+            if response.url != url:
+                logger.debug('Redirected to {0}'.format(response.url))
+            if ref and response.status_code == 304:
+                if self.copy_to(ref['md5'], destination):
+                    logger.debug('Using cached {}.'.format(url))
+                    return destination
+                logger.debug('{} was evicted, downloading it again.'.format(
+                    url))
+                return self.fetch_url(url,
+                                      destination,
+                                      chunk_size,
+                                      headers=extra_headers,
+                                      **kwargs)
+            if not response.ok:
+                # Don't cache error pages.
+                write_chunks(response.iter_content(chunk_size), destination)
+                return destination
+            md5 = self.write_blob(response.iter_content(chunk_size))
+            self.add_ref(url,
+                         md5,
+                         etag=response.headers.get('ETag'),
+                         last_modified=response.headers.get('Last-Modified'))
+        return self._copy_new_blob(md5, destination)
+
+    def fetch_s3(self, s3_object, destination, **kwargs):
+        """
+        Download an S3 object, unless a blob with the same ETag is cached.
+        Raises ClientError if the object doesn't exist.
+        :param s3_object: A boto3 s3.Object.
+        :param destination: The local path to write to.
+        :param kwargs: Additional s3_object.download_file arguments.
+        :return: destination.
+        """
+
+        source = 's3://{}/{}'.format(s3_object.bucket_name, s3_object.key)
+        etag = s3_object.e_tag
+        ref = self.lookup(source)
+        if ref and ref.get('etag') == etag and \
+                self.copy_to(ref['md5'], destination):
+            logger.debug('Using cached {}.'.format(source))
+            return destination
+        # An identical file from another source can be reused as well.
+        md5 = get_etag_md5(s3_object)
+        if not md5 or not self.has_blob(md5):
+            with self._temporary_file() as f:
+                pass
+            try:
+                s3_object.download_file(f.name, **kwargs)
+            except BaseException:
+                os.remove(f.name)
+                raise
+            md5 = self.add_blob(f.name)
+        self.add_ref(source, md5, etag=etag)
+        return self._copy_new_blob(md5, destination)
+
+
+def get_etag_md5(s3_object):
+    """
+    :param s3_object: A boto3 s3.Object.
+    :return: The object's MD5 if its ETag is one, or None. That is true
+        for single part uploads, unless they are encrypted with SSE-KMS
+        or SSE-C.
+    """
+
+    etag = s3_object.e_tag.strip('"')
+    if not MD5_PATTERN.match(etag) or \
+            s3_object.sse_customer_algorithm or \
+            s3_object.server_side_encryption not in MD5_ETAG_ENCRYPTIONS:
+        return
+    return etag
+
+
+def file_md5(path, chunk_size=CHUNK_SIZE):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def write_chunks(chunks, destination):
+    with open(destination, 'wb') as f:
+        for chunk in chunks:
+            if chunk:
+                f.write(chunk)
+
+
+def get_cache():
+    """
+    :return: The shared ArtifactCache, or None if the cache is disabled.
+    """
+
+    global _cache
+    if not CACHE_MAX_BYTES:
+        return
+    with _cache_lock:
+        if not _cache:
+            _cache = ArtifactCache()
+    return _cache
+
+
+def fetch_url(url, destination, chunk_size=CHUNK_SIZE, **kwargs):
+    """Download a URL through the artifact cache."""
+    cache = get_cache()
+    if cache:
+        return cache.fetch_url(url, destination, chunk_size, **kwargs)
+    with requests.get(url, stream=True, **kwargs) as response:
+        write_chunks(response.iter_content(chunk_size), destination)
+    return destination
+
+
+def fetch_s3(s3_object, destination, **kwargs):
+    """Download an S3 object through the artifact cache."""
+    cache = get_cache()
+    if cache:
+        return cache.fetch_s3(s3_object, destination, **kwargs)
+    s3_object.download_file(destination, **kwargs)
+    return destination
@@ -1,21 +1,45 @@
 from os import environ
-from functools import wraps
-from pkg_resources import parse_version
+from threading import Lock
+from functools import wraps, lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
+import os
 import re
-import http
+import http.client
+import time
 import github
+import hashlib
 import urllib3
 import requests
 
 from .logging import logger
 
+# How many release assets are uploaded at the same time, and how often a
+# dropped upload is retried.
+ASSET_UPLOAD_WORKERS = int(environ.get('GITHUB_ASSET_UPLOAD_WORKERS', 4))
+ASSET_UPLOAD_RETRIES = int(environ.get('GITHUB_ASSET_UPLOAD_RETRIES', 5))
+ASSET_RETRY_DELAY = 2
+RETRIABLE_ERRORS = (http.client.RemoteDisconnected,
+                    urllib3.exceptions.ProtocolError,
+                    requests.exceptions.ConnectionError)
+GITHUB_API_URL = environ.get('GITHUB_API_URL', 'https://api.github.com')
+# Opt in to stop reading releases, listed newest first, this many releases
+# past the highest version. This assumes that only backports follow the
+# highest version. By default, 0, all releases are read.
+RELEASE_SCAN_PATIENCE = int(environ.get('GITHUB_RELEASE_SCAN_PATIENCE', 0))
+RELEASES_PER_PAGE = 100
+VERSION_PATTERN = re.compile(r'^(?:v)?(\d+\.\d+\.\d+(?:\.\d+)?)$')
+
+_release_indexes = {}
+_release_indexes_lock = Lock()
+
 
 def with_github_client(func):
     @wraps(func)
     def wrapper_func(*args, **kwargs):
 
-        kwargs['github_client'] = get_client(kwargs)
+        kwargs['github_client'] = \
+            kwargs.get('github_client') or get_client(kwargs)
         if 'repository' not in kwargs or not kwargs['repository']:
             kwargs['repository_name'] = get_repository_name(kwargs)
             kwargs['organization_name'] = get_organization_name(kwargs)
@@ -32,6 +56,10 @@ def with_github_client(func):
 
 def get_client(kwargs):
     logger.info('Setting up Github client.')
+    return github.Github(get_token(kwargs), per_page=RELEASES_PER_PAGE)
+
+
+def get_token(kwargs):
     if 'github_token' in kwargs:
         github_token = kwargs['github_token']
     elif 'RELEASE_BUILD_TOKEN' in environ:
@@ -43,7 +71,7 @@ def get_client(kwargs):
             'No token provided. '
             f'We have these kwargs {kwargs} '
             f'and environ: {environ}')
-    return github.Github(github_token.strip())
+    return github_token.strip()
 
 
 def get_repository_name(kwargs):
@@ -96,46 +124,295 @@ def get_latest_release(repository):
     return get_release('latest', repository)
 
 
+def list_recent_releases(organization_name,
+                         repository_name,
+                         etag=None,
+                         session=None):
+    """
+    Request the first page of a repository's releases, newest first. A
+    request with the ETag of an unchanged page is answered with 304 Not
+    Modified, which doesn't count against the rate limit.
+    :param organization_name: The Github organization.
+    :param repository_name: The repository.
+    :param etag: The ETag of the last response, if any.
+    :param session: A requests session with the Github token.
+    :return: The new ETag and the release titles, or None if the page
+        didn't change.
+    """
+
+    session = session or requests.Session()
+    headers = {'Accept': 'application/vnd.github+json'}
+    if etag:
+        headers['If-None-Match'] = etag
+    response = session.get(
+        '{}/repos/{}/{}/releases'.format(
+            GITHUB_API_URL, organization_name, repository_name),
+        headers=headers,
+        params={'per_page': 100})
+    if response.status_code == 304:
+        return etag, None
+    response.raise_for_status()
+    return response.headers.get('ETag'), \
+        [release['name'] for release in response.json()]
+
+
+def get_session(kwargs):
+    """
+    :return: A requests session authorized with the Github token.
+    """
+
+    session = requests.Session()
+    session.headers['Authorization'] = 'token {}'.format(get_token(kwargs))
+    return session
+
+
+@lru_cache(maxsize=None)
+def version_key(text):
+    """
+    :param text: A release title, such as '1.2.3' or 'v1.2.3.4'.
+    :return: A tuple of ints that orders versions, or None if the text is
+        not a version.
+    """
+
+    match = VERSION_PATTERN.match(text or '')
+    if match:
+        return tuple(int(part) for part in match.group(1).split('.'))
+
+
+class ReleaseIndex(object):
+    """The releases of a repository by title, read lazily.
+
+    Looking for a title stops as soon as it is found. Looking for the
+    highest version reads every release, since Github orders releases by
+    creation date and not by version, and its latest release is the most
+    recently created one. With a `patience`, it stops once that many
+    releases in a row are lower than the highest one so far, which is
+    exact only if just backports of older lines follow the highest one.
+    """
+
+    def __init__(self, repository, patience=None):
+        """
+        :param repository: The Github repository.
+        :param patience: How many lower releases to read past the highest
+            version, by default RELEASE_SCAN_PATIENCE. 0 reads all of them.
+        """
+
+        self.repository = repository
+        self.patience = RELEASE_SCAN_PATIENCE if patience is None \
+            else patience
+        self.releases = {}
+        self.listed = []
+        self.highest = None
+        self.complete = False
+        self._since_highest = 0
+        self._listing = None
+        self._lock = Lock()
+
+    def _read(self):
+        """
+        Read one more release.
+        :return: False if there are no more releases.
+        """
+
+        if self.complete:
+            return False
+        if self._listing is None:
+            self._listing = iter(self.repository.get_releases())
+        try:
+            release = next(self._listing)
+        except StopIteration:
+            self.complete = True
+            return False
+        title = str(release.title) if release.title else None
+        self.releases.setdefault(title, release)
+        self.listed.append(release)
+        key = version_key(title)
+        if key and (not self.highest or key > version_key(self.highest)):
+            self.highest = title
+            self._since_highest = 0
+        elif self.highest:
+            self._since_highest += 1
+        return True
+
+    def _exhausted(self):
+        return self.complete or bool(
+            self.highest and self.patience and
+            self._since_highest >= self.patience)
+
+    def most_recent(self):
+        """
+        :return: The title of the highest version, or 'latest' if only a
+            latest release exists, or None.
+        """
+
+        with self._lock:
+            while not self._exhausted():
+                self._read()
+            if self.highest:
+                return self.highest
+            if 'latest' in self.releases:
+                return 'latest'
+
+    def get(self, title):
+        """
+        :return: The release with the title, or None.
+        """
+
+        with self._lock:
+            while title not in self.releases:
+                if not self._read():
+                    return
+            return self.releases[title]
+
+    def get_all(self, title):
+        """
+        :return: Every release with the title, in listing order.
+        """
+
+        with self._lock:
+            while self._read():
+                pass
+            return [release for release in self.listed
+                    if release.title == title]
+
+
+def get_release_index(repository):
+    """
+    :return: The ReleaseIndex of the repository, shared in this process.
+    """
+
+    with _release_indexes_lock:
+        if repository.full_name not in _release_indexes:
+            _release_indexes[repository.full_name] = \
+                ReleaseIndex(repository)
+        return _release_indexes[repository.full_name]
+
+
+def forget_release_index(repository):
+    with _release_indexes_lock:
+        _release_indexes.pop(repository.full_name, None)
+
+
 def get_most_recent_release(repository=None, **_):
     logger.info('Attempting to get most recent release from repo {repo}.'
                 .format(repo=repository.name))
-    releases = sorted(
-        [str(r.title) for r in repository.get_releases() if r.title and
-         check_version_valid(r.title)],
-        key=parse_version,
-    )
-    if releases:
-        return releases.pop()
+    return get_release_index(repository).most_recent()
 
 
 def check_version_valid(text):
     logger.info('Looking for version in {text}.'.format(text=text))
-    version = re.findall(r'^(?:v)?(\d+\.\d+\.\d+(?:\.\d+)?)$', text)
-    if text == 'latest' or len(version) == 1:
+    if text == 'latest' or version_key(text):
         return True
     return False
 
 
+class ReleaseAssetSync(object):
+    """Bring the assets of a release in line with local files.
+
+    The release assets are listed once. Assets whose size and SHA256
+    digest already match the local file are skipped. The rest are deleted
+    if they exist and uploaded again, up to `workers` at a time, retrying
+    dropped connections with exponential backoff.
+    """
+
+    def __init__(self, release, workers=None, retries=None, delay=None):
+        self.release = release
+        self.workers = workers or ASSET_UPLOAD_WORKERS
+        self.retries = ASSET_UPLOAD_RETRIES if retries is None else retries
+        self.delay = ASSET_RETRY_DELAY if delay is None else delay
+        self.existing = list(release.get_assets())
+
+    def find(self, asset_path, asset_label):
+        name = os.path.basename(asset_path)
+        for asset in self.existing:
+            if asset.label == asset_label or asset.name == name:
+                return asset
+
+    @staticmethod
+    def matches(asset, asset_path):
+        if asset.state != 'uploaded' or \
+                asset.size != os.path.getsize(asset_path):
+            return False
+        # Older PyGithub releases don't have the digest, so upload again.
+        digest = getattr(asset, 'digest', None)
+        if not digest:
+            return False
+        return digest == 'sha256:{}'.format(file_sha256(asset_path))
+
+    def plan(self, assets):
+        """
+        :param assets: A dict of asset labels to local paths.
+        :return: A list of (label, path, existing asset or None) to upload.
+        """
+
+        uploads = []
+        for asset_label, asset_path in assets.items():
+            asset = self.find(asset_path, asset_label)
+            if asset and self.matches(asset, asset_path):
+                logger.info('Asset {} is up to date in {}.'.format(
+                    asset_label, self.release))
+                continue
+            uploads.append((asset_label, asset_path, asset))
+        return uploads
+
+    def _delete_partial_upload(self, asset_path):
+        # A dropped upload can leave an asset that blocks its name.
+        name = os.path.basename(asset_path)
+        for asset in self.release.get_assets():
+            if asset.name == name:
+                asset.delete_asset()
+
+    def upload(self, asset_label, asset_path, existing=None):
+        logger.info('Uploading {} {} to {}.'.format(
+            asset_path, asset_label, self.release))
+        if existing:
+            existing.delete_asset()
+        for attempt in range(self.retries + 1):
+            try:
+                return self.release.upload_asset(asset_path, asset_label)
+            except RETRIABLE_ERRORS as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning('Upload of {} failed: {}, retrying.'.format(
+                    asset_path, e))
+                time.sleep(self.delay * 2 ** attempt)
+                self._delete_partial_upload(asset_path)
+            except github.GithubException as e:
+                if e.status != 422:
+                    logger.error('Failed to upload new asset: '
+                                 '{path}:{label} to release {name}.'.format(
+                                     path=asset_path,
+                                     label=asset_label,
+                                     name=self.release))
+                    raise
+                return
+
+    def sync(self, assets):
+        """
+        :param assets: A dict of asset labels to local paths.
+        """
+
+        uploads = self.plan(assets)
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            futures = [executor.submit(self.upload, *u) for u in uploads]
+            for future in futures:
+                future.result()
+
+
+def sync_release_assets(release, assets, **kwargs):
+    ReleaseAssetSync(release, **kwargs).sync(assets)
+
+
 def upload_asset(release, asset_path, asset_label):
-    logger.info('Uploading {} {} to {}.'.format(
-        asset_path, asset_label, release
-    ))
-    existing_assets = release.get_assets()
-    for asset in existing_assets:
-        if asset.label == asset_label:
-            asset.delete_asset()
-            break
-    logger.info('Starting upload...')
-    try:
-        release.upload_asset(asset_path, asset_label)
-    except (http.client.RemoteDisconnected, urllib3.exceptions.ProtocolError, requests.exceptions.ConnectionError):
-        upload_asset(release, asset_path, asset_label)
-    except github.GithubException as e:
-        if e.status != 422:
-            logger.error('Failed to upload new asset: '
-                         '{path}:{label} to release {name}.'.format(
-                path=asset_path, label=asset_label, name=release))
-            raise
+    sync_release_assets(release, {asset_label: asset_path})
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
 
 
 @with_github_client
@@ -150,6 +427,7 @@ def create_release(name,
         commit = commit.commit
     logger.info('Create release params {}, {}, {}, {}'.format(
         version, name, message, commit))
+    forget_release_index(repository)
     try:
         return repository.create_git_release(
             tag=version, name=name, message=message, target_commitish=commit)
@@ -203,15 +481,16 @@ def get_list_of_commits_from_branch(name_branch, repository=None, **_):
 
 @with_github_client
 def delete_release(release_name, repository=None, **_):
-    for resp in repository.get_releases():
-        if resp.title == release_name:
-            obj = repository.get_release(resp.id)
-            obj.delete_release()
-            try:
-                ref = repository.get_git_ref(f"tags/{resp.tag_name}")
-                ref.delete()
-            except github.GithubException.UnknownObjectException:
-                pass
+    releases = get_release_index(repository).get_all(release_name)
+    forget_release_index(repository)
+    for resp in releases:
+        obj = repository.get_release(resp.id)
+        obj.delete_release()
+        try:
+            ref = repository.get_git_ref(f"tags/{resp.tag_name}")
+            ref.delete()
+        except github.GithubException.UnknownObjectException:
+            pass
 
 
 @with_github_client
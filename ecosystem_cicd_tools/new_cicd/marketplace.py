@@ -13,16 +13,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
+import os
+import time
+from copy import deepcopy
+from threading import Lock
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import requests
-import urllib.request
+from requests.adapters import HTTPAdapter
 from packaging.version import parse as version_parse
 
 from .logging import logger
 from ..utils import get_json
 
 URL_MARKETPLACE = "https://marketplace.cloudify.co"
+# How long, in seconds, a marketplace response is used without
+# revalidating it, and how many connections are kept alive.
+CACHE_TTL = int(os.environ.get('MARKETPLACE_CACHE_TTL', 60))
+POOL_SIZE = int(os.environ.get('MARKETPLACE_POOL_SIZE', 10))
 
 URL = 'https://9t51ojrwrb.execute-api.eu-west-1.amazonaws.com/prod/' \
       'scrape-plugins-git-webhook'
@@ -45,21 +53,132 @@ def call_plugins_webhook(plugin_name, plugin_version, github_user):
             '{}'.format(result.text))
 
 
-def get_plugin_id(plugin_name):
+class MarketplaceClient(object):
+    """A keep-alive session to the marketplace with a response cache.
+
+    GET responses are reused for `ttl` seconds, and then revalidated with
+    their ETag. Callers that poll for changes ask for fresh responses,
+    which are always revalidated. Concurrent requests for the same URL
+    share one request. List responses are followed page by page when the
+    marketplace reports more items than it returned.
+    """
+
+    def __init__(self, base_url=None, ttl=None, pool_size=None):
+        self.base_url = base_url or URL_MARKETPLACE
+        self.ttl = CACHE_TTL if ttl is None else ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=pool_size or POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._cache = {}
+        self._inflight = {}
+        self._lock = Lock()
+
+    def url(self, path, params=None):
+        return requests.Request(
+            'GET', self.base_url + path, params=params).prepare().url
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _fetch(self, url, cached):
+        headers = {}
+        if cached and cached[1]:
+            headers['If-None-Match'] = cached[1]
+        response = self.session.get(url, headers=headers)
+        if cached and response.status_code == 304:
+            body = cached[2]
+        elif not response.ok:
+            logger.error('Marketplace request {} failed: {}'.format(
+                url, response.status_code))
+            return {}
+        else:
+            body = response.json()
+        with self._lock:
+            self._cache[url] = (time.monotonic(),
+                                response.headers.get('ETag'),
+                                body)
+        return body
+
+    def get_json(self, url, fresh=False):
+        """
+        :param url: The full URL.
+        :param fresh: Revalidate a cached response even within the ttl.
+        :return: The JSON response, or {} if the request failed.
+        """
+
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached and not fresh and \
+                    time.monotonic() - cached[0] < self.ttl:
+                return deepcopy(cached[2])
+            future = self._inflight.get(url)
+            owner = future is None
+            if owner:
+                future = self._inflight[url] = Future()
+        if not owner:
+            return deepcopy(future.result())
+        try:
+            body = self._fetch(url, cached)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(body)
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+        return deepcopy(body)
+
+    def get(self, path, fresh=False, **params):
+        """
+        :param path: The path, such as /plugins.
+        :param fresh: Revalidate cached responses even within the ttl.
+        :param params: The query parameters.
+        :return: The JSON response, with the items of every page.
+        """
+
+        result = self.get_json(self.url(path, params), fresh)
+        if 'items' not in result:
+            return result
+        items = result['items']
+        pagination = result.get('metadata', {}).get('pagination') or \
+            result.get('pagination') or {}
+        while len(items) < pagination.get('total', 0):
+            page = self.get_json(self.url(
+                path, dict(params, _offset=len(items))), fresh)
+            if not page.get('items'):
+                break
+            items.extend(page['items'])
+        return result
+
+
+_client = None
+_client_lock = Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if not _client:
+            _client = MarketplaceClient()
+    return _client
+
+
+def get_plugin_id(plugin_name, fresh=False):
     logger.info('Getting plugin ID for name: {}'.format(plugin_name))
-    url_plugin_id = 'https://marketplace.cloudify.co/plugins?name={}'.format(
-        plugin_name)
-    json_resp = get_json(url_plugin_id)
+    json_resp = get_client().get('/plugins', fresh, name=plugin_name)
     logger.info('Got plugin ID response: {}'.format(json_resp))
     if 'items' in json_resp:
         if len(json_resp['items']) == 1:
             return json_resp['items'][0]['id']
 
+
 def get_plugin_versions(plugin_id):
     logger.info('Getting plugin versions for ID: {}'.format(plugin_id))
-    url_plugin_version = 'https://marketplace.cloudify.co/' \
-                         'plugins/{}/versions?'.format(plugin_id)
-    json_resp = get_json(url_plugin_version)
+    json_resp = get_client().get('/plugins/{}/versions'.format(plugin_id))
     logger.info('Got plugin version response: {}'.format(json_resp))
     if 'items' in json_resp:
         versions = [item['version'] for item in json_resp['items']]
@@ -70,10 +189,9 @@ def get_plugin_versions(plugin_id):
 def get_node_types_for_plugin_version(plugin_name, plugin_version):
     logger.info('Getting node types for {}:{}'.format(
         plugin_name, plugin_version))
-    url = 'https://marketplace.cloudify.co/node-types?' \
-          '&plugin_name={}' \
-          '&plugin_version={}'.format(plugin_name, plugin_version)
-    result = get_json(url)
+    result = get_client().get('/node-types',
+                              plugin_name=plugin_name,
+                              plugin_version=plugin_version)
     node_types = {}
     for item in result['items']:
         node_types[item['type']] = item
@@ -83,8 +201,8 @@ def get_node_types_for_plugin_version(plugin_name, plugin_version):
 def list_versions(plugin_id):
     logger.info('Getting plugin versions for {}'.format(
         plugin_id))
-    url = f'{URL_MARKETPLACE}/plugins/{plugin_id}/versions'
-    json_resp = get_json_from_marketplace(url, True)
+    json_resp = get_client().get('/plugins/{}/versions'.format(plugin_id))
+    logger.info('get_json_from_marketplace response {}.'.format(json_resp))
     if 'items' in json_resp:
         versions = [item['version'] for item in json_resp['items']]
         return sorted(versions, key=lambda x: version_parse(x))
@@ -93,30 +211,35 @@ def list_versions(plugin_id):
 
 def get_json_from_marketplace(url, log_response=False):
     logger.info('get_json_from_marketplace request {}.'.format(url))
-    try:
-        resp = urllib.request.urlopen(url)
-    except urllib.error.HTTPError:
-        return {}
-    body = resp.read()
+    result = get_client().get_json(url)
     if log_response:
-        logger.info('get_json_from_marketplace response {}.'.format(body))
-    result = json.loads(body)
+        logger.info('get_json_from_marketplace response {}.'.format(result))
     return result
 
 
-def get_plugin_release_spec_from_marketplace(plugin_id, plugin_version):
-    release_url = 'https://marketplace.cloudify.co/plugins/{}/{}'.format(
-        plugin_id, plugin_version)
-    return get_json_from_marketplace(release_url)
+def get_plugin_release_spec_from_marketplace(plugin_id,
+                                             plugin_version,
+                                             fresh=False):
+    return get_client().get(
+        '/plugins/{}/{}'.format(plugin_id, plugin_version), fresh)
+
 
+def get_assets(repository, version, fresh=False):
+    """
+    :param repository: The plugin's Github repository, or its name.
+    :param version: The plugin version.
+    :param fresh: Revalidate cached responses, for callers that wait for
+        the marketplace to change.
+    :return: The URLs of the version's wagons and plugin YAMLs.
+    """
 
-def get_assets(repository, version):
     logger.info('Getting Assets: {} {}'.format(repository, version))
     assets_list_marketplace = []
-    plugin_id = get_plugin_id(repository.name)
+    plugin_id = get_plugin_id(getattr(repository, 'name', repository), fresh)
     if not plugin_id:
         return assets_list_marketplace
-    items = get_plugin_release_spec_from_marketplace(plugin_id, version)
+    items = get_plugin_release_spec_from_marketplace(
+        plugin_id, version, fresh)
     logger.info('Got assets: {}'.format(items))
     if not items:
         return items
@@ -137,10 +260,11 @@ def get_node_types_diff(plugin_id, old, new):
     types that are not present in the old version.
     """
     node_types_diff = {}
-    old_node_types = get_node_types_for_plugin_version(
-        plugin_id, old)
-    new_node_types = get_node_types_for_plugin_version(
-        plugin_id, new)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        old_node_types, new_node_types = executor.map(
+            lambda version: get_node_types_for_plugin_version(
+                plugin_id, version),
+            [old, new])
     for key, value in new_node_types.items():
         if key not in old_node_types:
             node_types_diff[key] = value
@@ -150,11 +274,18 @@ def get_node_types_diff(plugin_id, old, new):
 def delete_plugin_version(plugin_id, plugin_version):
     url = 'https://marketplace.cloudify.co/plugins/{}/{}'.format(
         plugin_id, plugin_version)
-    return get_json(url=url, method='DELETE')
+    # Invalidate after the delete, a concurrent read may cache the old data.
+    try:
+        return get_json(url=url, method='DELETE')
+    finally:
+        get_client().invalidate()
 
 
 def delete_node_type(node_type_id):
     url = 'https://marketplace.cloudify.co/node-types/{}'.format(
         node_type_id)
-    return get_json(url=url, method='DELETE')
+    try:
+        return get_json(url=url, method='DELETE')
+    finally:
+        get_client().invalidate()
 
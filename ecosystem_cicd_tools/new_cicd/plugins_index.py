@@ -0,0 +1,259 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import json
+from copy import deepcopy
+from threading import Lock
+
+from . import s3
+from .logging import logger
+
+PLUGINS_JSON = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'resources',
+    'plugins.json')
+CENTOS = 'Centos Core'
+ARM64 = 'Centos AltArch'
+REDHAT = 'Redhat Maipo'
+REDHAT8 = 'Redhat Ootpa'
+# The distro names in plugins.json, by the distro in wagon file names.
+DISTROS = {
+    'centos-Core': CENTOS,
+    'centos-altarch': ARM64,
+    'redhat-Maipo': REDHAT,
+    'redhat-Ootpa': REDHAT8,
+}
+DISTRO_PATTERN = re.compile('|'.join(DISTROS))
+
+_parsed = {}
+_parsed_lock = Lock()
+
+
+def get_wagon_distro(url):
+    """
+    :param url: A wagon or wagon md5 URL or path.
+    :return: The plugins.json distro name of the wagon, or None.
+    """
+
+    filename = os.path.basename(url)
+    match = DISTRO_PATTERN.search(filename)
+    if not match:
+        return
+    # Centos aarch64 wagons used to be built as centos-Core.
+    if match.group() == 'centos-Core' and 'aarch64' in filename:
+        return ARM64
+    return DISTROS[match.group()]
+
+
+class PluginRecord(object):
+    """One plugin version in plugins.json.
+
+    The record wraps the plugins.json dict and edits it in place, so the
+    list that the index was created from is always up to date.
+    """
+
+    __slots__ = ('data', '_wagons', '_wagons_list')
+
+    def __init__(self, data):
+        self.data = data
+        self._wagons = None
+        self._wagons_list = None
+
+    @property
+    def name(self):
+        return self.data['name']
+
+    @property
+    def version(self):
+        return self.data['version']
+
+    @property
+    def title(self):
+        return self.data.get('title', '')
+
+    @property
+    def link(self):
+        return self.data.get('link')
+
+    @property
+    def wagons(self):
+        """
+        :return: A dict of distro names to wagon dicts.
+        """
+
+        wagons_list = self.data.get('wagons', [])
+        # Rebuild only if the wagons list was replaced.
+        if wagons_list is not self._wagons_list:
+            self._wagons = {w['name']: w for w in wagons_list}
+            self._wagons_list = wagons_list
+        return self._wagons
+
+    def wagon(self, distro):
+        return self.wagons.get(distro)
+
+    def update_assets(self, assets, wagons_list=None):
+        """
+        Replace the plugin YAML and wagons with new asset URLs. A wagon is
+        replaced only if both it and its md5 are in assets, and wagons of
+        other versions are dropped.
+        :param assets: A list of URLs of plugin YAMLs, wagons and md5s.
+        :param wagons_list: The wagons to update, by default the record's.
+        """
+
+        new_wagons = {}
+        for asset in assets:
+            if asset.endswith('.yaml'):
+                self.data['link'] = asset
+                continue
+            distro = get_wagon_distro(asset)
+            if distro:
+                key = 'md5url' if asset.endswith('md5') else 'url'
+                new_wagons.setdefault(distro, {})[key] = asset
+        if wagons_list is None:
+            wagons_list = self.data.get('wagons', [])
+        wagons = {w['name']: w for w in wagons_list}
+        for distro, wagon in new_wagons.items():
+            if self.version in wagon.get('url', '') and \
+                    self.version in wagon.get('md5url', ''):
+                wagons[distro] = dict(name=distro,
+                                      url=wagon['url'],
+                                      md5url=wagon['md5url'])
+        self.data['wagons'] = sorted(
+            (w for w in wagons.values() if self.version in w['url']),
+            key=lambda w: w['name'])
+
+
+class PluginsIndex(object):
+    """The plugins.json list, indexed by plugin name.
+
+    Records are looked up by name and version, and wagons by distro,
+    without scanning the list. The list is edited in place, so it can be
+    written back as is.
+
+        index = PluginsIndex(plugins_list)
+        wagon = index.wagon('cloudify-aws-plugin', '3.0.10', 'Centos Core')
+    """
+
+    def __init__(self, plugins):
+        """
+        :param plugins: The plugins.json list of dicts.
+        """
+
+        self.plugins = plugins
+        self._by_name = {}
+        for data in plugins:
+            self._index(PluginRecord(data))
+
+    def _index(self, record):
+        self._by_name.setdefault(record.name, []).append(record)
+        return record
+
+    def __iter__(self):
+        for data in self.plugins:
+            yield self.get_record(data)
+
+    def __len__(self):
+        return len(self.plugins)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def get_record(self, data):
+        for record in self._by_name.get(data['name'], []):
+            if record.data is data:
+                return record
+
+    def find(self, name):
+        """
+        :return: The records of every version of the plugin in the list.
+        """
+
+        return list(self._by_name.get(name, []))
+
+    def get(self, name, version=None):
+        """
+        :param name: The plugin name, such as 'cloudify-aws-plugin'.
+        :param version: The plugin version, by default the first one.
+        :return: The PluginRecord, or None.
+        """
+
+        for record in self._by_name.get(name, []):
+            if version is None or record.version == version:
+                return record
+
+    def wagon(self, name, version, distro):
+        """
+        :return: The wagon dict of the plugin version for distro, or None.
+        """
+
+        record = self.get(name, version)
+        if record:
+            return record.wagon(distro)
+
+    def with_titles(self, titles):
+        """
+        :param titles: Lowercase plugin titles, such as ['aws'].
+        :return: The records with these titles, in list order.
+        """
+
+        titles = set(titles)
+        return [r for r in self if r.title.lower() in titles]
+
+    def add(self, data):
+        """Append a plugin dict to the list."""
+        self.plugins.append(data)
+        return self._index(PluginRecord(data))
+
+    def to_list(self):
+        return self.plugins
+
+
+def load_plugins_json(path=None):
+    """
+    Parse a plugins.json file. The parsed list is cached until the file
+    changes, and every call gets its own copy.
+    :param path: The local path, by default resources/plugins.json.
+    :return: The plugins.json list.
+    """
+
+    path = os.path.abspath(path or PLUGINS_JSON)
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    with _parsed_lock:
+        cached = _parsed.get(path)
+    if cached and cached[0] == signature:
+        return deepcopy(cached[1])
+    logger.debug('Parsing {}.'.format(path))
+    with open(path, 'r') as f:
+        plugins = json.load(f)
+    with _parsed_lock:
+        _parsed[path] = (signature, plugins)
+    return deepcopy(plugins)
+
+
+def get_plugins_index(local_path=None, remote_path=None):
+    """
+    :param local_path: The plugins.json path, by default
+        resources/plugins.json.
+    :param remote_path: An s3 key to download to local_path first.
+    :return: A PluginsIndex.
+    """
+
+    if remote_path:
+        local_path = local_path or os.path.basename(remote_path)
+        s3.download_from_s3(local_path, remote_path)
+    return PluginsIndex(load_plugins_json(local_path))
@@ -1,16 +1,17 @@
 import os
-import hashlib
 import pathlib
-import requests
 from copy import deepcopy
 from urllib.parse import urlparse
 
 from .s3 import (
     URL_TEMPLATE,
+    get_object_md5,
     get_objects_in_key,
-    upload_plugin_asset_to_s3
+    get_plugin_asset_key,
+    upload_content_to_s3
 )
 
+from .cache import fetch_url
 from .logging import logging, logger
 
 clilogger = logging.getLogger('ecosystem-cli')
@@ -36,32 +37,34 @@ def get_file(url):
         urlparse(url).path.split('/').pop()
     )
     local_filename = pathlib.Path(local_filename).as_posix()
-    r = requests.get(url, stream=True)
-    with open(local_filename, 'wb') as f:
-        for chunk in r.iter_content(chunk_size=1024): 
-            if chunk: # filter out keep-alive new chunks
-                f.write(chunk)
+    fetch_url(url, local_filename)
     return local_filename
 
 
-def add_md5_file(obj, plugin_name, plugin_version):
-    logger.info('Adding this md5: {}'.format(obj))
-    md5_name = obj + '.md5'
-    filename = get_file(obj)
-    md5_filename = filename + '.md5'
-    md5_filename = pathlib.Path(md5_filename).as_posix()
-    result = hashlib.md5(open(filename, 'rb').read()).hexdigest()
-    with open(md5_filename, 'w') as inf:
-        inf.write(result)
-    upload_plugin_asset_to_s3(md5_filename, plugin_name, plugin_version)
+def add_md5_file(obj, plugin_name, plugin_version, s3=None):
+    """
+    Upload the .md5 file of a wagon in s3. Nothing is written to disk and
+    the wagon is only read if its ETag isn't its MD5.
+    :param obj: The wagon s3 key.
+    :param plugin_name: The plugin name, such as 'cloudify-foo-plugin'.
+    :param plugin_version: The plugin version, such as '1.0.0'.
+    :param s3: s3 client boto3
+    """
 
+    logger.info('Adding this md5: {}'.format(obj))
+    result = get_object_md5(obj, s3=s3)
+    upload_content_to_s3(
+        result,
+        get_plugin_asset_key(obj + '.md5', plugin_name, plugin_version),
+        s3=s3)
 
 
-def get_wagons_list(plugin_name, plugin_version):
+def get_wagons_list(plugin_name, plugin_version, s3=None):
     wagons_list = deepcopy(WAGONS_LIST_TEMPLATE)
     plugin_version_objects = get_objects_in_key(
         plugin_name,
-        plugin_version
+        plugin_version,
+        s3=s3
     )
     logger.info('We have these plugin objects: {}'.format(plugin_version_objects))
     total_objects = len(plugin_version_objects)
@@ -69,7 +72,10 @@ def get_wagons_list(plugin_name, plugin_version):
         if plugin_version_objects[i].endswith('.wgn'):
             md5_name = plugin_version_objects[i] + '.md5'
             if md5_name not in plugin_version_objects:
-                add_md5_file(plugin_version_objects[i], plugin_name, plugin_version)
+                add_md5_file(plugin_version_objects[i],
+                             plugin_name,
+                             plugin_version,
+                             s3=s3)
         if i + 2 >= total_objects:
             break
         if plugin_version not in plugin_version_objects[i] and \
@@ -0,0 +1,180 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+from copy import deepcopy
+from threading import Lock
+from tempfile import NamedTemporaryFile
+
+from pkg_resources import parse_version
+
+from . import s3
+from . import github
+from .cache import CACHE_DIR
+from .logging import logger
+from .plugins_index import get_wagon_distro
+
+# Release page ETags and the newest version on each page, kept between
+# runs so that unchanged repositories cost no rate limit.
+STATE_PATH = os.environ.get(
+    'PLUGINS_JSON_STATE',
+    os.path.join(CACHE_DIR, 'plugins_json_state.json'))
+# The plugin dict keys that are generated, the rest come from the template.
+GENERATED_KEYS = ('version', 'link', 'yaml', 'wagons')
+
+
+class ReleaseProbe(object):
+    """Find the newest version among a repository's recent releases.
+
+    Only the first page of releases is requested. A new release is always
+    on it, since releases are listed newest first. The page's ETag is
+    remembered, so a repository without new releases answers with 304.
+    """
+
+    def __init__(self, path=None, session=None):
+        """
+        :param path: The state file, by default STATE_PATH.
+        :param session: A requests session with the Github token.
+        """
+
+        self.path = path or STATE_PATH
+        self.session = session
+        self._lock = Lock()
+        try:
+            with open(self.path, 'r') as f:
+                self.state = json.load(f)
+        except (IOError, ValueError):
+            self.state = {}
+
+    def newest_version(self, organization_name, repository_name):
+        """
+        :return: The highest version on the first page of releases, or
+            None if there are no versioned releases.
+        """
+
+        key = '{}/{}'.format(organization_name, repository_name)
+        with self._lock:
+            entry = self.state.get(key, {})
+        etag, titles = github.list_recent_releases(
+            organization_name,
+            repository_name,
+            entry.get('etag'),
+            self.session)
+        if titles is None:
+            logger.debug('No new releases in {}.'.format(key))
+            return entry.get('version')
+        # Only the titles that populate_plugin takes for versions count,
+        # so two part titles such as '1.0' are skipped.
+        versions = [t for t in titles if t and t != 'latest' and
+                    github.check_version_valid(t)]
+        version = max(versions, key=parse_version) if versions else None
+        with self._lock:
+            self.state[key] = {'etag': etag, 'version': version}
+        return version
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            with NamedTemporaryFile('w', dir=directory, delete=False) as f:
+                json.dump(self.state, f)
+        os.replace(f.name, self.path)
+
+
+def get_s3_changes(record, plugin_yaml_name, s3_client=None):
+    """
+    Compare a plugins.json record with its version's directory in S3.
+    :param record: The PluginRecord.
+    :param plugin_yaml_name: plugin.yaml or v2_plugin.yaml.
+    :param s3_client: A boto3 s3 resource to reuse.
+    :return: Why the record is out of date, or None.
+    """
+
+    names = set(s3.get_assets(record.name, record.version, s3=s3_client))
+    link = None
+    if plugin_yaml_name in names:
+        link = s3.URL_TEMPLATE.format(
+            record.name, record.version, plugin_yaml_name)
+    if record.link != link or record.data.get('yaml') != link:
+        return 'the plugin YAML changed'
+    wagons = {}
+    for name in names:
+        distro = get_wagon_distro(name)
+        if distro and name.endswith('.wgn') and name + '.md5' in names:
+            wagons[distro] = s3.URL_TEMPLATE.format(
+                record.name, record.version, name)
+    listed = {distro: wagon['url'] for distro, wagon in record.wagons.items()
+              if wagon.get('url')}
+    if wagons != listed:
+        return 'the wagons changed'
+
+
+def get_update_reason(record, newest_version, plugin_yaml_name,
+                      s3_client=None):
+    """
+    :param record: The published PluginRecord, or None.
+    :param newest_version: The newest version from the ReleaseProbe.
+    :return: Why the plugin must be generated again, or None.
+    """
+
+    if not record:
+        return 'it is not published'
+    if not newest_version:
+        return 'no recent release has a version'
+    if parse_version(newest_version) > parse_version(record.version):
+        return 'version {} was released'.format(newest_version)
+    return get_s3_changes(record, plugin_yaml_name, s3_client)
+
+
+def reuse_plugin(template, record):
+    """
+    :return: A plugins.json entry from the template, with the generated
+        values of the published record.
+    """
+
+    plugin_content = deepcopy(template)
+    for key in GENERATED_KEYS:
+        plugin_content[key] = deepcopy(record.data.get(key))
+    return plugin_content
+
+
+def get_report(previous, plugins, reasons):
+    """
+    :param previous: The published plugins.json list.
+    :param plugins: The new plugins.json list.
+    :param reasons: A list of the reason that each plugin was generated,
+        or None if it was reused.
+    :return: The diff report.
+    """
+
+    report = {'updated': [], 'unchanged': [], 'removed': []}
+    for plugin, reason in zip(plugins, reasons):
+        entry = {'name': plugin['name'], 'title': plugin.get('title')}
+        if reason:
+            old = [p['version'] for p in previous
+                   if p['name'] == plugin['name'] and
+                   p.get('title') == plugin.get('title')]
+            entry.update(previous_version=old[0] if old else None,
+                         version=plugin['version'],
+                         reason=reason)
+            report['updated'].append(entry)
+        else:
+            report['unchanged'].append(entry)
+    titles = {(p['name'], p.get('title')) for p in plugins}
+    report['removed'] = [
+        {'name': p['name'], 'title': p.get('title')} for p in previous
+        if (p['name'], p.get('title')) not in titles]
+    return report
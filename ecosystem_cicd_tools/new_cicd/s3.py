@@ -1,5 +1,9 @@
 import os
+import time
+import bisect
+import hashlib
 import pathlib
+from threading import Lock
 from tqdm import tqdm
 from functools import wraps
 
@@ -7,6 +11,7 @@ from botocore.exceptions import ClientError
 from boto3.s3.transfer import TransferConfig
 
 from .logging import logger
+from .cache import fetch_s3, get_etag_md5
 from .boto3 import get_boto_service
 
 BUCKET_NAME = 'cloudify-release-eu'
@@ -16,39 +21,197 @@ ACCESS_KEY = 'aws_access_key_id'
 ACCESS_SECRET = 'aws_secret_access_key'
 
 URL_TEMPLATE = 'http://repository.cloudifysource.org/cloudify/wagons/{}/{}/{}'
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+# How long, in seconds, a listing of BUCKET_FOLDER is trusted.
+INVENTORY_TTL = int(os.environ.get('S3_INVENTORY_TTL', 300))
 
 
 def with_s3_client(func):
     @wraps(func)
     def wrapper_func(*args, **kwargs):
 
-        kwargs['s3'] = get_client()
+        # Callers that make many calls can pass their own resource.
+        kwargs['s3'] = kwargs.get('s3') or get_client()
         return func(*args, **kwargs)
     return wrapper_func
 
 
-def get_client():
-    return get_boto_service('s3')
+def get_client(config=None):
+    """
+    :param config: A botocore Config, such as a bigger connection pool.
+    :return: A boto3 s3 resource.
+    """
+    return get_boto_service('s3', config=config)
 
 
-def upload_plugin_asset_to_s3(local_path, plugin_name, plugin_version):
+class S3Inventory(object):
+    """The keys under a folder of a bucket, listed once and then answered
+    from memory.
+
+    Keys are kept sorted per top level directory, for example per plugin
+    under cloudify/wagons, and each directory is listed the first time it
+    is queried. A query that spans directories lists the whole folder in
+    one paginated listing. Listings are trusted for ttl seconds, and keys
+    that we upload or delete ourselves are updated in place. The ETags
+    of listed keys are kept too, so callers can compare checksums without
+    requesting every object.
     """
 
-    :param local_path: The path to the asset, such as 'dir/my-wagon.wgn.md5'.
-    :param plugin_name: The plugin name, such as 'cloudify-foo-plugin'.
-    :param plugin_version: The plugin version, such as '1.0.0'.
-    :return:
+    def __init__(self, bucket_name=None, folder=None, ttl=None):
+        self.bucket_name = bucket_name or BUCKET_NAME
+        self.folder = (folder or BUCKET_FOLDER).rstrip('/') + '/'
+        self.ttl = INVENTORY_TTL if ttl is None else ttl
+        self._directories = {}
+        self._etags = {}
+        self._loaded_at = {}
+        self._lock = Lock()
+
+    def covers(self, prefix, bucket_name=None):
+        return (bucket_name or BUCKET_NAME) == self.bucket_name and \
+            prefix.startswith(self.folder)
+
+    def invalidate(self):
+        with self._lock:
+            self._directories.clear()
+            self._etags.clear()
+            self._loaded_at.clear()
+
+    def _directory(self, key):
+        rest = key[len(self.folder):]
+        if '/' in rest:
+            return rest.split('/', 1)[0]
+
+    def _fresh(self, directory):
+        loaded_at = self._loaded_at.get(directory)
+        return loaded_at is not None and \
+            time.monotonic() - loaded_at < self.ttl
+
+    def _load(self, directory, s3):
+        prefix = self.folder + (directory + '/' if directory else '')
+        logger.debug('Listing s3://{}/{}.'.format(self.bucket_name, prefix))
+        listed = {}
+        etags = {}
+        for object_summary in s3.Bucket(self.bucket_name).objects.filter(
+                Prefix=prefix):
+            listed.setdefault(
+                self._directory(object_summary.key), []).append(
+                    object_summary.key)
+            etags[object_summary.key] = object_summary.e_tag
+        loaded_at = time.monotonic()
+        with self._lock:
+            self._etags.update(etags)
+            if directory:
+                self._directories[directory] = sorted(
+                    listed.get(directory, []))
+                self._loaded_at[directory] = loaded_at
+            else:
+                self._directories = {
+                    k: sorted(v) for k, v in listed.items() if k}
+                self._loaded_at = dict.fromkeys(self._directories, loaded_at)
+                self._loaded_at[None] = loaded_at
+
+    def keys(self, prefix, s3):
+        """
+        :param prefix: A prefix under the inventory folder.
+        :param s3: s3 client boto3, used if the prefix must be listed.
+        :return: The sorted keys that start with prefix.
+        """
+
+        directory = self._directory(prefix)
+        if not self._fresh(directory) and not self._fresh(None):
+            self._load(directory, s3)
+        with self._lock:
+            if directory:
+                directories = [self._directories.get(directory, [])]
+            else:
+                directories = [self._directories[k]
+                               for k in sorted(self._directories)]
+            result = []
+            for keys in directories:
+                start = bisect.bisect_left(keys, prefix)
+                for key in keys[start:]:
+                    if not key.startswith(prefix):
+                        break
+                    result.append(key)
+        return sorted(result)
+
+    def exists(self, key, s3):
+        return key in self.keys(key, s3)
+
+    def etag(self, key):
+        """
+        :return: The ETag of a listed or uploaded key, or None if unknown.
+        """
+
+        with self._lock:
+            return self._etags.get(key)
+
+    def add(self, key, etag=None):
+        directory = self._directory(key)
+        with self._lock:
+            if etag:
+                self._etags[key] = etag
+            else:
+                self._etags.pop(key, None)
+            keys = self._directories.get(directory)
+            if keys is None:
+                if directory not in self._loaded_at and \
+                        None not in self._loaded_at:
+                    return
+                keys = self._directories[directory] = []
+            index = bisect.bisect_left(keys, key)
+            if index == len(keys) or keys[index] != key:
+                keys.insert(index, key)
+
+    def discard(self, key):
+        with self._lock:
+            self._etags.pop(key, None)
+            keys = self._directories.get(self._directory(key), [])
+            if key in keys:
+                keys.remove(key)
+
+
+inventory = S3Inventory()
+
+
+def list_keys(prefix, bucket_name=None, s3=None):
+    """
+    :return: The sorted keys that start with prefix, from the inventory if
+        it covers the prefix.
     """
+    bucket_name = bucket_name or BUCKET_NAME
+    if inventory.covers(prefix, bucket_name):
+        return inventory.keys(prefix, s3)
+    objects = s3.Bucket(bucket_name).objects.filter(Prefix=prefix)
+    return sorted(o.key for o in objects)
+
+
+def get_plugin_asset_key(local_path, plugin_name, plugin_version):
     # We want to create a string in the format:
     # cloudify/wagons/cloudify-foo-plugin/1.0.0/my-wagon.wgn.md5
     bucket_path = os.path.join(BUCKET_FOLDER,
                                plugin_name,
                                plugin_version,
                                os.path.basename(local_path))
-    bucket_path = pathlib.Path(bucket_path).as_posix()
+    return pathlib.Path(bucket_path).as_posix()
+
+
+def upload_plugin_asset_to_s3(local_path,
+                              plugin_name,
+                              plugin_version,
+                              s3=None):
+    """
+
+    :param local_path: The path to the asset, such as 'dir/my-wagon.wgn.md5'.
+    :param plugin_name: The plugin name, such as 'cloudify-foo-plugin'.
+    :param plugin_version: The plugin version, such as '1.0.0'.
+    :param s3: s3 client boto3
+    :return:
+    """
+    bucket_path = get_plugin_asset_key(local_path, plugin_name, plugin_version)
     logger.info('Uploading {plugin_name} {plugin_version} to S3.'.format(
         plugin_name=plugin_name, plugin_version=plugin_version))
-    upload_to_s3(local_path, bucket_path)
+    upload_to_s3(local_path, bucket_path, s3=s3)
 
 
 @with_s3_client
@@ -75,11 +238,60 @@ def upload_to_s3(local_path,
     extra_args = {'ACL': 'public-read'}
     if content_type:
         extra_args.update({'ContentType': content_type})
+    # The ACL in ExtraArgs is set by the upload request itself.
     bucket.upload_file(local_path,
                        remote_path,
                        ExtraArgs=extra_args)
-    object_acl = s3.ObjectAcl(bucket_name, remote_path)
-    object_acl.put(ACL='public-read')
+    if inventory.covers(remote_path, bucket_name):
+        inventory.add(remote_path)
+
+
+@with_s3_client
+def upload_content_to_s3(content,
+                         remote_path,
+                         bucket_name=None,
+                         content_type=None,
+                         s3=None):
+    """
+    Upload a string to s3, without writing it to a local file.
+    :param content: The object content.
+    :param remote_path: The s3 key.
+    :param bucket_name: The s3 bucket.
+    :param content_type: The object content-type.
+    :param s3: s3 client boto3
+    :return:
+    """
+    bucket_name = bucket_name or BUCKET_NAME
+    logger.info('Uploading content to s3://{remote_path}.'.format(
+        remote_path=remote_path))
+    kwargs = {'ACL': 'public-read'}
+    if content_type:
+        kwargs.update({'ContentType': content_type})
+    s3.Object(bucket_name, remote_path).put(
+        Body=content.encode('utf-8'), **kwargs)
+    if inventory.covers(remote_path, bucket_name):
+        inventory.add(remote_path)
+
+
+@with_s3_client
+def get_object_md5(remote_path, bucket_name=None, s3=None):
+    """
+    Get the MD5 of an s3 object, streaming it in constant memory unless its
+    ETag is already an MD5 (see get_etag_md5).
+    :param remote_path: The s3 key.
+    :param bucket_name: The s3 bucket.
+    :param s3: s3 client boto3
+    :return: The hex MD5.
+    """
+    s3_object = s3.Object(bucket_name or BUCKET_NAME, remote_path)
+    etag_md5 = get_etag_md5(s3_object)
+    if etag_md5:
+        return etag_md5
+    logger.info('Hashing s3://{remote_path}.'.format(remote_path=remote_path))
+    md5 = hashlib.md5()
+    for chunk in s3_object.get()['Body'].iter_chunks(STREAM_CHUNK_SIZE):
+        md5.update(chunk)
+    return md5.hexdigest()
 
 
 @with_s3_client
@@ -90,17 +302,40 @@ def get_assets(plugin_name,
     url = 'cloudify/wagons/{plugin_name}/{plugin_version}/'.format(
         plugin_name=plugin_name,
         plugin_version=plugin_version)
-    assets_list_s3 = []
-    my_bucket = s3.Bucket(bucket_name)
-    for object_summary in my_bucket.objects.filter(Prefix=url):
-        assets_list_s3.append(object_summary.key.split(url)[-1])
-    return assets_list_s3
+    return [key.split(url)[-1]
+            for key in list_keys(url, bucket_name, s3=s3)]
+
+
+@with_s3_client
+def get_asset_etags(plugin_name,
+                    plugin_version,
+                    bucket_name=BUCKET_NAME,
+                    s3=None):
+    """
+    :return: A dict of the plugin version's asset names to their ETags, or
+        to None if the inventory doesn't know the ETag.
+    """
+
+    url = 'cloudify/wagons/{plugin_name}/{plugin_version}/'.format(
+        plugin_name=plugin_name,
+        plugin_version=plugin_version)
+    return {key.split(url)[-1]: inventory.etag(key)
+            for key in list_keys(url, bucket_name, s3=s3)}
 
 
 @with_s3_client
 def download_from_s3(local_path,
                      remote_path,
+                     config=None,
                      s3=None):
+    """
+    Download a file from s3, if the key exists.
+    :param local_path: The local path to download to.
+    :param remote_path: The s3 key.
+    :param config: TransferConfig, by default a single threaded download.
+    :param s3: s3 client boto3
+    :return:
+    """
 
     logger.info('download_from_s3 {remote_path} to {local_path}.'
                 .format(remote_path=remote_path,
@@ -114,10 +349,10 @@ def download_from_s3(local_path,
                   total=file_size,
                   unit='B',
                   unit_scale=True) as progress_bar:
-            s3_object.download_file(
-                local_path,
-                Callback=progress_bar.update,
-                Config=TransferConfig(use_threads=False))
+            fetch_s3(s3_object,
+                     local_path,
+                     Callback=progress_bar.update,
+                     Config=config or TransferConfig(use_threads=False))
             progress_bar.close()
     if os.path.exists(local_path):
         logger.info('The file exists: {}.'.format(local_path))
@@ -144,33 +379,10 @@ def get_plugin_yaml_url(plugin_name, filename, plugin_version, s3=None):
                                plugin_version,
                                filename)
     bucket_path = pathlib.Path(bucket_path).as_posix()
-    s3_object = s3.Object(BUCKET_NAME, bucket_path)
-    if object_exists(s3_object):
+    if bucket_path in list_keys(bucket_path, s3=s3):
         return URL_TEMPLATE.format(plugin_name, plugin_version, filename)
 
 
-@with_s3_client
-def get_objects_in_key(plugin_name, plugin_version, s3=None):
-    with tqdm(desc='Looking for {} {}'.format(plugin_name, plugin_version),
-              total=100) as pbar:
-        bucket = s3.Bucket(BUCKET_NAME)
-        pbar.update(20)
-        objects = bucket.objects.filter(
-            Prefix='{}/{}/{}'.format(BUCKET_FOLDER, plugin_name, plugin_version))
-        pbar.update(20)
-        sorted_objects = sorted(
-            objects,
-            key=lambda v: v.key)
-        pbar.update(20)
-        objects = [o.key for o in sorted_objects]
-        pbar.update(20)
-        logger.debug('Objects in key: {} {} {}'.format(
-            plugin_name, plugin_version, objects))
-        pbar.update(20)
-        pbar.close()
-        return objects
-
-
 @with_s3_client
 def get_objects_in_key(plugin_name=None,
                        plugin_version=None,
@@ -178,7 +390,6 @@ def get_objects_in_key(plugin_name=None,
                        filter_kwargs=None,
                        s3=None):
 
-    bucket = s3.Bucket(BUCKET_NAME)
     if plugin_name and plugin_version and not filter_kwargs:
         filter_kwargs = dict(
             Prefix='{}/{}/{}'.format(
@@ -188,14 +399,10 @@ def get_objects_in_key(plugin_name=None,
             )
         )
     logger.debug('Object filter params: {}'.format(filter_kwargs))
-    objects = bucket.objects.filter(**filter_kwargs)
-    logger.debug('Object filter result: {}'.format(objects))
-
-    sorted_objects = sorted(
-        objects,
-        key=lambda v: v.key)
-    objects = [o.key for o in sorted_objects]
-    return objects
+    if list(filter_kwargs) == ['Prefix']:
+        return list_keys(filter_kwargs['Prefix'], s3=s3)
+    objects = s3.Bucket(BUCKET_NAME).objects.filter(**filter_kwargs)
+    return sorted(o.key for o in objects)
 
 
 @with_s3_client
@@ -222,3 +429,5 @@ def delete_object_from_s3(remote_path,
         }
     }
     bucket.delete_objects(**kwargs)
+    if inventory.covers(remote_path, bucket_name):
+        inventory.discard(remote_path)
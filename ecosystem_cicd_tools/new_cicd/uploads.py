@@ -0,0 +1,320 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import math
+import hashlib
+from threading import Lock
+from tempfile import NamedTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from . import s3
+from .logging import logger
+
+# How many files are uploaded at the same time, and how many parts of
+# each multipart upload.
+UPLOAD_WORKERS = int(os.environ.get('S3_UPLOAD_WORKERS', 8))
+PART_CONCURRENCY = int(os.environ.get('S3_UPLOAD_PART_CONCURRENCY', 4))
+MULTIPART_THRESHOLD = int(
+    os.environ.get('S3_MULTIPART_THRESHOLD', 16 * 1024 * 1024))
+MULTIPART_CHUNKSIZE = int(
+    os.environ.get('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+MAX_PARTS = 10000
+JOURNAL_DIR = os.environ.get(
+    'S3_UPLOAD_JOURNAL_DIR',
+    os.path.join(os.path.expanduser('~'),
+                 '.cache',
+                 'cloudify-ecosystem',
+                 'uploads'))
+ACL = 'public-read'
+
+
+class UploadJournal(object):
+    """Multipart uploads in progress, so an interrupted upload of the same
+    file to the same key can continue from its last uploaded part.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or JOURNAL_DIR
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, bucket_name, key, local_path):
+        name = '{0}/{1}:{2}'.format(
+            bucket_name, key, os.path.abspath(local_path))
+        return os.path.join(
+            self.directory,
+            hashlib.sha256(name.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self, bucket_name, key, local_path):
+        try:
+            with open(self._path(bucket_name, key, local_path), 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return
+
+    def save(self, entry):
+        with NamedTemporaryFile(
+                'w', dir=self.directory, delete=False) as f:
+            json.dump(entry, f)
+        os.replace(f.name, self._path(
+            entry['bucket'], entry['key'], entry['local_path']))
+
+    def remove(self, bucket_name, key, local_path):
+        try:
+            os.remove(self._path(bucket_name, key, local_path))
+        except FileNotFoundError:
+            pass
+
+
+class MultipartUpload(object):
+    """Upload one file in parts, recording every finished part in the
+    journal. The ACL is set when the upload is created, so there's no
+    separate ACL request.
+    """
+
+    def __init__(self,
+                 client,
+                 bucket_name,
+                 key,
+                 local_path,
+                 journal,
+                 extra_args=None,
+                 part_concurrency=None,
+                 chunksize=None):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.local_path = local_path
+        self.journal = journal
+        self.extra_args = extra_args or {}
+        self.part_concurrency = part_concurrency or PART_CONCURRENCY
+        stat = os.stat(local_path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.part_size = max(chunksize or MULTIPART_CHUNKSIZE,
+                             int(math.ceil(self.size / MAX_PARTS)))
+        self.entry = None
+        self._lock = Lock()
+
+    @property
+    def part_count(self):
+        return max(int(math.ceil(self.size / self.part_size)), 1)
+
+    def _matches(self, entry):
+        return entry['size'] == self.size and \
+            entry['mtime'] == self.mtime and \
+            entry['part_size'] == self.part_size
+
+    def _list_parts(self, upload_id):
+        parts = {}
+        kwargs = dict(Bucket=self.bucket_name,
+                      Key=self.key,
+                      UploadId=upload_id)
+        while True:
+            response = self.client.list_parts(**kwargs)
+            for part in response.get('Parts', []):
+                parts[str(part['PartNumber'])] = part['ETag']
+            if not response.get('IsTruncated'):
+                return parts
+            kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    def _abort(self, upload_id):
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=upload_id)
+        except ClientError:
+            pass
+
+    def _resume(self):
+        entry = self.journal.load(
+            self.bucket_name, self.key, self.local_path)
+        if not entry:
+            return
+        if not self._matches(entry):
+            logger.info('{} changed, restarting its upload.'.format(
+                self.local_path))
+            self._abort(entry['upload_id'])
+            return
+        try:
+            entry['parts'] = self._list_parts(entry['upload_id'])
+        except ClientError:
+            return
+        logger.info('Resuming the upload of {} to {} with {} parts '
+                    'done.'.format(self.local_path,
+                                   self.key,
+                                   len(entry['parts'])))
+        return entry
+
+    def _create(self):
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            ACL=ACL,
+            **self.extra_args)
+        entry = dict(bucket=self.bucket_name,
+                     key=self.key,
+                     local_path=self.local_path,
+                     size=self.size,
+                     mtime=self.mtime,
+                     part_size=self.part_size,
+                     upload_id=response['UploadId'],
+                     parts={})
+        self.journal.save(entry)
+        return entry
+
+    def _upload_part(self, part_number):
+        with open(self.local_path, 'rb') as f:
+            f.seek((part_number - 1) * self.part_size)
+            body = f.read(self.part_size)
+        response = self.client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.entry['upload_id'],
+            PartNumber=part_number,
+            Body=body)
+        with self._lock:
+            self.entry['parts'][str(part_number)] = response['ETag']
+            self.journal.save(self.entry)
+
+    def upload(self):
+        self.entry = self._resume() or self._create()
+        missing = [n for n in range(1, self.part_count + 1)
+                   if str(n) not in self.entry['parts']]
+        with ThreadPoolExecutor(
+                max_workers=max(self.part_concurrency, 1)) as executor:
+            for future in [executor.submit(self._upload_part, n)
+                           for n in missing]:
+                future.result()
+        response = self.client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.entry['upload_id'],
+            MultipartUpload={'Parts': [
+                {'PartNumber': int(n), 'ETag': etag}
+                for n, etag in sorted(self.entry['parts'].items(),
+                                      key=lambda p: int(p[0]))]})
+        self.journal.remove(self.bucket_name, self.key, self.local_path)
+        return response
+
+
+def upload_file(client,
+                local_path,
+                key,
+                bucket_name=None,
+                content_type=None,
+                journal=None,
+                threshold=None,
+                **kwargs):
+    """
+    Upload a file with a public-read ACL, in one request if it is smaller
+    than threshold, or else in a resumable multipart upload.
+    :param client: A boto3 s3 client.
+    :param local_path: The local path to the file.
+    :param key: The s3 key.
+    :param bucket_name: The s3 bucket.
+    :param content_type: The object content-type.
+    :param journal: The UploadJournal of multipart uploads.
+    :param threshold: The smallest file size to upload in parts.
+    :param kwargs: Additional MultipartUpload arguments.
+    """
+
+    bucket_name = bucket_name or s3.BUCKET_NAME
+    extra_args = {'ContentType': content_type} if content_type else {}
+    logger.info('Uploading {local_path} to s3://{remote_path}.'.format(
+        local_path=local_path, remote_path=key))
+    if os.path.getsize(local_path) < (threshold or MULTIPART_THRESHOLD):
+        with open(local_path, 'rb') as f:
+            response = client.put_object(
+                Bucket=bucket_name, Key=key, Body=f, ACL=ACL, **extra_args)
+    else:
+        response = MultipartUpload(client,
+                                   bucket_name,
+                                   key,
+                                   local_path,
+                                   journal or UploadJournal(),
+                                   extra_args,
+                                   **kwargs).upload()
+    if s3.inventory.covers(key, bucket_name):
+        s3.inventory.add(key, (response or {}).get('ETag'))
+
+
+def get_upload_client(workers, part_concurrency):
+    """
+    :return: A boto3 s3 client with a pooled connection for every request
+        that upload_files_to_s3 may have in flight.
+    """
+
+    return s3.get_client(Config(
+        max_pool_connections=workers * part_concurrency)).meta.client
+
+
+def upload_files_to_s3(files,
+                       bucket_name=None,
+                       content_type=None,
+                       workers=None,
+                       s3_resource=None,
+                       **kwargs):
+    """
+    Upload many files concurrently.
+    :param files: A dict of local paths to s3 keys.
+    :param bucket_name: The s3 bucket.
+    :param content_type: The content-type of all the objects.
+    :param workers: How many files to upload at the same time.
+    :param s3_resource: s3 resource boto3, by default one with a
+        connection pool that fits workers times the part concurrency.
+    :param kwargs: Additional upload_file arguments.
+    """
+
+    workers = max(workers or UPLOAD_WORKERS, 1)
+    part_concurrency = max(kwargs.get('part_concurrency') or PART_CONCURRENCY,
+                           1)
+    # Unlike the resource, the client is thread safe.
+    if s3_resource:
+        client = s3_resource.meta.client
+    else:
+        client = get_upload_client(workers, part_concurrency)
+    journal = UploadJournal()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(upload_file,
+                                   client,
+                                   local_path,
+                                   key,
+                                   bucket_name,
+                                   content_type,
+                                   journal,
+                                   **kwargs)
+                   for local_path, key in files.items()]
+        for future in futures:
+            future.result()
+
+
+def upload_plugin_assets_to_s3(paths, plugin_name, plugin_version, **kwargs):
+    """
+    Upload plugin release assets concurrently.
+    :param paths: The local paths of the assets.
+    :param plugin_name: The plugin name, such as 'cloudify-foo-plugin'.
+    :param plugin_version: The plugin version, such as '1.0.0'.
+    """
+
+    logger.info('Uploading {plugin_name} {plugin_version} to S3.'.format(
+        plugin_name=plugin_name, plugin_version=plugin_version))
+    upload_files_to_s3(
+        {path: s3.get_plugin_asset_key(path, plugin_name, plugin_version)
+         for path in paths},
+        **kwargs)
@@ -0,0 +1,361 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+from threading import Lock
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from . import s3
+from . import github
+from . import marketplace
+from .cache import file_md5, MD5_PATTERN
+from .logging import logger
+
+VERIFY_TIMEOUT = int(os.environ.get('RELEASE_VERIFY_TIMEOUT', 360))
+VERIFY_INITIAL_INTERVAL = 2
+VERIFY_MAX_INTERVAL = 30
+VERIFY_BACKOFF_FACTOR = 1.5
+MARKETPLACE_ASSET_TEMPLATE = \
+    'https://github.com/{}/{}/releases/download/{}/{}'
+# These assets are not published everywhere.
+UNVERIFIED_SUFFIXES = ('wgn.md5', 'v2_plugin.yaml', 'plugin_1_5.yaml')
+SOURCES = ('marketplace', 'github', 's3')
+DIGESTS = {
+    'md5': file_md5,
+    'sha256': github.file_sha256,
+}
+
+
+def get_expected_assets(assets):
+    return [a for a in assets if not a.endswith(UNVERIFIED_SUFFIXES)]
+
+
+def get_github_assets(repository, version):
+    release = repository.get_release(version)
+    assets = []
+    for asset in release.get_assets():
+        logger.info('Asset in release: {}'.format(asset.name))
+        assets.append(asset)
+    return assets
+
+
+def normalize_github_assets(assets):
+    """
+    :param assets: Github release assets, or their names.
+    :return: A dict of asset names to their ('sha256', digest), or to None
+        if Github didn't report a digest.
+    """
+
+    listed = {}
+    for asset in assets:
+        name = getattr(asset, 'name', asset)
+        digest = getattr(asset, 'digest', None)
+        if isinstance(digest, str) and digest.startswith('sha256:'):
+            listed[name] = ('sha256', digest.split(':', 1)[1])
+        else:
+            listed[name] = None
+    return listed
+
+
+def normalize_s3_assets(assets):
+    """
+    :param assets: A dict of asset names to ETags, or a list of names.
+    :return: A dict of asset names to their ('md5', digest), or to None if
+        the ETag isn't an MD5, like the ETag of a multipart upload.
+    """
+
+    if not isinstance(assets, dict):
+        assets = dict.fromkeys(assets)
+    listed = {}
+    for name, etag in assets.items():
+        etag = etag.strip('"') if isinstance(etag, str) else ''
+        listed[name] = ('md5', etag) if MD5_PATTERN.match(etag) else None
+    return listed
+
+
+def normalize_marketplace_assets(urls, organization_name, plugin_name,
+                                 version):
+    """
+    :param urls: The marketplace's wagon and YAML URLs.
+    :return: A dict of asset names to None. URLs that are not assets of
+        this release are kept whole, so they are reported as extra.
+    """
+
+    prefix = MARKETPLACE_ASSET_TEMPLATE.format(
+        organization_name, plugin_name, version, '')
+    listed = {}
+    for url in urls:
+        if url.startswith(prefix):
+            url = os.path.basename(urlparse(url).path)
+        listed[url] = None
+    return listed
+
+
+class AssetDiff(namedtuple('AssetDiff', ['missing', 'extra', 'mismatched'])):
+    """How one source differs from the released assets. Each field is a
+    sorted list of asset names. Extra assets are reported, but they don't
+    fail verification.
+    """
+
+    @property
+    def ok(self):
+        return not self.missing and not self.mismatched
+
+    def describe(self, source):
+        """
+        :return: A list of problems, empty if the source has every asset.
+        """
+
+        problems = []
+        if self.missing:
+            problems.append('{} missing from {}'.format(
+                ', '.join(self.missing), source))
+        if self.mismatched:
+            problems.append('{} in {} differ from the local files'.format(
+                ', '.join(self.mismatched), source))
+        return problems
+
+
+def diff_assets(expected, listed, digest=None):
+    """
+    :param expected: The names of the released assets.
+    :param listed: A dict of the names that a source has to their
+        (algorithm, digest), or None.
+    :param digest: A function of (name, algorithm) that returns the local
+        digest of an asset, or None.
+    :return: An AssetDiff.
+    """
+
+    expected = set(get_expected_assets(expected))
+    names = set(get_expected_assets(listed))
+    mismatched = []
+    for name in expected & names:
+        if not listed[name] or not digest:
+            continue
+        algorithm, remote = listed[name]
+        local = digest(name, algorithm)
+        if local and local != remote:
+            mismatched.append(name)
+    return AssetDiff(sorted(expected - names),
+                     sorted(names - expected),
+                     sorted(mismatched))
+
+
+class LocalDigests(object):
+    """Hash local assets on demand, at most once per algorithm."""
+
+    def __init__(self, paths):
+        """
+        :param paths: A dict of asset names to local paths.
+        """
+
+        self.paths = paths
+        self._digests = {}
+        self._lock = Lock()
+
+    def __call__(self, name, algorithm):
+        path = self.paths.get(name)
+        if not path or algorithm not in DIGESTS or \
+                not os.path.isfile(path):
+            return
+        with self._lock:
+            if (name, algorithm) not in self._digests:
+                self._digests[name, algorithm] = DIGESTS[algorithm](path)
+            return self._digests[name, algorithm]
+
+
+class AssetReconciliation(object):
+    """Compare a plugin version's assets on Github, S3 and the marketplace.
+
+    The sources are listed at the same time, and every listing is reduced
+    to a dict keyed by asset name, so comparing them is a set operation.
+    When local paths are known, Github SHA256 digests and S3 MD5 ETags are
+    compared to the local files as well.
+
+        diffs = AssetReconciliation(
+            'cloudify-foo-plugin', 'cloudify-cosmo', '1.0.0', assets).diff()
+    """
+
+    def __init__(self,
+                 plugin_name,
+                 organization_name,
+                 version,
+                 assets,
+                 repository=None,
+                 sources=None):
+        """
+        :param plugin_name: The plugin's repository name.
+        :param organization_name: The plugin's Github organization.
+        :param version: The release name.
+        :param assets: A dict of released asset names to local paths, or
+            a list of asset names.
+        :param repository: The plugin's Github repository, needed to list
+            the Github release.
+        :param sources: The sources to compare, by default all of them.
+        """
+
+        self.plugin_name = plugin_name
+        self.organization_name = organization_name
+        self.version = version
+        self.assets = sorted(assets)
+        self.digest = LocalDigests(
+            dict(assets) if isinstance(assets, dict) else {})
+        listers = {
+            'marketplace': lambda: normalize_marketplace_assets(
+                marketplace.get_assets(plugin_name, version, fresh=True),
+                organization_name,
+                plugin_name,
+                version),
+            'github': lambda: normalize_github_assets(
+                get_github_assets(repository, version)),
+            's3': lambda: normalize_s3_assets(
+                s3.get_asset_etags(plugin_name, version)),
+        }
+        if not repository:
+            listers.pop('github')
+        if plugin_name.startswith('nativeedge'):
+            listers.pop('marketplace')
+        self.listers = {k: v for k, v in listers.items()
+                        if k in (sources or SOURCES)}
+
+    def list(self, sources=None):
+        """
+        :param sources: The sources to list, by default all of them.
+        :return: A dict of sources to their normalized listings.
+        """
+
+        if sources is None:
+            sources = self.listers
+        sources = [s for s in sources if s in self.listers]
+        with ThreadPoolExecutor(max_workers=len(sources) or 1) as executor:
+            futures = {s: executor.submit(self.listers[s]) for s in sources}
+        return {s: f.result() for s, f in futures.items()}
+
+    def diff(self, sources=None):
+        """
+        :param sources: The sources to compare, by default all of them.
+        :return: A dict of sources to their AssetDiff.
+        """
+
+        return {source: diff_assets(self.assets, listed, self.digest)
+                for source, listed in self.list(sources).items()}
+
+
+def get_asset_problems(diffs):
+    """
+    :param diffs: A dict of sources to their AssetDiff.
+    :return: A list of problems, empty if every source has every asset.
+    """
+
+    return [problem
+            for source in sorted(diffs)
+            for problem in diffs[source].describe(source)]
+
+
+def log_asset_diffs(diffs):
+    for source in sorted(diffs):
+        diff = diffs[source]
+        if diff.ok:
+            logger.info('All assets are in {}.'.format(source))
+        for problem in diff.describe(source):
+            logger.error(problem)
+        if diff.extra:
+            logger.info('{} also has {}.'.format(
+                source, ', '.join(diff.extra)))
+
+
+class ReleaseVerification(object):
+    """Wait until a release's assets are on GitHub, S3 and the marketplace.
+
+    Each check lists the sources that are still missing assets, all at
+    the same time. A source that has all the assets is not listed again.
+    Checks start fast and back off up to `maximum` seconds between them.
+
+        ReleaseVerification(repository, '1.0.0', assets).wait()
+    """
+
+    def __init__(self,
+                 repository,
+                 version,
+                 assets,
+                 timeout=None,
+                 initial=VERIFY_INITIAL_INTERVAL,
+                 maximum=VERIFY_MAX_INTERVAL,
+                 factor=VERIFY_BACKOFF_FACTOR,
+                 sleep=time.sleep):
+        """
+        :param repository: The plugin's Github repository.
+        :param version: The release name.
+        :param assets: A dict of released asset names to local paths, or
+            a list of asset names.
+        """
+
+        self.repository = repository
+        self.version = version
+        self.reconciliation = AssetReconciliation(
+            repository.name,
+            repository.organization.login,
+            version,
+            assets,
+            repository=repository)
+        self.timeout = VERIFY_TIMEOUT if timeout is None else timeout
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self._sleep = sleep
+        self.converged = set()
+        self.diffs = {}
+        self.problems = {}
+
+    def check(self):
+        """
+        List the sources that haven't converged yet.
+        :return: True if all sources have all the assets.
+        """
+
+        pending = [s for s in self.reconciliation.listers
+                   if s not in self.converged]
+        for source, diff in self.reconciliation.diff(pending).items():
+            self.diffs[source] = diff
+            if not diff.ok:
+                self.problems[source] = diff.describe(source)
+            else:
+                logger.info('Verified release assets in {}.'.format(source))
+                self.converged.add(source)
+                self.problems.pop(source, None)
+        if self.problems:
+            logger.error('Failed to verify all assets: {}'.format(
+                [p for problems in self.problems.values() for p in problems]))
+        return not self.problems
+
+    def wait(self):
+        """
+        :return: The seconds it took to verify the release.
+        """
+
+        start = time.time()
+        interval = self.initial
+        while not self.check():
+            elapsed = time.time() - start
+            if elapsed >= self.timeout:
+                raise RuntimeError(
+                    'Timed out waiting for marketplace plugin update: '
+                    '{}'.format(self.problems))
+            self._sleep(min(interval, self.timeout - elapsed))
+            interval = min(interval * self.factor, self.maximum)
+        return time.time() - start
@@ -18,7 +18,6 @@ import re
 import yaml
 import shutil
 import logging
-import tarfile
 from copy import deepcopy
 from pprint import pformat
 from tempfile import NamedTemporaryFile, mkdtemp
@@ -33,13 +32,17 @@ from . import (
     BLUEPRINT_LABEL_TEMPLATE,
     DEPLOYMENT_LABEL_TEMPLATE)
 
+from .new_cicd.s3 import get_objects_in_key
+from .new_cicd.plugins_index import (
+    PluginRecord,
+    PluginsIndex,
+    load_plugins_json)
+from .new_cicd.archives import BundleArchive, get_archive_path
 from .utils import (
     write_json,
     upload_to_s3,
-    read_json_file,
     create_archive,
     download_from_s3,
-    list_bucket_objects,
     report_tar_contents,
     get_workspace_files,
     find_wagon_local_path,
@@ -91,7 +94,7 @@ def get_plugins_json(remote_path):
     """
 
     local_path = download_from_s3(remote_path, PLUGINS_JSON)
-    return read_json_file(local_path)
+    return load_plugins_json(local_path)
 
 
 def plugin_dicts(plugin_dict, assets, wagons_list=None):
@@ -99,68 +102,7 @@ def plugin_dicts(plugin_dict, assets, wagons_list=None):
     logging.info('Plugin dict: {}'.format(plugin_dict))
     logging.info('Plugin dict assets: {}'.format(assets))
 
-    wagons_list = wagons_list or []
-
-    new_wagon_list = []
-
-    centos_core_li = {
-        'name': CENTOS
-    }
-    centos_aarch_li = {
-        'name': ARM64
-    }
-    redhat_maipo_li = {
-        'name': REDHAT
-    }
-
-    for asset in assets:
-        # Replace the old asset paths with new ones.
-        if asset.endswith('.yaml'):
-            plugin_dict['link'] = asset
-        elif 'centos-altarch' in asset:
-            if asset.endswith('md5'):
-                centos_aarch_li['md5url'] = asset
-            else:
-                centos_aarch_li['url'] = asset
-            continue
-        elif 'centos-Core-py36-none-linux_aarch64' in asset:
-            if asset.endswith('md5'):
-                centos_aarch_li['md5url'] = asset
-            else:
-                centos_aarch_li['url'] = asset
-                continue
-        elif 'centos-Core' in asset:
-            if asset.endswith('md5'):
-                centos_core_li['md5url'] = asset
-            else:
-                centos_core_li['url'] = asset
-                continue
-        elif 'redhat-Maipo' in asset:
-            if asset.endswith('md5'):
-                redhat_maipo_li['md5url'] = asset
-            else:
-                redhat_maipo_li['url'] = asset
-            continue
-
-    for li in [centos_core_li, centos_aarch_li, redhat_maipo_li]:
-        if li.keys() != {'url', 'md5url', 'name'}:
-            continue
-        elif plugin_dict['version'] not in li['url'] or \
-                plugin_dict['version'] not in li['md5url']:
-            continue
-        for wagon_item in wagons_list:
-            if wagon_item['name'] == li['name']:
-                wagons_list.remove(wagon_item)
-        new_wagon_list.append(li)
-
-    new_wagon_list.extend(wagons_list)
-
-    for wagon_item in new_wagon_list:
-        if plugin_dict['version'] not in wagon_item['url']:
-            new_wagon_list.remove(wagon_item)
-
-    plugin_dict['wagons'] = sorted(
-        new_wagon_list, key=lambda d: d['name'])
+    PluginRecord(plugin_dict).update_assets(assets, wagons_list or [])
 
 
 def update_assets_in_plugin_dict(plugin_dict,
@@ -221,28 +163,31 @@ def get_plugin_new_json(remote_path,
         v=plugin_version,
         a=assets,
         ll=plugins_list))
-    plugins_list = plugins_list or get_plugins_json(remote_path)
-    # Plugins list is a list of dictionaries. Each plugin/version is one dict.
-    for pd in plugins_list:
+    plugins_index = PluginsIndex(
+        plugins_list or get_plugins_json(remote_path))
+    # Only the dicts of this plugin are edited, the rest of the list is
+    # left as is.
+    for record in plugins_index.find(plugin_name):
+        pd = record.data
         logging.info('Checking {plugin_name} {plugin_version}'.format(
             plugin_name=plugin_name,
             plugin_version=plugin_version))
         logging.info('against plugin {pn} {pv}'.format(
             pn=pd['name'],
             pv=pd['version']))
-        if plugin_name == pd['name']:
-            # Double check that we are editing the same version.
-            # For example, we don't want to update
-            # Openstack 3.2.0 with Openstack 2.14.20.
-            logging.info(
-                'Checking if we have a major version '
-                'update {vers} vs {pdv}.'.format(vers=plugin_version,
-                                                 pdv=pd['version']))
-            if plugin_version.split('.')[0] == pd['version'].split('.')[0] or \
-                    'openstack' not in pd['name']:
-                update_assets_in_plugin_dict(
-                    pd, assets, plugin_version, v2_plugin=v2_plugin)
-            pd['yaml'] = pd['link']
+        # Double check that we are editing the same version.
+        # For example, we don't want to update
+        # Openstack 3.2.0 with Openstack 2.14.20.
+        logging.info(
+            'Checking if we have a major version '
+            'update {vers} vs {pdv}.'.format(vers=plugin_version,
+                                             pdv=pd['version']))
+        if plugin_version.split('.')[0] == pd['version'].split('.')[0] or \
+                'openstack' not in pd['name']:
+            update_assets_in_plugin_dict(
+                pd, assets, plugin_version, v2_plugin=v2_plugin)
+        pd['yaml'] = pd['link']
+    plugins_list = plugins_index.to_list()
     logging.info('New plugin list: {pl}'.format(pl=plugins_list))
     return plugins_list
 
@@ -283,9 +228,8 @@ def get_list_of_updated_assets(plugins_json=None):
     for plugin in plugins_json:
         list_of_updated_assets = []
         base_path = '/'.join(plugin['link'].split('/')[3:7])
-        for s3_path in list_bucket_objects(path=base_path)['Contents']:
-            cloudify_path = ASSET_FILE_URL_TEMPLATE.format(
-                *s3_path['Key'].split('/'))
+        for key in get_objects_in_key(filter_kwargs=dict(Prefix=base_path)):
+            cloudify_path = ASSET_FILE_URL_TEMPLATE.format(*key.split('/'))
             list_of_updated_assets.append(cloudify_path)
         plugin_dicts(plugin_dict=plugin, assets=list_of_updated_assets)
 
@@ -399,28 +343,19 @@ def create_plugin_bundle_archive(mappings,
                      mappings=pformat(mappings)))
 
     tempdir = mkdtemp()
-    metadata = {}
-
-    for key, value in mappings.items():
-        # If we have a plugin we want to use for a local path,
-        # then we don't want to download it.
-        wagon_path, yaml_path = create_plugin_metadata(
-            key, value, tempdir, v2_bundle)
-        logging.info('Inserting '
-                     'metadata[{wagon_path}] = {yaml_path}'.format(
-                         wagon_path=wagon_path, yaml_path=yaml_path))
-        metadata[wagon_path] = yaml_path
-    with open(os.path.join(tempdir, 'METADATA'), 'w+') as f:
-        logging.info(
-            'create_plugin_bundle_archive writing metadata {m}'.format(
-                m=metadata))
-        yaml.dump(metadata, f)
-    tar_path = os.path.join(destination, tar_name + '.tgz')
-    tarfile_ = tarfile.open(tar_path, 'w:gz')
+    tar_path = get_archive_path(destination, tar_name)
     try:
-        tarfile_.add(tempdir, arcname=tar_name)
+        with BundleArchive(tar_path, tar_name, yaml.dump) as archive:
+            for key, value in mappings.items():
+                # If we have a plugin we want to use for a local path,
+                # then we don't want to download it.
+                wagon_path, yaml_path = create_plugin_metadata(
+                    key, value, tempdir, v2_bundle)
+                logging.info('Inserting '
+                             'metadata[{wagon_path}] = {yaml_path}'.format(
+                                 wagon_path=wagon_path, yaml_path=yaml_path))
+                archive.add_plugin(tempdir, wagon_path, yaml_path)
     finally:
-        tarfile_.close()
         shutil.rmtree(tempdir, ignore_errors=True)
     return tar_path
 
@@ -467,23 +402,20 @@ def configure_bundle_archive(plugins_json=None):
     logging.info('Creating bundle with plugins {plugins}'.format(
         plugins=pformat(plugins_json)))
 
-    for plugin in plugins_json:
-        if plugin['title'].lower() in PLUGINS_TO_BUNDLE:
-            plugin_yaml = plugin['link']
-            centos_wagon = None
-            for wagon in plugin['wagons']:
-                if wagon['name'] in DISTROS_TO_BUNDLE:
-                    mapping[wagon['url']] = plugin_yaml
-                if wagon['name'] == CENTOS:
-                    centos_wagon = wagon
-            if centos_wagon:
-                aarch_name = centos_wagon['url'].replace(
-                    'centos-Core', 'centos-altarch')
-                aarch_name = aarch_name.replace(
-                    'x86_64', 'aarch64')
-                aarch_name = aarch_name.replace(
-                    'py27.py36', 'py36')
-                mapping[aarch_name] = plugin_yaml
+    for record in PluginsIndex(plugins_json).with_titles(PLUGINS_TO_BUNDLE):
+        plugin_yaml = record.link
+        for name, wagon in record.wagons.items():
+            if name in DISTROS_TO_BUNDLE:
+                mapping[wagon['url']] = plugin_yaml
+        centos_wagon = record.wagon(CENTOS)
+        if centos_wagon:
+            aarch_name = centos_wagon['url'].replace(
+                'centos-Core', 'centos-altarch')
+            aarch_name = aarch_name.replace(
+                'x86_64', 'aarch64')
+            aarch_name = aarch_name.replace(
+                'py27.py36', 'py36')
+            mapping[aarch_name] = plugin_yaml
 
     logging.info('Configure bundle mapping: {mapping}'.format(mapping=mapping))
     return mapping, PLUGINS_BUNDLE_NAME, build_directory
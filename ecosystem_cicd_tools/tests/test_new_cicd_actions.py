@@ -0,0 +1,133 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import mock
+import unittest
+import threading
+
+from ..new_cicd import actions as mod
+
+
+class TestNewActions(unittest.TestCase):
+
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.s3.get_client')
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.github.get_client')
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.plugins_json.'
+                'get_wagons_list')
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.s3.'
+                'get_plugin_yaml_url')
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.get_latest_version')
+    def test_populate_plugins_json(self,
+                                   get_latest_version,
+                                   get_plugin_yaml_url,
+                                   get_wagons_list,
+                                   get_github_client,
+                                   get_s3_client):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def latest_version(repository_name, **_):
+            # Two plugins must be in flight at the same time.
+            if repository_name in ['cloudify-aws-plugin',
+                                   'cloudify-azure-plugin']:
+                barrier.wait()
+            return '1.0.0'
+
+        get_latest_version.side_effect = latest_version
+        get_plugin_yaml_url.side_effect = \
+            lambda plugin_name, **_: plugin_name + '/plugin.yaml'
+        get_wagons_list.return_value = ['wagon']
+        get_s3_client.side_effect = lambda: mock.Mock()
+
+        result = mod.populate_plugins_json(workers=4)
+
+        templates = mod.plugins_json.JSON_TEMPLATE
+        self.assertEqual([p['name'] for p in result],
+                         [t['name'] for t in templates])
+        self.assertEqual(result[0]['link'],
+                         'cloudify-aws-plugin/plugin.yaml')
+        self.assertEqual(result[0]['wagons'], ['wagon'])
+        self.assertIsNone(templates[0]['version'])
+        get_github_client.assert_called_once_with({})
+        for call in get_latest_version.call_args_list:
+            self.assertIs(call[1]['github_client'],
+                          get_github_client.return_value)
+        self.assertLessEqual(get_s3_client.call_count, 4)
+
+    @mock.patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'key',
+                                  'AWS_SECRET_ACCESS_KEY': 'secret'})
+    @mock.patch('ecosystem_cicd_tools.new_cicd.boto3.Session')
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.github.get_client')
+    def test_s3_resources_are_created_one_at_a_time(self, _, session):
+        creating = []
+        overlaps = []
+
+        def create_resource(*_, **__):
+            creating.append(1)
+            overlaps.append(len(creating))
+            time.sleep(0.05)
+            creating.pop()
+            return mock.Mock()
+
+        session.side_effect = lambda: mock.Mock(
+            resource=mock.Mock(side_effect=create_resource))
+        barrier = threading.Barrier(4, timeout=5)
+
+        def func(template, github_client, s3_client, *_):
+            # Every worker holds its resource until all of them have one.
+            barrier.wait()
+            return s3_client
+
+        resources = mod.map_plugins(
+            func, mod.plugins_json.JSON_TEMPLATE[:4], workers=4)
+
+        self.assertEqual(len(set(map(id, resources))), 4)
+        self.assertEqual(session.call_count, 4)
+        self.assertEqual(max(overlaps), 1)
+
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.s3.get_client')
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.github.get_client')
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.populate_plugin')
+    @mock.patch('ecosystem_cicd_tools.new_cicd.actions.plugins_json_updates.'
+                'get_s3_changes')
+    def test_update_plugins_json(self,
+                                 get_s3_changes,
+                                 populate_plugin,
+                                 *_):
+        templates = mod.plugins_json.JSON_TEMPLATE
+        previous = []
+        for template in templates[1:]:
+            plugin = dict(template, version='1.0.0', link='link', yaml='link',
+                          wagons=[])
+            previous.append(plugin)
+        get_s3_changes.return_value = None
+        populate_plugin.side_effect = \
+            lambda template, *_: dict(template, version='1.1.0')
+        probe = mock.Mock()
+        probe.newest_version.side_effect = lambda _, repository_name: \
+            '1.1.0' if repository_name == templates[2]['name'] else '1.0.0'
+
+        result, report = mod.update_plugins_json(previous, probe=probe)
+
+        self.assertEqual([p['title'] for p in result],
+                         [t['title'] for t in templates])
+        self.assertEqual(
+            sorted(p['title'] for p in report['updated']),
+            sorted([templates[0]['title'], templates[2]['title']]))
+        self.assertEqual(result[1]['link'], 'link')
+        self.assertEqual(result[2]['version'], '1.1.0')
+        self.assertEqual(populate_plugin.call_count, 2)
+        probe.save.assert_called_once_with()
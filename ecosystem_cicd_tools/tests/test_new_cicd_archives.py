@@ -0,0 +1,78 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from ..new_cicd import archives as mod
+
+
+class TestNewArchives(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.build_dir = os.path.join(self.tempdir, 'build')
+        os.makedirs(os.path.join(self.build_dir, 'foo'))
+        for name in ['foo/foo.wgn', 'foo/plugin.yaml']:
+            with open(os.path.join(self.build_dir, name), 'w') as outfile:
+                outfile.write(name)
+
+    def _build(self, **compression):
+        path = mod.get_archive_path(
+            self.tempdir, 'bundle', compression.get('compression'))
+        with mod.BundleArchive(
+                path, 'bundle', json.dumps, **compression) as archive:
+            archive.add_plugin(
+                self.build_dir, 'foo/foo.wgn', 'foo/plugin.yaml')
+        return path
+
+    def _check(self, path):
+        with tarfile.open(path) as tar:
+            self.assertEqual(
+                sorted(tar.getnames()),
+                ['bundle', 'bundle/METADATA', 'bundle/foo',
+                 'bundle/foo/foo.wgn', 'bundle/foo/plugin.yaml'])
+            metadata = json.load(tar.extractfile('bundle/METADATA'))
+            self.assertEqual(metadata, {'foo/foo.wgn': 'foo/plugin.yaml'})
+            self.assertEqual(
+                tar.extractfile('bundle/foo/foo.wgn').read(), b'foo/foo.wgn')
+
+    def test_gz(self):
+        path = self._build(compression='gz', level=1)
+        self.assertTrue(path.endswith('bundle.tgz'))
+        self._check(path)
+        # Archived files don't stay in the build directory.
+        self.assertEqual(os.listdir(os.path.join(self.build_dir, 'foo')), [])
+
+    def test_xz(self):
+        self._check(self._build(compression='xz'))
+
+    @unittest.skipUnless(shutil.which('pigz'), 'pigz is not installed')
+    def test_pigz(self):
+        self._check(self._build(compression='pigz', threads=2))
+
+    def test_abort_removes_partial_archive(self):
+        path = mod.get_archive_path(self.tempdir, 'bundle', 'gz')
+
+        def build():
+            with mod.BundleArchive(path, 'bundle', json.dumps):
+                raise RuntimeError('download failed')
+        self.assertRaises(RuntimeError, build)
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,75 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import mock
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from ..new_cicd import bundles as mod
+
+URL = 'http://repository.cloudifysource.org/cloudify/wagons/foo/1.0/{}'
+MAPPINGS = {
+    URL.format('foo-centos-Core.wgn'): URL.format('plugin.yaml'),
+    URL.format('foo-redhat-Maipo.wgn'): URL.format('plugin.yaml'),
+    URL.format('foo-centos-altarch.wgn'): None,
+}
+
+
+def fake_download(local_path, remote_path, config=None, s3=None):
+    with open(local_path, 'w') as outfile:
+        outfile.write(remote_path)
+
+
+@mock.patch('ecosystem_cicd_tools.new_cicd.bundles.s3.get_client',
+            side_effect=lambda: mock.Mock())
+@mock.patch('ecosystem_cicd_tools.new_cicd.bundles.s3.download_from_s3',
+            side_effect=fake_download)
+class TestNewBundles(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+    def test_shared_yaml_is_downloaded_once(self, download, get_client):
+        list(mod.fetch_wagons_and_yamls(MAPPINGS, self.tempdir, workers=4))
+        keys = sorted(c[0][1] for c in download.call_args_list)
+        self.assertEqual(keys, [
+            'cloudify/wagons/foo/1.0/foo-centos-Core.wgn',
+            'cloudify/wagons/foo/1.0/foo-redhat-Maipo.wgn',
+            'cloudify/wagons/foo/1.0/plugin.yaml',
+        ])
+        self.assertTrue(download.call_args[1]['config'].use_threads)
+        # Every download uses the boto3 resource of its worker thread.
+        resources = [c[1]['s3'] for c in download.call_args_list]
+        self.assertTrue(all(resources))
+        self.assertLessEqual(get_client.call_count, 3)
+        self.assertEqual(len(set(map(id, resources))),
+                         get_client.call_count)
+
+    def test_package_archive(self, *_):
+        tar_path = mod.package_archive(
+            MAPPINGS, directory=self.tempdir, compression='gz')
+        self.assertTrue(tar_path.endswith('cloudify-plugins-bundle.tgz'))
+        with tarfile.open(tar_path) as tar:
+            names = tar.getnames()
+            metadata = json.load(tar.extractfile(
+                'cloudify-plugins-bundle/METADATA'))
+        self.assertEqual(len(metadata), 2)
+        for path in list(metadata) + list(metadata.values()):
+            self.assertIn('cloudify-plugins-bundle/' + path, names)
+        self.assertFalse(any('.downloads' in name for name in names))
@@ -0,0 +1,197 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import mock
+import shutil
+import hashlib
+import tempfile
+import unittest
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from ..new_cicd import cache as mod
+
+
+class ArtifactHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        body = self.server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            self.wfile.write(b'not found')
+            return
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+class FakeS3Object(object):
+
+    def __init__(self, key, body, multipart=False, encryption=None):
+        self.bucket_name = 'bucket'
+        self.key = key
+        self.body = body
+        self.downloads = 0
+        self.server_side_encryption = encryption
+        self.sse_customer_algorithm = None
+        self.e_tag = '"{}{}"'.format(
+            hashlib.md5(body).hexdigest(), '-2' if multipart else '')
+
+    def download_file(self, path, **_):
+        self.downloads += 1
+        with open(path, 'wb') as f:
+            f.write(self.body)
+
+
+class TestArtifactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.cache = mod.ArtifactCache(
+            os.path.join(self.tempdir, 'cache'), max_bytes=1024)
+        self.server = HTTPServer(('127.0.0.1', 0), ArtifactHandler)
+        self.server.files = {'/foo.wgn': b'foo'}
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def _url(self, path):
+        return 'http://127.0.0.1:{}{}'.format(
+            self.server.server_address[1], path)
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_fetch_url_revalidates(self):
+        destination = os.path.join(self.tempdir, 'foo.wgn')
+        self.cache.fetch_url(self._url('/foo.wgn'), destination)
+        self.assertEqual(self._read(destination), b'foo')
+        os.remove(destination)
+        self.cache.fetch_url(self._url('/foo.wgn'), destination)
+        self.assertEqual(self._read(destination), b'foo')
+        self.assertNotIn('If-None-Match', self.server.requests[0])
+        self.assertEqual(self.server.requests[1]['If-None-Match'],
+                         '"{}"'.format(hashlib.md5(b'foo').hexdigest()))
+
+    def test_fetch_url_changed(self):
+        destination = os.path.join(self.tempdir, 'foo.wgn')
+        self.cache.fetch_url(self._url('/foo.wgn'), destination)
+        self.server.files['/foo.wgn'] = b'bar'
+        self.cache.fetch_url(self._url('/foo.wgn'), destination)
+        self.assertEqual(self._read(destination), b'bar')
+
+    def test_fetch_url_error_not_cached(self):
+        destination = os.path.join(self.tempdir, 'bar.wgn')
+        self.cache.fetch_url(self._url('/bar.wgn'), destination)
+        self.assertIsNone(self.cache.lookup(self._url('/bar.wgn')))
+        self.assertEqual(os.listdir(self.cache.blobs_dir), [])
+
+    def test_fetch_s3(self):
+        s3_object = FakeS3Object('foo.wgn', b'foo')
+        for name in ['a.wgn', 'b.wgn']:
+            destination = os.path.join(self.tempdir, name)
+            self.cache.fetch_s3(s3_object, destination)
+            self.assertEqual(self._read(destination), b'foo')
+        self.assertEqual(s3_object.downloads, 1)
+
+    def test_fetch_s3_reuses_blob_from_url(self):
+        self.cache.fetch_url(self._url('/foo.wgn'),
+                             os.path.join(self.tempdir, 'a.wgn'))
+        s3_object = FakeS3Object('foo.wgn', b'foo')
+        self.cache.fetch_s3(s3_object, os.path.join(self.tempdir, 'b.wgn'))
+        self.assertEqual(s3_object.downloads, 0)
+        multipart = FakeS3Object('foo.wgn', b'foo', multipart=True)
+        self.cache.fetch_s3(multipart, os.path.join(self.tempdir, 'c.wgn'))
+        self.assertEqual(multipart.downloads, 1)
+        kms = FakeS3Object('bar.wgn', b'foo', encryption='aws:kms')
+        self.cache.fetch_s3(kms, os.path.join(self.tempdir, 'd.wgn'))
+        self.assertEqual(kms.downloads, 1)
+
+    def test_get_etag_md5(self):
+        md5 = hashlib.md5(b'foo').hexdigest()
+        self.assertEqual(
+            mod.get_etag_md5(FakeS3Object('foo', b'foo')), md5)
+        self.assertEqual(mod.get_etag_md5(
+            FakeS3Object('foo', b'foo', encryption='AES256')), md5)
+        self.assertIsNone(mod.get_etag_md5(
+            FakeS3Object('foo', b'foo', multipart=True)))
+        self.assertIsNone(mod.get_etag_md5(
+            FakeS3Object('foo', b'foo', encryption='aws:kms')))
+        sse_c = FakeS3Object('foo', b'foo', encryption='AES256')
+        sse_c.sse_customer_algorithm = 'AES256'
+        self.assertIsNone(mod.get_etag_md5(sse_c))
+
+    def test_fetch_url_blob_evicted_after_lookup(self):
+        destination = os.path.join(self.tempdir, 'foo.wgn')
+        self.cache.fetch_url(self._url('/foo.wgn'), destination)
+        ref = self.cache.lookup(self._url('/foo.wgn'))
+        os.remove(os.path.join(self.cache.blobs_dir, ref['md5']))
+        with mock.patch.object(self.cache, 'lookup', side_effect=[ref, None]):
+            self.cache.fetch_url(self._url('/foo.wgn'), destination)
+        self.assertEqual(self._read(destination), b'foo')
+        self.assertEqual(self.server.requests[1]['If-None-Match'],
+                         ref['etag'])
+        self.assertNotIn('If-None-Match', self.server.requests[2])
+
+    def test_fetch_s3_blob_evicted_after_lookup(self):
+        s3_object = FakeS3Object('foo.wgn', b'foo')
+        destination = os.path.join(self.tempdir, 'foo.wgn')
+        self.cache.fetch_s3(s3_object, destination)
+        ref = self.cache.lookup('s3://bucket/foo.wgn')
+        os.remove(os.path.join(self.cache.blobs_dir, ref['md5']))
+        with mock.patch.object(self.cache, 'lookup', return_value=ref):
+            self.cache.fetch_s3(s3_object, destination)
+        self.assertEqual(self._read(destination), b'foo')
+        self.assertEqual(s3_object.downloads, 2)
+
+    def test_evict_least_recently_used(self):
+        objects = [FakeS3Object(str(n), str(n).encode() * 400)
+                   for n in range(3)]
+        for s3_object in objects[:2]:
+            self.cache.fetch_s3(s3_object, os.path.join(self.tempdir, 'x'))
+        blob = os.path.join(
+            self.cache.blobs_dir, objects[0].e_tag.strip('"'))
+        os.utime(blob, (0, 0))
+        self.cache.fetch_s3(objects[1], os.path.join(self.tempdir, 'x'))
+        self.cache.fetch_s3(objects[2], os.path.join(self.tempdir, 'x'))
+        self.assertLessEqual(self.cache.size(), 1024)
+        self.assertIsNone(self.cache.lookup('s3://bucket/0'))
+        self.assertIsNotNone(self.cache.lookup('s3://bucket/1'))
+        self.assertIsNotNone(self.cache.lookup('s3://bucket/2'))
+
+    def test_blob_bigger_than_max_bytes(self):
+        s3_object = FakeS3Object('big', b'x' * 2048)
+        destination = os.path.join(self.tempdir, 'big')
+        self.cache.fetch_s3(s3_object, destination)
+        self.assertEqual(os.path.getsize(destination), 2048)
+        self.assertEqual(self.cache.size(), 0)
@@ -15,8 +15,13 @@
 
 import os
 import mock
+import shutil
+import hashlib
+import tempfile
 import unittest
 
+import requests
+
 from ..new_cicd import github as mod
 
 
@@ -71,3 +76,166 @@ class TestNewGithub(unittest.TestCase):
         release_mock.delete_release.assert_called()
         repo_mock.get_git_ref.assert_called_with('tags/0.0.2')
         ref_mock.delete.assert_called()
+
+    def test_delete_release_deletes_every_match(self, m):
+        repo_mock = mock.MagicMock()
+        repo_mock.get_releases.return_value = [
+            mock.Mock(id='foo', title='0.0.2', tag_name='0.0.2'),
+            mock.Mock(id='bar', title='0.0.1', tag_name='0.0.1'),
+            mock.Mock(id='baz', title='0.0.2', tag_name='0.0.2-old'),
+        ]
+        m.Commit.Commit = mockCommit
+        mod.delete_release('0.0.2',
+                           repository=repo_mock,
+                           github_client=mock.Mock())
+        self.assertEqual(
+            [c[0][0] for c in repo_mock.get_release.call_args_list],
+            ['foo', 'baz'])
+        self.assertEqual(
+            [c[0][0] for c in repo_mock.get_git_ref.call_args_list],
+            ['tags/0.0.2', 'tags/0.0.2-old'])
+
+
+class TestReleaseAssetSync(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.assets = {}
+        for name in ['foo.wgn', 'bar.wgn', 'plugin.yaml']:
+            path = os.path.join(self.tempdir, name)
+            with open(path, 'w') as f:
+                f.write(name)
+            self.assets[name] = path
+
+    def _asset(self, name, content=None, state='uploaded'):
+        content = (content or name).encode('utf-8')
+        asset = mock.Mock(state=state, size=len(content))
+        asset.name = name
+        asset.label = name
+        asset.digest = 'sha256:{}'.format(
+            hashlib.sha256(content).hexdigest())
+        return asset
+
+    def test_sync(self):
+        up_to_date = self._asset('foo.wgn')
+        changed = self._asset('bar.wgn', 'old content')
+        release = mock.Mock()
+        release.get_assets.return_value = [up_to_date, changed]
+        mod.sync_release_assets(release, self.assets)
+        release.get_assets.assert_called_once_with()
+        up_to_date.delete_asset.assert_not_called()
+        changed.delete_asset.assert_called_once_with()
+        self.assertEqual(
+            sorted(c[0] for c in release.upload_asset.call_args_list),
+            [(self.assets['bar.wgn'], 'bar.wgn'),
+             (self.assets['plugin.yaml'], 'plugin.yaml')])
+
+    def test_sync_without_digest(self):
+        asset = mock.Mock(spec=['state', 'size', 'name', 'label',
+                                'delete_asset'],
+                          state='uploaded',
+                          size=len(b'foo.wgn'))
+        asset.name = asset.label = 'foo.wgn'
+        release = mock.Mock()
+        release.get_assets.return_value = [asset]
+        mod.sync_release_assets(release, {'foo.wgn': self.assets['foo.wgn']})
+        asset.delete_asset.assert_called_once_with()
+        release.upload_asset.assert_called_once_with(
+            self.assets['foo.wgn'], 'foo.wgn')
+
+    def test_retries(self):
+        partial = self._asset('foo.wgn', state='starter')
+        release = mock.Mock()
+        release.get_assets.side_effect = [[], [partial]]
+        release.upload_asset.side_effect = [
+            requests.exceptions.ConnectionError(), mock.Mock()]
+        sync = mod.ReleaseAssetSync(release, retries=1, delay=0)
+        sync.sync({'foo.wgn': self.assets['foo.wgn']})
+        self.assertEqual(release.upload_asset.call_count, 2)
+        partial.delete_asset.assert_called_once_with()
+
+    def test_retries_are_bounded(self):
+        release = mock.Mock()
+        release.get_assets.return_value = []
+        release.upload_asset.side_effect = \
+            requests.exceptions.ConnectionError()
+        sync = mod.ReleaseAssetSync(release, retries=2, delay=0)
+        self.assertRaises(requests.exceptions.ConnectionError,
+                          sync.sync,
+                          {'foo.wgn': self.assets['foo.wgn']})
+        self.assertEqual(release.upload_asset.call_count, 3)
+
+
+class TestListRecentReleases(unittest.TestCase):
+
+    def test_list_recent_releases(self):
+        session = mock.Mock()
+        session.get.return_value.status_code = 200
+        session.get.return_value.headers = {'ETag': '"a"'}
+        session.get.return_value.json.return_value = [
+            {'name': '1.1'}, {'name': '1.0'}]
+        self.assertEqual(
+            mod.list_recent_releases('org', 'repo', session=session),
+            ('"a"', ['1.1', '1.0']))
+        session.get.return_value.status_code = 304
+        self.assertEqual(
+            mod.list_recent_releases('org', 'repo', '"a"', session),
+            ('"a"', None))
+        self.assertEqual(
+            session.get.call_args[1]['headers']['If-None-Match'], '"a"')
+
+
+class TestReleaseIndex(unittest.TestCase):
+
+    def _repository(self, titles):
+        repository = mock.Mock()
+        repository.full_name = 'org/{}'.format(id(repository))
+        self.read = []
+
+        def get_releases():
+            for title in titles:
+                self.read.append(title)
+                release = mock.Mock()
+                release.title = title
+                yield release
+
+        repository.get_releases.side_effect = get_releases
+        return repository
+
+    def test_version_key(self):
+        self.assertLess(mod.version_key('1.9.0'), mod.version_key('1.10.0'))
+        self.assertLess(mod.version_key('v1.2.3'), mod.version_key('1.2.3.1'))
+        self.assertIsNone(mod.version_key('latest'))
+        self.assertIsNone(mod.version_key(None))
+
+    def test_most_recent_stops_early(self):
+        titles = ['latest', '2.0.1', '1.9.5', '2.1.0', '1.9.4', '1.9.3',
+                  '1.9.2', '1.0.0']
+        index = mod.ReleaseIndex(self._repository(titles), patience=2)
+        self.assertEqual(index.most_recent(), '2.1.0')
+        self.assertEqual(self.read, titles[:6])
+        self.assertEqual(index.get('1.0.0').title, '1.0.0')
+        self.assertIsNone(index.get('3.0.0'))
+        self.assertEqual(self.read, titles)
+
+    def test_most_recent_reads_all(self):
+        titles = ['1.0.0'] + ['1.0.{}'.format(n) for n in range(5)] + \
+            ['1.1.0']
+        index = mod.ReleaseIndex(self._repository(titles))
+        self.assertEqual(index.most_recent(), '1.1.0')
+        self.assertEqual(self.read, titles)
+        self.assertEqual(
+            mod.ReleaseIndex(self._repository(['latest'])).most_recent(),
+            'latest')
+
+    def test_index_is_shared(self):
+        repository = self._repository(['1.0.0', 'latest'])
+        self.assertEqual(mod.get_most_recent_release(repository), '1.0.0')
+        self.assertEqual(mod.get_most_recent_release(repository), '1.0.0')
+        self.assertEqual(repository.get_releases.call_count, 1)
+        self.assertIs(mod.get_release_index(repository).get('latest'),
+                      mod.get_release_index(repository).releases['latest'])
+        mod.forget_release_index(repository)
+        mod.get_most_recent_release(repository)
+        self.assertEqual(repository.get_releases.call_count, 2)
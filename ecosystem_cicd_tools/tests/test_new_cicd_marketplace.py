@@ -13,21 +13,38 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import io
-import os
-import json
 import mock
 import unittest
+import threading
 
 from ..new_cicd import marketplace as mod
 
 
-@mock.patch('ecosystem_cicd_tools.utils.urllib.request.urlopen')
+class FakeResponse(object):
+
+    def __init__(self, body, status_code=200, etag=None):
+        self.body = body
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {'ETag': etag} if etag else {}
+
+    def json(self):
+        return self.body
+
+
 class TestNewMarketplace(unittest.TestCase):
 
-    @staticmethod
-    def get_resp(json_resp):
-        return io.StringIO(json.dumps(json_resp))
+    def setUp(self):
+        self.client = mod.MarketplaceClient()
+        self.client.session = mock.Mock()
+        patcher = mock.patch(
+            'ecosystem_cicd_tools.new_cicd.marketplace.get_client',
+            return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def requested_urls(self):
+        return [c[0][0] for c in self.client.session.get.call_args_list]
 
     @mock.patch('ecosystem_cicd_tools.utils.requests')
     def test_delete_node_type(self, m, *_):
@@ -43,8 +60,8 @@ class TestNewMarketplace(unittest.TestCase):
         m.delete.assert_called_with(
             'https://marketplace.cloudify.co/plugins/foo/bar')
 
-    def test_get_plugin_id(self, m):
-        m.return_value = self.get_resp(
+    def test_get_plugin_id(self):
+        self.client.session.get.return_value = FakeResponse(
             {
                 'status': 200,
                 'items': [
@@ -55,18 +72,12 @@ class TestNewMarketplace(unittest.TestCase):
             }
         )
         result = mod.get_plugin_id('foo')
-        expected = {
-            'url': 'https://marketplace.cloudify.co/plugins?name=foo',
-        }
-        m.assert_called_with(**expected)
+        self.assertEqual(self.requested_urls(),
+                         ['https://marketplace.cloudify.co/plugins?name=foo'])
         assert result == 'bar'
 
-    @mock.patch(
-        'ecosystem_cicd_tools.new_cicd.marketplace'
-        '.urllib.request.urlopen')
-    def test_list_versions(self, *_):
-        m = _[1]
-        m.return_value = self.get_resp(
+    def test_list_versions(self):
+        self.client.session.get.return_value = FakeResponse(
             {
                 'status': 200,
                 'items': [
@@ -87,11 +98,11 @@ class TestNewMarketplace(unittest.TestCase):
         )
         result = mod.list_versions('foo')
         expected = 'https://marketplace.cloudify.co/plugins/foo/versions'
-        m.assert_called_with(expected)
+        self.assertEqual(self.requested_urls(), [expected])
         assert result == ['0.100.0', '1.0.1', '2.0.0']
 
-    def test_get_node_types_diff(self, m):
-        old_resp = self.get_resp(
+    def test_get_node_types_diff(self):
+        old_resp = FakeResponse(
             {
                 'status': 200,
                 'items': [
@@ -106,7 +117,7 @@ class TestNewMarketplace(unittest.TestCase):
                 ]
             }
         )
-        new_resp = self.get_resp(
+        new_resp = FakeResponse(
             {
                 'status': 200,
                 'items': [
@@ -125,25 +136,104 @@ class TestNewMarketplace(unittest.TestCase):
                 ]
             }
         )
-        m.side_effect = [old_resp, new_resp]
+        old_expected = 'https://marketplace.cloudify.co/node-types?' \
+                       'plugin_name=foo&plugin_version=0.0.1'
+        new_expected = 'https://marketplace.cloudify.co/node-types?' \
+                       'plugin_name=foo&plugin_version=0.0.2'
+        self.client.session.get.side_effect = \
+            lambda url, **_: {old_expected: old_resp,
+                              new_expected: new_resp}[url]
         result = mod.get_node_types_diff('foo', '0.0.1', '0.0.2')
-        old_expected = {
-            'url': 'https://marketplace.cloudify.co/node-types?'
-                   '&plugin_name=foo&plugin_version=0.0.1'
-        }
-        new_expected = {
-            'url': 'https://marketplace.cloudify.co/node-types?'
-                   '&plugin_name=foo&plugin_version=0.0.2'
-        }
-        m.assert_has_calls(
-            [
-                mock.call(**old_expected),
-                mock.call(**new_expected)
-            ]
-        )
+        self.assertEqual(sorted(self.requested_urls()),
+                         [old_expected, new_expected])
         assert result == {
             'baz': {
                 'type': 'baz',
                 'derived_from': 'zerosandones'
             }
         }
+
+    def test_cache_and_revalidation(self):
+        self.client.session.get.return_value = FakeResponse(
+            {'items': [{'id': 'bar'}]}, etag='"1"')
+        mod.get_plugin_id('foo')
+        mod.get_plugin_id('foo')
+        self.assertEqual(self.client.session.get.call_count, 1)
+
+        self.client.ttl = 0
+        self.client.session.get.return_value = FakeResponse(None, 304)
+        self.assertEqual(mod.get_plugin_id('foo'), 'bar')
+        self.assertEqual(
+            self.client.session.get.call_args[1]['headers'],
+            {'If-None-Match': '"1"'})
+
+    def test_fresh_revalidates_within_ttl(self):
+        self.client.session.get.return_value = FakeResponse(
+            {'items': []}, etag='"1"')
+        self.assertEqual(mod.get_assets('foo', '1.0'), [])
+        self.client.session.get.return_value = FakeResponse(
+            {'items': [{'id': 'bar'}]}, etag='"2"')
+        self.assertEqual(mod.get_plugin_id('foo'), None)
+        self.assertEqual(mod.get_plugin_id('foo', fresh=True), 'bar')
+        self.assertEqual(self.client.session.get.call_count, 2)
+        self.assertEqual(
+            self.client.session.get.call_args[1]['headers'],
+            {'If-None-Match': '"1"'})
+
+    @mock.patch('ecosystem_cicd_tools.utils.requests')
+    def test_delete_invalidates_after_the_request(self, m):
+        self.client.session.get.return_value = FakeResponse(
+            {'items': [{'id': 'bar'}]})
+
+        def delete(*_, **__):
+            # A concurrent read while the delete is in flight.
+            mod.get_plugin_id('foo')
+            return mock.Mock()
+
+        m.delete.side_effect = delete
+        mod.delete_plugin_version('bar', '1.0')
+        mod.get_plugin_id('foo')
+        self.assertEqual(self.client.session.get.call_count, 2)
+
+    def test_failed_requests_are_not_cached(self):
+        self.client.session.get.return_value = FakeResponse({}, 404)
+        self.assertEqual(mod.list_versions('foo'), [])
+        self.assertEqual(mod.list_versions('foo'), [])
+        self.assertEqual(self.client.session.get.call_count, 2)
+
+    def test_pagination(self):
+        pages = {
+            'https://marketplace.cloudify.co/plugins/foo/versions':
+                {'items': [{'version': '1.0.0'}],
+                 'pagination': {'total': 2, 'offset': 0, 'size': 1}},
+            'https://marketplace.cloudify.co/plugins/foo/versions?_offset=1':
+                {'items': [{'version': '2.0.0'}],
+                 'pagination': {'total': 2, 'offset': 1, 'size': 1}},
+        }
+        self.client.session.get.side_effect = \
+            lambda url, **_: FakeResponse(pages[url])
+        self.assertEqual(mod.list_versions('foo'), ['1.0.0', '2.0.0'])
+
+    def test_concurrent_requests_are_coalesced(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def get(url, **_):
+            started.set()
+            release.wait(5)
+            return FakeResponse({'items': [{'id': 'bar'}]})
+
+        self.client.session.get.side_effect = get
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(mod.get_plugin_id('foo')))
+            for _ in range(3)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ['bar'] * 3)
+        self.assertEqual(self.client.session.get.call_count, 1)
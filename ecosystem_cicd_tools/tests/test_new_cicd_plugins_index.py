@@ -0,0 +1,139 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from ..new_cicd import plugins_index as mod
+
+URL = 'http://repository.cloudifysource.org/cloudify/wagons/{}/{}/{}'
+
+
+def wagon(distro, version, filename):
+    url = URL.format('cloudify-foo-plugin', version, filename)
+    return {'name': distro, 'url': url, 'md5url': url + '.md5'}
+
+
+def plugin(name, version, title='Foo'):
+    return {
+        'name': name,
+        'title': title,
+        'version': version,
+        'link': URL.format(name, version, 'plugin.yaml'),
+        'wagons': [
+            wagon(mod.CENTOS, version,
+                  'foo-{}-centos-Core-py36-none-linux_x86_64.wgn'.format(
+                      version)),
+            wagon(mod.REDHAT8, version,
+                  'foo-{}-redhat-Ootpa-py36-none-linux_x86_64.wgn'.format(
+                      version)),
+        ],
+    }
+
+
+class TestPluginsIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.plugins = [plugin('cloudify-foo-plugin', '1.0'),
+                        plugin('cloudify-foo-plugin', '2.0'),
+                        plugin('cloudify-bar-plugin', '1.0', 'Bar')]
+        self.index = mod.PluginsIndex(self.plugins)
+
+    def test_get_wagon_distro(self):
+        self.assertEqual(
+            mod.get_wagon_distro('foo-1.0-centos-Core-py36-none-'
+                                 'linux_x86_64.wgn'),
+            mod.CENTOS)
+        self.assertEqual(
+            mod.get_wagon_distro('foo-1.0-centos-Core-py36-none-'
+                                 'linux_aarch64.wgn.md5'),
+            mod.ARM64)
+        self.assertEqual(
+            mod.get_wagon_distro('http://host/centos-Core/'
+                                 'foo-1.0-redhat-Maipo-py36.wgn'),
+            mod.REDHAT)
+        self.assertIsNone(mod.get_wagon_distro('plugin.yaml'))
+
+    def test_lookups(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertIn('cloudify-bar-plugin', self.index)
+        self.assertEqual(self.index.get('cloudify-foo-plugin').version, '1.0')
+        self.assertIs(self.index.get('cloudify-foo-plugin', '2.0').data,
+                      self.plugins[1])
+        self.assertIsNone(self.index.get('cloudify-foo-plugin', '3.0'))
+        self.assertEqual(
+            [r.version for r in self.index.find('cloudify-foo-plugin')],
+            ['1.0', '2.0'])
+        self.assertIs(
+            self.index.wagon('cloudify-foo-plugin', '2.0', mod.REDHAT8),
+            self.plugins[1]['wagons'][1])
+        self.assertIsNone(
+            self.index.wagon('cloudify-foo-plugin', '2.0', mod.ARM64))
+        self.assertEqual(
+            [r.name for r in self.index.with_titles(['bar'])],
+            ['cloudify-bar-plugin'])
+
+    def test_add(self):
+        data = plugin('cloudify-baz-plugin', '1.0')
+        self.index.add(data)
+        self.assertIs(self.index.to_list()[-1], data)
+        self.assertIs(self.index.get('cloudify-baz-plugin').data, data)
+
+    def test_update_assets(self):
+        record = self.index.get('cloudify-foo-plugin', '2.0')
+        record.data['version'] = '2.1'
+        core = 'foo-2.1-centos-Core-py36-none-linux_x86_64.wgn'
+        record.update_assets([
+            URL.format('cloudify-foo-plugin', '2.1', 'plugin.yaml'),
+            URL.format('cloudify-foo-plugin', '2.1', core),
+            URL.format('cloudify-foo-plugin', '2.1', core + '.md5'),
+            URL.format('cloudify-foo-plugin', '2.1',
+                       'foo-2.1-redhat-Maipo-py36-none-linux_x86_64.wgn'),
+        ])
+        # Maipo has no md5 and the old Ootpa wagon is another version.
+        self.assertEqual(self.plugins[1]['wagons'],
+                         [wagon(mod.CENTOS, '2.1', core)])
+        self.assertTrue(self.plugins[1]['link'].endswith('2.1/plugin.yaml'))
+        self.assertEqual(list(record.wagons), [mod.CENTOS])
+
+
+class TestLoadPluginsJson(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, 'plugins.json')
+        self._write([plugin('cloudify-foo-plugin', '1.0')])
+
+    def _write(self, plugins):
+        with open(self.path, 'w') as f:
+            json.dump(plugins, f)
+        os.utime(self.path, ns=(0, len(plugins)))
+
+    def test_load_is_cached_and_copied(self):
+        plugins = mod.load_plugins_json(self.path)
+        plugins[0]['version'] = '9.9'
+        self.assertEqual(mod.load_plugins_json(self.path)[0]['version'],
+                         '1.0')
+        self._write([plugin('cloudify-foo-plugin', '1.0'),
+                     plugin('cloudify-bar-plugin', '1.0')])
+        self.assertEqual(len(mod.get_plugins_index(self.path)), 2)
+
+    def test_default_resources(self):
+        index = mod.get_plugins_index()
+        self.assertIn('cloudify-aws-plugin', index)
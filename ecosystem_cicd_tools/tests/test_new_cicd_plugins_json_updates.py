@@ -0,0 +1,120 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import mock
+import shutil
+import tempfile
+import unittest
+
+from ..new_cicd import plugins_json_updates as mod
+from ..new_cicd.plugins_index import PluginRecord
+
+NAME = 'cloudify-foo-plugin'
+WAGON = 'foo-1.0.0-centos-Core-py36-none-linux_x86_64.wgn'
+
+
+def url(filename, version='1.0.0'):
+    return mod.s3.URL_TEMPLATE.format(NAME, version, filename)
+
+
+def record(version='1.0.0'):
+    return PluginRecord({
+        'name': NAME,
+        'title': 'Foo',
+        'version': version,
+        'link': url('plugin.yaml', version),
+        'yaml': url('plugin.yaml', version),
+        'wagons': [
+            {'name': 'Centos Core',
+             'url': url(WAGON, version),
+             'md5url': url(WAGON + '.md5', version)},
+            {'name': 'Redhat Maipo', 'url': None, 'md5url': None},
+        ],
+    })
+
+
+@mock.patch('ecosystem_cicd_tools.new_cicd.plugins_json_updates.github.'
+            'list_recent_releases')
+class TestReleaseProbe(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, 'state.json')
+
+    def test_newest_version_uses_etag(self, list_recent_releases):
+        list_recent_releases.return_value = (
+            '"a"', ['1.10.0', 'latest', '1.9.0', '1.11', 'nightly', None])
+        probe = mod.ReleaseProbe(self.path)
+        self.assertEqual(probe.newest_version('org', NAME), '1.10.0')
+        probe.save()
+        list_recent_releases.return_value = ('"a"', None)
+        probe = mod.ReleaseProbe(self.path)
+        self.assertEqual(probe.newest_version('org', NAME), '1.10.0')
+        list_recent_releases.assert_called_with('org', NAME, '"a"', None)
+
+
+@mock.patch('ecosystem_cicd_tools.new_cicd.plugins_json_updates.s3.'
+            'get_assets')
+class TestUpdateReason(unittest.TestCase):
+
+    def test_unchanged(self, get_assets):
+        get_assets.return_value = ['plugin.yaml', WAGON, WAGON + '.md5',
+                                   'v2_plugin.yaml']
+        self.assertIsNone(
+            mod.get_update_reason(record(), '1.0.0', 'plugin.yaml'))
+        self.assertIsNone(
+            mod.get_update_reason(record(), '0.9.0', 'plugin.yaml'))
+
+    def test_new_release(self, get_assets):
+        self.assertEqual(
+            mod.get_update_reason(record(), '1.1.0', 'plugin.yaml'),
+            'version 1.1.0 was released')
+        self.assertEqual(
+            mod.get_update_reason(None, '1.1.0', 'plugin.yaml'),
+            'it is not published')
+        get_assets.assert_not_called()
+
+    def test_s3_changes(self, get_assets):
+        redhat = WAGON.replace('centos-Core', 'redhat-Maipo')
+        get_assets.return_value = ['plugin.yaml', WAGON, WAGON + '.md5',
+                                   redhat, redhat + '.md5']
+        self.assertEqual(
+            mod.get_update_reason(record(), '1.0.0', 'plugin.yaml'),
+            'the wagons changed')
+        self.assertEqual(
+            mod.get_update_reason(record(), '1.0.0', 'v2_plugin.yaml'),
+            'the plugin YAML changed')
+
+    def test_reuse_plugin_and_report(self, _):
+        template = {'name': NAME, 'title': 'Foo', 'version': None,
+                    'description': 'New'}
+        reused = mod.reuse_plugin(template, record())
+        self.assertEqual(reused['description'], 'New')
+        self.assertEqual(reused['wagons'], record().data['wagons'])
+        updated = dict(reused, version='1.1.0')
+        removed = dict(record().data, title='Old')
+        report = mod.get_report([record().data, removed],
+                                [updated],
+                                ['version 1.1.0 was released'])
+        self.assertEqual(report['updated'], [{
+            'name': NAME,
+            'title': 'Foo',
+            'previous_version': '1.0.0',
+            'version': '1.1.0',
+            'reason': 'version 1.1.0 was released'}])
+        self.assertEqual(report['unchanged'], [])
+        self.assertEqual(report['removed'], [{'name': NAME, 'title': 'Old'}])
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import mock
+import hashlib
 import unittest
 
 from ..new_cicd import s3 as mod
@@ -22,6 +23,35 @@ from ..new_cicd import s3 as mod
 @mock.patch('ecosystem_cicd_tools.new_cicd.s3.get_boto_service')
 class TestNewS3(unittest.TestCase):
 
+    def setUp(self):
+        mod.inventory.invalidate()
+        self.addCleanup(mod.inventory.invalidate)
+
+    def _bucket(self, s3, keys):
+        bucket = s3.Bucket.return_value
+        bucket.objects.filter.side_effect = lambda Prefix: [
+            mock.Mock(key=k) for k in keys if k.startswith(Prefix)]
+        return bucket
+
+    def test_get_asset_etags(self, m):
+        s3 = mock.Mock()
+        m.return_value = s3
+        bucket = self._bucket(s3, [])
+        prefix = 'cloudify/wagons/foo/1.0/'
+        bucket.objects.filter.side_effect = lambda Prefix: [
+            mock.Mock(key=prefix + 'foo.wgn', e_tag='"a"')]
+        self.assertEqual(mod.get_asset_etags('foo', '1.0'),
+                         {'foo.wgn': '"a"'})
+        mod.inventory.add(prefix + 'foo.wgn', '"b"')
+        mod.inventory.add(prefix + 'plugin.yaml')
+        self.assertEqual(mod.get_asset_etags('foo', '1.0'),
+                         {'foo.wgn': '"b"', 'plugin.yaml': None})
+        mod.inventory.discard(prefix + 'foo.wgn')
+        self.assertEqual(mod.get_asset_etags('foo', '1.0'),
+                         {'plugin.yaml': None})
+        bucket.objects.filter.assert_called_once_with(
+            Prefix='cloudify/wagons/foo/')
+
     def test_delete_object(self, m):
         delete = mock.MagicMock()
         bucket = mock.Mock()
@@ -43,3 +73,119 @@ class TestNewS3(unittest.TestCase):
         mod.delete_object_from_s3(object_name)
         s3.Bucket.assert_called_with(mod.BUCKET_NAME)
         bucket.delete_objects.assert_called_with(**expected)
+
+    def test_upload_content(self, m):
+        s3 = mock.Mock()
+        m.return_value = s3
+        mod.upload_content_to_s3('foo', 'foo.wgn.md5')
+        s3.Object.assert_called_with(mod.BUCKET_NAME, 'foo.wgn.md5')
+        s3.Object.return_value.put.assert_called_with(
+            Body=b'foo', ACL='public-read')
+
+    def test_get_object_md5_from_etag(self, m):
+        s3 = mock.Mock()
+        s3.Object.return_value.e_tag = '"{}"'.format('a' * 32)
+        s3.Object.return_value.server_side_encryption = None
+        s3.Object.return_value.sse_customer_algorithm = None
+        m.return_value = s3
+        self.assertEqual(mod.get_object_md5('foo.wgn'), 'a' * 32)
+        s3.Object.return_value.get.assert_not_called()
+
+    def test_get_object_md5_kms(self, m):
+        s3 = mock.Mock()
+        s3_object = s3.Object.return_value
+        s3_object.e_tag = '"{}"'.format('a' * 32)
+        s3_object.server_side_encryption = 'aws:kms'
+        s3_object.sse_customer_algorithm = None
+        s3_object.get.return_value = {'Body': mock.Mock()}
+        s3_object.get.return_value['Body'].iter_chunks.return_value = [
+            b'fo', b'o']
+        m.return_value = s3
+        self.assertEqual(mod.get_object_md5('foo.wgn'),
+                         hashlib.md5(b'foo').hexdigest())
+
+    def test_get_object_md5_multipart(self, m):
+        s3 = mock.Mock()
+        s3_object = s3.Object.return_value
+        s3_object.e_tag = '"{}-2"'.format('a' * 32)
+        s3_object.get.return_value = {'Body': mock.Mock()}
+        s3_object.get.return_value['Body'].iter_chunks.return_value = [
+            b'fo', b'o']
+        m.return_value = s3
+        self.assertEqual(mod.get_object_md5('foo.wgn'),
+                         hashlib.md5(b'foo').hexdigest())
+
+    def test_inventory_lists_each_plugin_once(self, m):
+        s3 = mock.Mock()
+        m.return_value = s3
+        bucket = self._bucket(s3, [
+            'cloudify/wagons/foo/1.0/foo.wgn',
+            'cloudify/wagons/foo/1.0/foo.wgn.md5',
+            'cloudify/wagons/foo/1.0/plugin.yaml',
+            'cloudify/wagons/foo/1.1/foo.wgn',
+            'cloudify/wagons/bar/1.0/bar.wgn',
+        ])
+        self.assertEqual(
+            mod.get_objects_in_key('foo', '1.0'),
+            ['cloudify/wagons/foo/1.0/foo.wgn',
+             'cloudify/wagons/foo/1.0/foo.wgn.md5',
+             'cloudify/wagons/foo/1.0/plugin.yaml'])
+        self.assertEqual(mod.get_assets('foo', '1.1'), ['foo.wgn'])
+        self.assertEqual(
+            mod.get_plugin_yaml_url('foo', 'plugin.yaml', '1.0'),
+            mod.URL_TEMPLATE.format('foo', '1.0', 'plugin.yaml'))
+        self.assertIsNone(
+            mod.get_plugin_yaml_url('foo', 'plugin.yaml', '1.1'))
+        bucket.objects.filter.assert_called_once_with(
+            Prefix='cloudify/wagons/foo/')
+
+        self.assertEqual(mod.get_assets('bar', '1.0'), ['bar.wgn'])
+        self.assertEqual(bucket.objects.filter.call_count, 2)
+
+    def test_inventory_whole_folder(self, m):
+        s3 = mock.Mock()
+        m.return_value = s3
+        bucket = self._bucket(s3, [
+            'cloudify/wagons/bar/1.0/bar.wgn',
+            'cloudify/wagons/foo/1.0/foo.wgn',
+        ])
+        self.assertEqual(
+            mod.get_objects_in_key(
+                filter_kwargs=dict(Prefix='cloudify/wagons/')),
+            ['cloudify/wagons/bar/1.0/bar.wgn',
+             'cloudify/wagons/foo/1.0/foo.wgn'])
+        self.assertEqual(mod.get_assets('foo', '1.0'), ['foo.wgn'])
+        bucket.objects.filter.assert_called_once_with(
+            Prefix='cloudify/wagons/')
+
+    def test_inventory_ttl(self, m):
+        s3 = mock.Mock()
+        m.return_value = s3
+        bucket = self._bucket(s3, ['cloudify/wagons/foo/1.0/foo.wgn'])
+        mod.get_assets('foo', '1.0')
+        mod.inventory.ttl = 0
+        self.addCleanup(setattr, mod.inventory, 'ttl', mod.INVENTORY_TTL)
+        mod.get_assets('foo', '1.0')
+        self.assertEqual(bucket.objects.filter.call_count, 2)
+
+    def test_inventory_write_through(self, m):
+        s3 = mock.Mock()
+        m.return_value = s3
+        self._bucket(s3, ['cloudify/wagons/foo/1.0/foo.wgn'])
+        self.assertEqual(mod.get_assets('foo', '1.0'), ['foo.wgn'])
+        mod.upload_content_to_s3('md5', 'cloudify/wagons/foo/1.0/foo.wgn.md5')
+        self.assertEqual(mod.get_assets('foo', '1.0'),
+                         ['foo.wgn', 'foo.wgn.md5'])
+        mod.delete_object_from_s3('cloudify/wagons/foo/1.0/foo.wgn')
+        self.assertEqual(mod.get_assets('foo', '1.0'), ['foo.wgn.md5'])
+
+    def test_other_prefixes_are_listed(self, m):
+        s3 = mock.Mock()
+        m.return_value = s3
+        bucket = self._bucket(s3, ['cloudify/7.0.0/ga-release/a.tar'])
+        for _ in range(2):
+            self.assertEqual(
+                mod.get_objects_in_key(
+                    filter_kwargs=dict(Prefix='cloudify/7.0.0/')),
+                ['cloudify/7.0.0/ga-release/a.tar'])
+        self.assertEqual(bucket.objects.filter.call_count, 2)
@@ -0,0 +1,169 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import mock
+import shutil
+import tempfile
+import unittest
+from threading import Lock
+
+from botocore.exceptions import ClientError
+
+from ..new_cicd import uploads as mod
+
+
+class FakeS3Client(object):
+
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.objects = {}
+        self.uploads = {}
+        self.uploaded_parts = []
+        self.acls = {}
+        self._lock = Lock()
+
+    def put_object(self, Bucket, Key, Body, ACL, **_):
+        self.objects[Key] = Body.read()
+        self.acls[Key] = ACL
+
+    def create_multipart_upload(self, Bucket, Key, ACL, **_):
+        upload_id = 'upload-{}'.format(len(self.uploads))
+        self.uploads[upload_id] = {}
+        self.acls[Key] = ACL
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_part:
+            raise ClientError({'Error': {'Code': '500'}}, 'UploadPart')
+        with self._lock:
+            self.uploads[UploadId][PartNumber] = Body
+            self.uploaded_parts.append(PartNumber)
+        return {'ETag': '"{}"'.format(PartNumber)}
+
+    def list_parts(self, Bucket, Key, UploadId, **_):
+        if UploadId not in self.uploads:
+            raise ClientError({'Error': {'Code': 'NoSuchUpload'}},
+                              'ListParts')
+        return {'Parts': [{'PartNumber': n, 'ETag': '"{}"'.format(n)}
+                          for n in self.uploads[UploadId]]}
+
+    def complete_multipart_upload(self,
+                                  Bucket,
+                                  Key,
+                                  UploadId,
+                                  MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b''.join(
+            parts[p['PartNumber']] for p in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+
+class TestNewUploads(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.journal = mod.UploadJournal(os.path.join(self.tempdir, 'j'))
+        self.path = os.path.join(self.tempdir, 'foo.wgn')
+        self.content = os.urandom(1000)
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+
+    def _upload(self, client):
+        mod.upload_file(client,
+                        self.path,
+                        'cloudify/wagons/foo/1.0/foo.wgn',
+                        journal=self.journal,
+                        threshold=100,
+                        chunksize=100)
+
+    def test_small_file(self):
+        client = FakeS3Client()
+        mod.upload_file(client, self.path, 'foo.wgn', journal=self.journal)
+        self.assertEqual(client.objects['foo.wgn'], self.content)
+        self.assertEqual(client.acls['foo.wgn'], 'public-read')
+        self.assertEqual(client.uploads, {})
+
+    def test_multipart(self):
+        client = FakeS3Client()
+        self._upload(client)
+        key = 'cloudify/wagons/foo/1.0/foo.wgn'
+        self.assertEqual(client.objects[key], self.content)
+        self.assertEqual(client.acls[key], 'public-read')
+        self.assertEqual(sorted(client.uploaded_parts), list(range(1, 11)))
+        self.assertEqual(os.listdir(self.journal.directory), [])
+
+    def test_resume(self):
+        client = FakeS3Client(fail_part=7)
+        self.assertRaises(ClientError, self._upload, client)
+        self.assertEqual(len(os.listdir(self.journal.directory)), 1)
+        done = set(client.uploaded_parts)
+        self.assertNotIn(7, done)
+
+        client.fail_part = None
+        client.uploaded_parts = []
+        self._upload(client)
+        self.assertEqual(set(client.uploaded_parts),
+                         set(range(1, 11)) - done)
+        self.assertEqual(client.objects['cloudify/wagons/foo/1.0/foo.wgn'],
+                         self.content)
+        self.assertEqual(os.listdir(self.journal.directory), [])
+
+    def test_changed_file_restarts(self):
+        client = FakeS3Client(fail_part=7)
+        self.assertRaises(ClientError, self._upload, client)
+        self.content = os.urandom(1100)
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        os.utime(self.path, (0, 0))
+        client.fail_part = None
+        client.uploaded_parts = []
+        self._upload(client)
+        self.assertEqual(sorted(client.uploaded_parts), list(range(1, 12)))
+        self.assertEqual(client.objects['cloudify/wagons/foo/1.0/foo.wgn'],
+                         self.content)
+        self.assertEqual(client.uploads, {})
+
+    @mock.patch('ecosystem_cicd_tools.new_cicd.s3.get_boto_service')
+    def test_upload_plugin_assets(self, get_boto_service):
+        client = FakeS3Client()
+        get_boto_service.return_value.meta.client = client
+        yaml_path = os.path.join(self.tempdir, 'plugin.yaml')
+        with open(yaml_path, 'w') as f:
+            f.write('plugins: {}')
+        with mock.patch.object(mod, 'JOURNAL_DIR', self.journal.directory):
+            mod.upload_plugin_assets_to_s3(
+                [self.path, yaml_path], 'foo', '1.0')
+        self.assertEqual(
+            sorted(client.objects),
+            ['cloudify/wagons/foo/1.0/foo.wgn',
+             'cloudify/wagons/foo/1.0/plugin.yaml'])
+        config = get_boto_service.call_args[1]['config']
+        self.assertEqual(config.max_pool_connections,
+                         mod.UPLOAD_WORKERS * mod.PART_CONCURRENCY)
+
+    @mock.patch('ecosystem_cicd_tools.new_cicd.s3.get_boto_service')
+    def test_upload_files_with_s3_resource(self, get_boto_service):
+        client = FakeS3Client()
+        with mock.patch.object(mod, 'JOURNAL_DIR', self.journal.directory):
+            mod.upload_files_to_s3(
+                {self.path: 'cloudify/wagons/foo/1.0/foo.wgn'},
+                s3_resource=mock.Mock(meta=mock.Mock(client=client)))
+        self.assertEqual(list(client.objects),
+                         ['cloudify/wagons/foo/1.0/foo.wgn'])
+        get_boto_service.assert_not_called()
@@ -0,0 +1,166 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import mock
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+from ..new_cicd import verification as mod
+
+ASSETS = ['foo.wgn', 'foo.wgn.md5', 'plugin.yaml', 'v2_plugin.yaml']
+MARKETPLACE_ASSETS = [
+    'https://github.com/org/foo-plugin/releases/download/1.0/foo.wgn',
+    'https://github.com/org/foo-plugin/releases/download/1.0/plugin.yaml',
+]
+
+
+@mock.patch('ecosystem_cicd_tools.new_cicd.verification.s3.'
+            'get_asset_etags')
+@mock.patch('ecosystem_cicd_tools.new_cicd.verification.marketplace.'
+            'get_assets')
+class TestReleaseVerification(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = mock.Mock()
+        self.repository.name = 'foo-plugin'
+        self.repository.organization.login = 'org'
+        self.github_assets = []
+        for name in ['foo.wgn', 'plugin.yaml']:
+            asset = mock.Mock(digest=None)
+            asset.name = name
+            self.github_assets.append(asset)
+        self.repository.get_release.return_value.get_assets.return_value = \
+            self.github_assets
+        self.sleeps = []
+
+    def _verification(self, **kwargs):
+        return mod.ReleaseVerification(self.repository,
+                                       '1.0',
+                                       ASSETS,
+                                       sleep=self.sleeps.append,
+                                       **kwargs)
+
+    def test_converged(self, marketplace_assets, s3_assets):
+        marketplace_assets.return_value = MARKETPLACE_ASSETS
+        s3_assets.return_value = ASSETS
+        self._verification().wait()
+        self.assertEqual(self.sleeps, [])
+        marketplace_assets.assert_called_once_with(
+            'foo-plugin', '1.0', fresh=True)
+
+    def test_converged_sources_are_not_listed_again(self,
+                                                    marketplace_assets,
+                                                    s3_assets):
+        marketplace_assets.side_effect = [[], [], MARKETPLACE_ASSETS]
+        s3_assets.return_value = ASSETS
+        verification = self._verification(initial=1, factor=2, maximum=3)
+        verification.wait()
+        self.assertEqual(marketplace_assets.call_count, 3)
+        self.assertEqual(s3_assets.call_count, 1)
+        self.assertEqual(
+            self.repository.get_release.return_value.get_assets.call_count,
+            1)
+        self.assertEqual(self.sleeps, [1, 2])
+
+    def test_timeout(self, marketplace_assets, s3_assets):
+        marketplace_assets.return_value = []
+        s3_assets.return_value = ASSETS
+        verification = self._verification(timeout=0)
+        self.assertRaises(RuntimeError, verification.wait)
+        self.assertEqual(list(verification.problems), ['marketplace'])
+
+    def test_nativeedge_skips_marketplace(self,
+                                          marketplace_assets,
+                                          s3_assets):
+        self.repository.name = 'nativeedge-foo-plugin'
+        marketplace_assets.return_value = []
+        s3_assets.return_value = ASSETS
+        self.assertTrue(self._verification().check())
+
+
+class TestAssetReconciliation(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.assets = {}
+        for name in ['foo.wgn', 'plugin.yaml']:
+            path = os.path.join(self.tempdir, name)
+            with open(path, 'wb') as f:
+                f.write(name.encode())
+            self.assets[name] = path
+
+    def test_diff_assets(self):
+        diff = mod.diff_assets(
+            ASSETS, {'foo.wgn': None, 'foo.wgn.md5': None, 'bar.wgn': None})
+        self.assertEqual(diff.missing, ['plugin.yaml'])
+        self.assertEqual(diff.extra, ['bar.wgn'])
+        self.assertEqual(diff.mismatched, [])
+        self.assertFalse(diff.ok)
+        self.assertEqual(diff.describe('s3'), ['plugin.yaml missing from s3'])
+        self.assertTrue(mod.diff_assets(ASSETS, {
+            'foo.wgn': None, 'plugin.yaml': None, 'bar.wgn': None}).ok)
+
+    def test_normalize_marketplace_assets(self):
+        self.assertEqual(
+            mod.normalize_marketplace_assets(
+                MARKETPLACE_ASSETS + ['https://example.com/foo.wgn'],
+                'org',
+                'foo-plugin',
+                '1.0'),
+            {'foo.wgn': None,
+             'plugin.yaml': None,
+             'https://example.com/foo.wgn': None})
+
+    def test_digest_mismatch(self):
+        digest = mod.LocalDigests(self.assets)
+        s3_assets = mod.normalize_s3_assets({
+            'foo.wgn': '"{}"'.format(hashlib.md5(b'foo.wgn').hexdigest()),
+            'plugin.yaml': '"{}"'.format(hashlib.md5(b'bar').hexdigest())})
+        diff = mod.diff_assets(self.assets, s3_assets, digest)
+        self.assertEqual(diff.mismatched, ['plugin.yaml'])
+        github_asset = mock.Mock(digest='sha256:{}'.format(
+            hashlib.sha256(b'foo.wgn').hexdigest()))
+        github_asset.name = 'foo.wgn'
+        multipart = mod.normalize_s3_assets({'plugin.yaml': '"abc-2"'})
+        self.assertEqual(multipart, {'plugin.yaml': None})
+        diff = mod.diff_assets(
+            self.assets,
+            dict(mod.normalize_github_assets([github_asset]), **multipart),
+            digest)
+        self.assertTrue(diff.ok)
+
+    @mock.patch('ecosystem_cicd_tools.new_cicd.verification.s3.'
+                'get_asset_etags')
+    @mock.patch('ecosystem_cicd_tools.new_cicd.verification.marketplace.'
+                'get_assets')
+    def test_reconciliation_sources(self, marketplace_assets, s3_assets):
+        marketplace_assets.return_value = MARKETPLACE_ASSETS[:1]
+        s3_assets.return_value = dict.fromkeys(self.assets)
+        reconciliation = mod.AssetReconciliation(
+            'foo-plugin', 'org', '1.0', self.assets)
+        self.assertEqual(sorted(reconciliation.listers),
+                         ['marketplace', 's3'])
+        diffs = reconciliation.diff()
+        self.assertTrue(diffs['s3'].ok)
+        self.assertEqual(diffs['marketplace'].missing, ['plugin.yaml'])
+        self.assertEqual(
+            mod.get_asset_problems(diffs),
+            ['plugin.yaml missing from marketplace'])
+        self.assertEqual(list(reconciliation.diff(['s3'])), ['s3'])
+        self.assertEqual(reconciliation.diff([]), {})
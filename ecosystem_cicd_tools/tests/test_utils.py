@@ -0,0 +1,90 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+import mock
+
+from .. import utils
+
+
+class TestWorkspaceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workspace)
+        self.wagon = os.path.join(self.workspace, 'foo.wgn')
+        self._write(self.wagon, b'foo')
+        self._write(os.path.join(self.workspace, 'plugin.yaml'), b'bar')
+        self.index = utils.WorkspaceIndex(self.workspace)
+
+    def _write(self, path, content):
+        with open(path, 'wb') as outfile:
+            outfile.write(content)
+
+    def _read(self, path):
+        with open(path, 'r') as outfile:
+            return outfile.read()
+
+    def test_files(self):
+        files = self.index.files()
+        self.assertEqual(
+            sorted(files),
+            sorted([self.wagon,
+                    self.wagon + '.md5',
+                    os.path.join(self.workspace, 'plugin.yaml')]))
+        self.assertEqual(files[files.index(self.wagon) + 1],
+                         self.wagon + '.md5')
+        self.assertEqual(
+            self._read(self.wagon + '.md5'),
+            '{0}  {1}\n'.format(hashlib.md5(b'foo').hexdigest(), self.wagon))
+
+    def test_files_missing_workspace(self):
+        index = utils.WorkspaceIndex(os.path.join(self.workspace, 'nope'))
+        self.assertEqual(index.files(), [])
+
+    @mock.patch('ecosystem_cicd_tools.utils.file_md5',
+                side_effect=utils.file_md5)
+    def test_digests_are_memoized(self, file_md5):
+        self.index.files()
+        md5_mtime = os.stat(self.wagon + '.md5').st_mtime_ns
+        self.index.files()
+        self.assertEqual(file_md5.call_count, 1)
+        self.assertEqual(os.stat(self.wagon + '.md5').st_mtime_ns, md5_mtime)
+
+        self._write(self.wagon, b'changed')
+        os.utime(self.wagon, ns=(0, 0))
+        self.index.files()
+        self.assertEqual(file_md5.call_count, 2)
+        self.assertTrue(self._read(self.wagon + '.md5').startswith(
+            hashlib.md5(b'changed').hexdigest()))
+
+    def test_stale_md5_file_is_rewritten(self):
+        self.index.files()
+        self._write(self.wagon + '.md5', b'stale')
+        self.index.files()
+        self.assertTrue(self._read(self.wagon + '.md5').startswith(
+            hashlib.md5(b'foo').hexdigest()))
+
+    def test_get_workspace_files(self):
+        self.assertIs(utils.get_workspace_index(self.workspace),
+                      utils.get_workspace_index(self.workspace))
+        self.assertEqual(
+            utils.get_workspace_files('tgz', workspace_path=self.workspace),
+            self.index.files('tgz'))
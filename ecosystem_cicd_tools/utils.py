@@ -23,14 +23,20 @@ import zipfile
 import requests
 import mimetypes
 import urllib.request
+from threading import Lock
 from contextlib import contextmanager
 from tempfile import NamedTemporaryFile, mkdtemp
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 
+from .new_cicd.cache import fetch_s3, file_md5
+
 logging.basicConfig(level=logging.INFO)
 
 BUCKET_NAME = 'cloudify-release-eu'
+# How many workspace files are hashed at the same time.
+WORKSPACE_HASH_WORKERS = int(os.environ.get('WORKSPACE_HASH_WORKERS', 4))
 
 
 @contextmanager
@@ -131,7 +137,8 @@ def download_from_s3(remote_path,
 
         logging.info('....Starting download')
 
-        s3_object.download_file(
+        fetch_s3(
+            s3_object,
             local_path,
             Config=boto3.s3.transfer.TransferConfig(use_threads=False))
 
@@ -205,20 +212,89 @@ def report_tar_contents(path):
     shutil.rmtree(loc)
 
 
-def get_workspace_files(file_type=None, workspace_path=None):
-    file_type = file_type or '.wgn'
+class WorkspaceIndex(object):
+    """The files in a workspace and the MD5 of the wagons among them.
+
+    Digests are computed with hashlib in a thread pool and remembered by
+    (path, size, mtime), so a file is only hashed again when it changes,
+    and its .md5 file is only written when it is missing or stale.
+    """
+
+    def __init__(self, workspace_path, workers=None):
+        self.workspace_path = workspace_path
+        self.workers = workers or WORKSPACE_HASH_WORKERS
+        self._digests = {}
+        self._lock = Lock()
+
+    def md5(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._digests:
+                return self._digests[key]
+        digest = file_md5(path)
+        with self._lock:
+            self._digests[key] = digest
+        return digest
+
+    def write_md5_file(self, path):
+        """
+        Write an md5sum compatible file next to path, unless it's current.
+        :return: The .md5 file path.
+        """
+
+        md5_path = path + '.md5'
+        content = '{0}  {1}\n'.format(self.md5(path), path)
+        try:
+            with open(md5_path, 'r') as outfile:
+                if outfile.read() == content:
+                    return md5_path
+        except IOError:
+            pass
+        with open(md5_path, 'w') as outfile:
+            outfile.write(content)
+        return md5_path
+
+    def files(self, file_type=None):
+        """
+        :param file_type: The suffix of the files to add .md5 files for.
+        :return: The workspace files, each file_type file followed by its
+            .md5 file.
+        """
+
+        file_type = file_type or '.wgn'
+        if not os.path.isdir(self.workspace_path):
+            return []
+        paths = [os.path.join(self.workspace_path, f)
+                 for f in os.listdir(self.workspace_path)]
+        hashed = [f for f in paths if f.endswith(file_type)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            md5_paths = dict(
+                zip(hashed, executor.map(self.write_md5_file, hashed)))
+        files = []
+        for f in paths:
+            files.append(f)
+            if f in md5_paths:
+                files.append(md5_paths[f])
+        return files
+
+
+_workspace_indexes = {}
+_workspace_indexes_lock = Lock()
+
+
+def get_workspace_index(workspace_path=None):
     workspace_path = workspace_path or os.path.join(
         os.path.abspath('workspace'), 'build')
-    files = []
-    if not os.path.isdir(workspace_path):
-        return []
-    for f in os.listdir(workspace_path):
-        f = os.path.join(workspace_path, f)
-        files.append(f)
-        if f.endswith(file_type):
-            f_md5 = f + '.md5'
-            os.system('md5sum {0} > {1}'.format(f, f_md5))
-            files.append(f_md5)
+    with _workspace_indexes_lock:
+        if workspace_path not in _workspace_indexes:
+            _workspace_indexes[workspace_path] = WorkspaceIndex(
+                workspace_path)
+        return _workspace_indexes[workspace_path]
+
+
+def get_workspace_files(file_type=None, workspace_path=None):
+    files = get_workspace_index(workspace_path).files(file_type)
     logging.info('These are the workspace files: {0}'.format(files))
     return files
 
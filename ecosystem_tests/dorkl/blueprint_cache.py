@@ -0,0 +1,104 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import hashlib
+
+from ecosystem_tests.dorkl.constansts import (BLUEPRINT_DIGEST_LABEL,
+                                              BLUEPRINT_UPLOAD_CACHE)
+
+CHUNK_SIZE = 1024 * 1024
+# The suffix of the blueprint ids that runners upload for deployment updates.
+UPDATE_SUFFIX_PATTERN = r'-\d{2}-\d{2}-\d{4}-\d{2}-\d{2}-\d{2}'
+
+
+def blueprint_digest(blueprint_file_name):
+    """
+    Hash a blueprint the way it is uploaded: the main file name and every
+    file in the blueprint directory, with their relative paths.
+    :param blueprint_file_name: Path to the blueprint main file.
+    :return: sha256 hex digest.
+    """
+
+    blueprint_dir = os.path.dirname(os.path.abspath(blueprint_file_name))
+    digest = hashlib.sha256(
+        os.path.basename(blueprint_file_name).encode('utf-8'))
+    for root, dirs, files in os.walk(blueprint_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative_path = os.path.relpath(path, blueprint_dir).replace(
+                os.sep, '/')
+            digest.update('\0{0}\0{1}\0'.format(
+                relative_path, os.path.getsize(path)).encode('utf-8'))
+            with open(path, 'rb') as infile:
+                for chunk in iter(lambda: infile.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_blueprint_labels(blueprint):
+    """
+    :param blueprint: A blueprint from the REST API or from
+        "cfy blueprints list --json", which serializes labels to a string.
+    :return: A dict of label keys to values.
+    """
+
+    labels = blueprint.get('labels') or []
+    if isinstance(labels, str):
+        return dict(label.split(':', 1)
+                    for label in labels.strip('"').split(',')
+                    if ':' in label)
+    return {label['key']: label['value'] for label in labels}
+
+
+def is_test_blueprint(blueprint_id, test_name):
+    """
+    :return: True if the blueprint was uploaded by the test, as the test
+        blueprint or as a deployment update blueprint.
+    """
+
+    return bool(re.match(
+        '{0}({1})?$'.format(re.escape(test_name), UPDATE_SUFFIX_PATTERN),
+        blueprint_id or ''))
+
+
+def find_cached_blueprint(blueprints,
+                          digest,
+                          blueprint_id=None,
+                          test_name=None):
+    """
+    Find an uploaded blueprint with the given content digest.
+    :param blueprints: A list of blueprints with id, state and labels.
+    :param digest: The blueprint_digest of the blueprint to upload.
+    :param blueprint_id: Only reuse this blueprint, if given.
+    :param test_name: Only reuse blueprints of this test, if given.
+    :return: The id of the blueprint to reuse, or None.
+    """
+
+    if not BLUEPRINT_UPLOAD_CACHE:
+        return
+    for blueprint in blueprints or []:
+        if blueprint_id and blueprint.get('id') != blueprint_id:
+            continue
+        if test_name and not is_test_blueprint(blueprint.get('id'),
+                                               test_name):
+            continue
+        if blueprint.get('state', 'uploaded') != 'uploaded':
+            continue
+        if get_blueprint_labels(blueprint).get(
+                BLUEPRINT_DIGEST_LABEL) == digest:
+            return blueprint['id']
@@ -15,6 +15,7 @@
 
 import os
 import json
+import uuid
 import yaml
 import base64
 import posixpath
@@ -33,11 +34,17 @@ from wagon import show
 
 from ecosystem_tests.ecosystem_tests_cli.utilities import (
     get_universal_path)
+from ecosystem_tests.ecosystem_tests_cli.scheduler import running_concurrently
 from ecosystem_cicd_tools.packaging import (
     get_workspace_files,
     find_wagon_local_path,
     get_bundle_from_workspace)
+from ecosystem_tests.dorkl.polling import AdaptivePoller
+from ecosystem_tests.dorkl.blueprint_cache import (blueprint_digest,
+                                                   find_cached_blueprint)
 from ecosystem_tests.dorkl.constansts import (logger,
+                                              BLUEPRINT_DIGEST_LABEL,
+                                              EVENTS_BATCH_SIZE,
                                               LICENSE_ENVAR_NAME,
                                               RED,
                                               GREEN,
@@ -50,7 +57,8 @@ from ecosystem_tests.dorkl.constansts import (logger,
                                               UNDERLINE)
 from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
                                               EcosystemTestException)
-from ecosystem_tests.dorkl.commands import (cloudify_exec,
+from ecosystem_tests.dorkl.commands import (docker_exec,
+                                            cloudify_exec,
                                             copy_file_to_docker,
                                             delete_file_from_docker,
                                             copy_directory_to_docker)
@@ -249,12 +257,16 @@ def secrets_create(name, is_file=False):
         name, value), get_json=False, log=False)
 
 
-def blueprints_upload(blueprint_file_name, blueprint_id):
+def blueprints_upload(blueprint_file_name, blueprint_id, test_name=None):
     """
     Upload a blueprint to the manager.
+    An unchanged blueprint that is already uploaded as blueprint_id is not
+    uploaded again. With test_name, neither is an identical blueprint that
+    the test uploaded with another id.
     :param blueprint_file_name:
     :param blueprint_id:
-    :return:
+    :param test_name: The test to reuse blueprints of.
+    :return: The id of the uploaded or reused blueprint.
     """
     logger.info('Blueprint file name: {}'.format(blueprint_file_name))
     blueprint_file_name = get_universal_path(blueprint_file_name)
@@ -262,19 +274,41 @@ def blueprints_upload(blueprint_file_name, blueprint_id):
         raise EcosystemTestException(
             'Cant upload blueprint {path} because the file doesn`t '
             'exists.'.format(path=blueprint_file_name))
-    remote_dir = copy_directory_to_docker(blueprint_file_name)
+    digest = blueprint_digest(blueprint_file_name)
+    cached_id = find_cached_blueprint(
+        cloudify_exec('cfy blueprints list', log=False),
+        digest,
+        None if test_name else blueprint_id,
+        test_name)
+    if cached_id:
+        logger.info('Blueprint {0} is unchanged, using {1}.'.format(
+            blueprint_file_name, cached_id))
+        return cached_id
+    # Every upload gets its own directory, so that concurrent tests of
+    # blueprints in the same directory don't replace each other's files.
+    remote_parent = posixpath.join(
+        '/tmp', 'blueprint-{0}'.format(uuid.uuid4().hex))
+    docker_exec('mkdir -p {0}'.format(remote_parent))
+    remote_dir = copy_directory_to_docker(blueprint_file_name, remote_parent)
     blueprint_file = get_universal_path(os.path.basename(blueprint_file_name))
     logger.info('Blueprint file: {}'.format(blueprint_file))
 
     try:
-        cloudify_exec('cfy blueprints upload {0} -b {1}'.format(
-            posixpath.join(remote_dir, blueprint_file),
-            blueprint_id), get_json=False)
-        delete_file_from_docker(remote_dir)
+        cloudify_exec('cfy blueprints upload {0} -b {1} '
+                      '--labels {2}:{3}'.format(
+                          posixpath.join(remote_dir, blueprint_file),
+                          blueprint_id,
+                          BLUEPRINT_DIGEST_LABEL,
+                          digest), get_json=False)
     except Exception as e:
+        if running_concurrently():
+            raise
         logger.info('Failed to upload blueprint, {0}'
                     'Maybe You need to clean up the /tmp directory'
                     .format(str(e)))
+    finally:
+        delete_file_from_docker(remote_parent)
+    return blueprint_id
 
 
 def blueprints_get(blueprint_id):
@@ -432,9 +466,67 @@ def log_events(execution_id):
             logger.info(event['context']['task_error_causes'])
 
 
+def executions_get(execution_id):
+    """
+    Get a single execution from the manager.
+    :param execution_id:
+    :return:
+    """
+    return cloudify_exec('cfy executions get {0}'.format(execution_id),
+                         log=False)
+
+
+def events_tail(execution_id, offset, size=EVENTS_BATCH_SIZE):
+    """
+    List the events of an execution that come after the first `offset`.
+    :param execution_id:
+    :param offset: How many events were already seen.
+    :param size: The maximum number of events to return.
+    :return:
+    """
+    events = cloudify_exec(
+        'cfy events list {0} --json '
+        '--pagination-offset {1} --pagination-size {2}'.format(
+            execution_id, offset, size),
+        get_json=False,
+        log=False)
+    return [json.loads(line) for line in events.split('\n') if line.strip()]
+
+
+def log_event(event):
+    message = event.get('message') or ''
+    if isinstance(message, dict):
+        message = message.get('text', '')
+    error_causes = event.get('error_causes') or \
+        event.get('context', {}).get('task_error_causes')
+    if error_causes:
+        logger.error(RED + '{0}: {1}'.format(message, error_causes) + RESET)
+    elif message:
+        logger.info(message)
+
+
+def get_execution_id(deployment_id, workflow_id):
+    """
+    Find the latest execution of a workflow on a deployment.
+    :param deployment_id:
+    :param workflow_id:
+    :return:
+    """
+    executions = executions_list(deployment_id)
+    try:
+        return [e for e in executions
+                if workflow_id == e['workflow_id']][-1]['id']
+    except (IndexError, KeyError, TypeError):
+        raise EcosystemTestException(
+            'Workflow {0} for deployment {1} was not found.'.format(
+                workflow_id, deployment_id))
+
+
 def wait_for_execution(deployment_id, workflow_id, timeout):
     """
     Wait for execution to end.
+    The execution is polled by id with adaptive backoff, and its events are
+    tailed from the last seen one. New events reset the backoff.
     :param deployment_id:
     :param workflow_id:
     :param timeout:
@@ -442,32 +534,31 @@ def wait_for_execution(deployment_id, workflow_id, timeout):
     """
     logger.info('Waiting for execution deployment ID '
                 '{0} workflow ID {1}'.format(deployment_id, workflow_id))
-    start = datetime.now()
-    while True:
-        if datetime.now() - start > timedelta(seconds=timeout):
-            raise EcosystemTimeout('Test timed out.')
-        executions = executions_list(deployment_id)
-        try:
-            ex = [e for e in executions
-                  if workflow_id == e['workflow_id']][-1]
-        except (IndexError, KeyError):
-            raise EcosystemTestException(
-                'Workflow {0} for deployment {1} was not found.'.format(
-                    workflow_id, deployment_id))
-
-        if ex['status'].lower() == 'completed':
+    poller = AdaptivePoller(timeout)
+    execution_id = None
+    events_offset = 0
+    status = None
+    for _ in poller:
+        if not execution_id:
+            execution_id = get_execution_id(deployment_id, workflow_id)
+        events = events_tail(execution_id, events_offset)
+        if events:
+            events_offset += len(events)
+            poller.reset()
+            for event in events:
+                log_event(event)
+        ex = executions_get(execution_id) or {}
+        if ex.get('status') != status:
+            status = ex.get('status')
+            logger.info('{0}:{1} status: {2}'.format(
+                deployment_id, workflow_id, status))
+        if status and status.lower() == 'completed':
             logger.info('{0}:{1} finished!'.format(deployment_id, workflow_id))
-            break
-        elif ex['status'].lower() == 'pending' or ex['status'] == 'started':
-            logger.info('{0}:{1} is pending/started.'.format(
-                deployment_id, workflow_id))
-        elif ex['status'].lower() == 'failed':
-            raise EcosystemTestException('Execution failed {0}:{1}'.format(
-                deployment_id, workflow_id))
-        else:
-            logger.info(
-                'Execution still running. Status: {0}'.format(ex['status']))
-        sleep(5)
+            return
+        elif status and status.lower() in ['failed', 'cancelled']:
+            raise EcosystemTestException('Execution {0} {1}:{2}'.format(
+                status.lower(), deployment_id, workflow_id))
+    raise EcosystemTimeout('Test timed out.')
 
 
 def verify_endpoint(endpoint, endpoint_value):
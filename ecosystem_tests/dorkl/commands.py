@@ -18,17 +18,19 @@ import json
 import base64
 import posixpath
 import subprocess
-from tqdm import tqdm
-from time import sleep
 from shlex import split
+from threading import Thread
+from collections import deque
 from pathlib import PureWindowsPath
 from tempfile import NamedTemporaryFile
-from datetime import datetime, timedelta
 
 from ecosystem_tests.ecosystem_tests_cli.utilities import (
     get_universal_path)
 from ecosystem_tests.dorkl.constansts import (logger,
                                               TIMEOUT,
+                                              OUTPUT_BUFFER_LINES,
+                                              DOCKER_TRANSPORT,
+                                              DOCKER_EXEC_POOL_SIZE,
                                               MANAGER_CONTAINER_ENVAR_NAME,
                                               RED,
                                               GREEN,
@@ -41,6 +43,8 @@ from ecosystem_tests.dorkl.constansts import (logger,
                                               UNDERLINE)
 from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
                                               EcosystemTestException)
+from ecosystem_tests.dorkl.sessions import get_session_pool
+from ecosystem_tests.dorkl.docker_api import get_docker_client
 from ecosystem_cicd_tools.validations import validate_plugin_version
 
 DEFAULT_COLOR = os.environ.get('DEFAULT_WORKFLOW_COLOR', BOLD)
@@ -56,87 +60,121 @@ def check_if_json_is_junk(stdout_line):
     return stdout_line
 
 
+def _stream_pipe(pipe, buffer, handle_line=None):
+    """
+    Consume a process pipe line by line as data arrives.
+    :param pipe: The stdout or stderr pipe of a running process.
+    :param buffer: A bounded deque that keeps the most recent lines.
+    :param handle_line: Optional callable invoked with every new line.
+    :return:
+    """
+    with pipe:
+        for line in iter(pipe.readline, ''):
+            buffer.append(line)
+            if handle_line:
+                handle_line(line)
+
+
+def output_line_handlers(stdout_color=DEFAULT_COLOR):
+    """
+    Create callables that log stdout and stderr lines of a command.
+    :param stdout_color: Defines the default stdout output color.
+    :return: A tuple of stdout and stderr line handlers.
+    """
+
+    logged_headers = set()
+
+    def log_stdout_line(stdout_line):
+        stdout_line = check_if_json_is_junk(stdout_line)
+        if not stdout_line:
+            return
+        if 'stdout' not in logged_headers:
+            logged_headers.add('stdout')
+            logger.info(stdout_color + 'Execution output: ' + RESET)
+        if not isinstance(stdout_line, str):
+            stdout_line = str(stdout_line)
+        logger.info(stdout_color + stdout_line + RESET)
+
+    def log_stderr_line(stderr_line):
+        if 'stderr' not in logged_headers:
+            logged_headers.add('stderr')
+            logger.info(RED + 'Execution error: ' + RESET)
+        logger.error(RED + stderr_line.strip() + RESET)
+
+    return log_stdout_line, log_stderr_line
+
+
 def handle_process(command,
                    timeout=TIMEOUT,
                    log=True,
                    detach=False,
                    stdout_color=DEFAULT_COLOR):
-    file_obj_stdout = NamedTemporaryFile(
-        dir=os.path.expanduser('~'), delete=False)
-    file_obj_stderr = NamedTemporaryFile(
-        dir=os.path.expanduser('~'), delete=False)
-    stdout_file = open(file_obj_stdout.name, 'w')
-    stdout_file_read = open(file_obj_stdout.name, 'r')
-    stderr_file = open(file_obj_stderr.name, 'w')
-    stderr_file_read = open(file_obj_stderr.name, 'r')
-
-    popen_args = {
-        'args': split(command),
-        'stdout': stdout_file,
-        'stderr': stderr_file,
-    }
-
-    def dump_command_output():
-        if log:
-            stdout_file.flush()
-            stdout_lines = stdout_file_read.readlines()
-            if stdout_lines:
-                logger.info(
-                    stdout_color + 'Execution output: ' + RESET)
-                for stdout_line in stdout_lines:
-                    stdout_line = check_if_json_is_junk(stdout_line)
-                    if stdout_line:
-                        if not isinstance(stdout_line, str):
-                            stdout_line = str(stdout_line)
-                        logger.info(
-                            stdout_color + stdout_line + RESET)
-            stderr_file.flush()
-            error_lines = stderr_file_read.readlines()
-            if error_lines:
-                logger.info(RED + 'Execution error: ' + RESET)
-                for stderr_line in error_lines:
-                    logger.error(RED + stderr_line.strip() + RESET)
-
-    def return_parsable_output():
-        stdout_file.flush()
-        with open(file_obj_stdout.name, 'r') as fout:
-            return '\n'.join(fout.readlines())
+    """
+    Execute a command and stream its output while it runs.
+    stdout and stderr are read by background threads the moment data is
+    written, so the call returns as soon as the process exits. The most
+    recent OUTPUT_BUFFER_LINES lines of each stream are kept in memory.
+    :param command: The command.
+    :param timeout: How long to permit the process to run.
+    :param log: Whether to log stdout or not.
+    :param detach: Return the process object without waiting for it.
+    :param stdout_color: Defines the default stdout output color.
+    :return: The command stdout.
+    """
 
     if log:
         logger.info('Executing command [{0}]...'.format(command))
-    time_started = datetime.now()
-    p = subprocess.Popen(**popen_args)
 
     if detach:
-        return p
+        return subprocess.Popen(split(command),
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+
+    stdout_lines = deque(maxlen=OUTPUT_BUFFER_LINES)
+    stderr_lines = deque(maxlen=OUTPUT_BUFFER_LINES)
+    log_stdout_line, log_stderr_line = output_line_handlers(stdout_color)
+
+    p = subprocess.Popen(split(command),
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE,
+                         encoding='utf-8',
+                         errors='replace')
+    readers = [
+        Thread(target=_stream_pipe,
+               args=(p.stdout,
+                     stdout_lines,
+                     log_stdout_line if log else None)),
+        Thread(target=_stream_pipe,
+               args=(p.stderr,
+                     stderr_lines,
+                     log_stderr_line if log else None)),
+    ]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
 
-    n = 2000.0
-    with tqdm(desc='Command [{0}]'.format(command), total=n) as pbar:
-        while p.poll() is None:
-            if log:
-                pbar.update((datetime.now() - time_started).total_seconds())
-                dump_command_output()
-            if datetime.now() - time_started > timedelta(seconds=timeout):
-                raise EcosystemTimeout('The timeout was reached.')
-            sleep(2)
-
-        pbar.refresh()
-        pbar.update(n-pbar.n)
-        sleep(0.1)
-        pbar.close()
-        dump_command_output()
+    try:
+        p.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        p.kill()
+        p.wait()
+        raise EcosystemTimeout('The timeout was reached.')
+    finally:
+        # A detached grandchild may inherit the pipes and keep them open,
+        # so don't wait for EOF forever once the process itself is gone.
+        for reader in readers:
+            reader.join(timeout=5)
 
     if log:
         logger.info('Command finished [{0}]...'.format(command))
 
     if p.returncode:
-        dump_command_output()
         raise EcosystemTestException('Command failed.'.format(p.returncode))
 
     if log:
         logger.info('Command succeeded [{0}]...'.format(command))
 
-    return return_parsable_output()
+    return '\n'.join(list(stdout_lines))
 
 
 def docker_exec(cmd,
@@ -155,6 +193,18 @@ def docker_exec(cmd,
     """
 
     container_name = get_manager_container_name()
+    if DOCKER_TRANSPORT == 'api' and not detach:
+        return docker_exec_api(container_name,
+                               cmd,
+                               timeout,
+                               log,
+                               stdout_color)
+    if DOCKER_EXEC_POOL_SIZE and not detach:
+        return docker_exec_session(container_name,
+                                   cmd,
+                                   timeout,
+                                   log,
+                                   stdout_color)
     return handle_process(
         'docker exec {container_name} {cmd}'.format(
             container_name=container_name, cmd=cmd),
@@ -164,6 +214,72 @@ def docker_exec(cmd,
         stdout_color)
 
 
+def _framed_docker_exec(container_name,
+                        cmd,
+                        execute,
+                        log=True,
+                        stdout_color=DEFAULT_COLOR):
+    """
+    Run a docker exec command with a backend that reports its exit code.
+    :param container_name: The manager container name.
+    :param cmd: The command.
+    :param execute: Callable that receives stdout and stderr line handlers
+    and returns a tuple of exit code, stdout lines and stderr lines.
+    :param log: Whether to log stdout or not.
+    :param stdout_color: Defines the default stdout output color.
+    :return: The command output.
+    """
+
+    command = 'docker exec {container_name} {cmd}'.format(
+        container_name=container_name, cmd=cmd)
+    if log:
+        logger.info('Executing command [{0}]...'.format(command))
+        handle_stdout, handle_stderr = output_line_handlers(stdout_color)
+    else:
+        handle_stdout, handle_stderr = None, None
+    returncode, stdout_lines, _ = execute(handle_stdout, handle_stderr)
+    if log:
+        logger.info('Command finished [{0}]...'.format(command))
+    if returncode:
+        raise EcosystemTestException(
+            'Command failed with exit code {0}.'.format(returncode))
+    if log:
+        logger.info('Command succeeded [{0}]...'.format(command))
+    return '\n'.join(stdout_lines)
+
+
+def docker_exec_session(container_name,
+                        cmd,
+                        timeout=TIMEOUT,
+                        log=True,
+                        stdout_color=DEFAULT_COLOR):
+    """
+    Execute command on the docker container over a pooled exec session.
+    """
+
+    def execute(handle_stdout, handle_stderr):
+        return get_session_pool(container_name).execute(
+            cmd, timeout, handle_stdout, handle_stderr)
+    return _framed_docker_exec(
+        container_name, cmd, execute, log, stdout_color)
+
+
+def docker_exec_api(container_name,
+                    cmd,
+                    timeout=TIMEOUT,
+                    log=True,
+                    stdout_color=DEFAULT_COLOR):
+    """
+    Execute command on the docker container with the Docker Engine API.
+    """
+
+    def execute(handle_stdout, handle_stderr):
+        return get_docker_client().exec_run(
+            container_name, split(cmd), timeout, handle_stdout, handle_stderr)
+    return _framed_docker_exec(
+        container_name, cmd, execute, log, stdout_color)
+
+
 def replace_file_on_manager(local_file_path, manager_file_path):
     """ Remove a file and upload a new one.
 
@@ -237,6 +353,10 @@ def copy_file_to_docker(local_file_path):
     """
     local_file_path = get_universal_path(local_file_path)
     docker_path = posixpath.join('/tmp/', os.path.basename(local_file_path))
+    if DOCKER_TRANSPORT == 'api':
+        get_docker_client().put_archive(
+            get_manager_container_name(), local_file_path, '/tmp')
+        return docker_path
     handle_process(
         'docker cp {0} {1}:{2}'.format(local_file_path,
                                        get_manager_container_name(),
@@ -252,6 +372,9 @@ def copy_file_from_docker(docker_file_path):
         local_file_path = pure_windows.as_posix().replace('C:', '')
     else:
         local_file_path = pure_windows.as_posix()
+    if DOCKER_TRANSPORT == 'api':
+        return get_docker_client().get_archive(
+            get_manager_container_name(), docker_file_path, local_file_path)
     handle_process(
         'docker cp {0}:{1} {2}'.format(get_manager_container_name(),
                                        docker_file_path,
@@ -263,21 +386,28 @@ def delete_file_from_docker(docker_path):
     docker_exec('rm -rf {destination}'.format(destination=docker_path))
 
 
-def copy_directory_to_docker(local_file_path):
+def copy_directory_to_docker(local_file_path, remote_parent='/tmp'):
     """
     Copy a directory from the container host to the container.
     :param local_file_path:  The local directory path.
+    :param remote_parent: An existing directory in the container to copy
+        the directory into.
     :return: The remote path inside the container.
     """
     local_file_path = get_universal_path(local_file_path)
     local_dir = os.path.dirname(local_file_path)
     dir_name = os.path.basename(local_dir)
     remote_dir = PureWindowsPath(
-        posixpath.join('/tmp', dir_name)).as_posix()
+        posixpath.join(remote_parent, dir_name)).as_posix()
     try:
-        handle_process(
-            'docker cp {0} {1}:/tmp'.format(local_dir,
-                                            get_manager_container_name()))
+        if DOCKER_TRANSPORT == 'api':
+            get_docker_client().put_archive(
+                get_manager_container_name(), local_dir, remote_parent)
+        else:
+            handle_process(
+                'docker cp {0} {1}:{2}'.format(local_dir,
+                                               get_manager_container_name(),
+                                               remote_parent))
     except EcosystemTestException:
         pass
     return remote_dir
@@ -13,13 +13,56 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import logging
+from urllib.parse import urlparse
 logging.basicConfig()
 logger = logging.getLogger('logger')
 logger.setLevel(logging.DEBUG)
 
 MANAGER_CONTAINER_ENVAR_NAME = 'MANAGER_CONTAINER'
 TIMEOUT = 2000
+OUTPUT_BUFFER_LINES = int(
+    os.environ.get('ECOSYSTEM_OUTPUT_BUFFER_LINES', 100000))
+# Number of long-lived "docker exec" shells kept per manager container.
+# 0 disables the pool and forks a new "docker exec" for every command.
+DOCKER_EXEC_POOL_SIZE = int(
+    os.environ.get('ECOSYSTEM_DOCKER_EXEC_POOL_SIZE', 0))
+
+
+def get_docker_socket(docker_host):
+    """
+    :param docker_host: A DOCKER_HOST value, such as unix:///path.
+    :return: The UNIX socket path, or None for other hosts, like tcp://.
+    """
+    parsed = urlparse(docker_host)
+    if parsed.scheme in ('', 'unix'):
+        return parsed.path
+
+
+# How dorkl talks to docker: "cli" shells out to the docker client,
+# "api" talks to the Docker Engine API on DOCKER_SOCKET directly.
+DOCKER_TRANSPORT = os.environ.get('ECOSYSTEM_DOCKER_TRANSPORT', 'cli')
+DOCKER_HOST = os.environ.get('DOCKER_HOST', 'unix:///var/run/docker.sock')
+DOCKER_SOCKET = get_docker_socket(DOCKER_HOST)
+if DOCKER_TRANSPORT == 'api' and not DOCKER_SOCKET:
+    # Only a local daemon socket is supported, the docker client handles
+    # the rest, such as a tcp:// docker-in-docker daemon.
+    logger.warning('DOCKER_HOST {0} is not a UNIX socket, using the docker '
+                   'client instead of the API.'.format(DOCKER_HOST))
+    DOCKER_TRANSPORT = 'cli'
+# Adaptive polling of executions: seconds between the first polls, the
+# cap after exponential backoff, the backoff factor and the jitter ratio.
+POLL_INITIAL_INTERVAL = 0.5
+POLL_MAX_INTERVAL = 10
+POLL_BACKOFF_FACTOR = 1.5
+POLL_JITTER = 0.1
+EVENTS_BATCH_SIZE = 1000
+# Blueprints are labeled with a hash of their directory, so an unchanged
+# blueprint that is already on the manager is not uploaded again.
+BLUEPRINT_DIGEST_LABEL = 'ecosystem-blueprint-digest'
+BLUEPRINT_UPLOAD_CACHE = os.environ.get(
+    'ECOSYSTEM_BLUEPRINT_UPLOAD_CACHE', 'true').lower() == 'true'
 VPN_CONFIG_PATH = '/tmp/vpn.conf'
 LICENSE_ENVAR_NAME = 'TEST_LICENSE'
 
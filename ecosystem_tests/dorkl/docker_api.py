@@ -0,0 +1,443 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import time
+import queue
+import socket
+import struct
+import tarfile
+import posixpath
+import http.client
+from threading import Lock, Thread
+from collections import deque
+from urllib.parse import quote, urlencode
+
+from ecosystem_tests.dorkl.constansts import (logger,
+                                              TIMEOUT,
+                                              DOCKER_HOST,
+                                              DOCKER_SOCKET,
+                                              OUTPUT_BUFFER_LINES)
+from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
+                                              EcosystemTestException)
+
+API_VERSION = 'v1.41'
+STREAM_CHUNK_SIZE = 64 * 1024
+STDOUT = 1
+STDERR = 2
+
+_clients = {}
+_clients_lock = Lock()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection to a UNIX domain socket."""
+
+    def __init__(self, socket_path, timeout=None):
+        super(UnixHTTPConnection, self).__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def _tar_stream(local_path, arcname):
+    """
+    Yield a tar archive of a file or directory while it is being written.
+    :param local_path: The local file or directory.
+    :param arcname: The name of the entry inside the archive.
+    :return: A generator of bytes.
+    """
+
+    chunks = queue.Queue(maxsize=16)
+    errors = []
+
+    class _QueueWriter(object):
+        def write(self, data):
+            chunks.put(bytes(data))
+            return len(data)
+
+    def _produce():
+        try:
+            with tarfile.open(fileobj=_QueueWriter(),
+                              mode='w|',
+                              bufsize=STREAM_CHUNK_SIZE) as tar:
+                tar.add(local_path, arcname=arcname)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            chunks.put(None)
+
+    producer = Thread(target=_produce)
+    producer.daemon = True
+    producer.start()
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        yield chunk
+    if errors:
+        raise errors[0]
+
+
+def _iter_frames(response):
+    """
+    Demultiplex a hijacked exec stream.
+    Every frame has an 8 bytes header: the stream type, 3 padding bytes
+    and the payload size as a big endian unsigned int.
+    :param response: The exec start response.
+    :return: A generator of (stream type, payload) tuples.
+    """
+
+    while True:
+        header = response.read(8)
+        if len(header) < 8:
+            return
+        stream_type, size = struct.unpack('>BxxxL', header)
+        payload = response.read(size)
+        yield stream_type, payload
+
+
+class DockerEngineClient(object):
+    """A minimal Docker Engine API client over the daemon's UNIX socket.
+
+    Control requests share one keep-alive connection. Exec output is read
+    from a dedicated connection, because the daemon hijacks it for the raw
+    stream.
+    """
+
+    def __init__(self, socket_path=DOCKER_SOCKET, timeout=TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._connection = None
+        self._lock = Lock()
+
+    def _url(self, endpoint, **params):
+        url = '/{0}{1}'.format(API_VERSION, endpoint)
+        if params:
+            url = '{0}?{1}'.format(url, urlencode(params))
+        return url
+
+    def _get_connection(self):
+        if not self._connection:
+            self._connection = UnixHTTPConnection(
+                self.socket_path, self.timeout)
+        return self._connection
+
+    def _drop_connection(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    def close(self):
+        with self._lock:
+            self._drop_connection()
+
+    @staticmethod
+    def _check_response(response, body):
+        if response.status >= 400:
+            try:
+                message = json.loads(body)['message']
+            except (ValueError, KeyError, TypeError):
+                message = body
+            raise EcosystemTestException(
+                'Docker API request failed with {0}: {1}'.format(
+                    response.status, message))
+
+    def request(self,
+                method,
+                endpoint,
+                body=None,
+                headers=None,
+                raw=False,
+                **params):
+        """
+        Send a request over the shared connection.
+        :param method: The HTTP method.
+        :param endpoint: The API path, without the version prefix.
+        :param body: Optional request body (bytes, dict or iterable).
+        :param headers: Optional request headers.
+        :param raw: Return the response body without parsing it.
+        :param params: Query string parameters.
+        :return: The parsed JSON response, or the raw body.
+        """
+
+        headers = dict(headers or {})
+        encode_chunked = False
+        if isinstance(body, dict):
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif body is not None and not isinstance(body, bytes):
+            encode_chunked = True
+        url = self._url(endpoint, **params)
+        with self._lock:
+            for attempt in range(2):
+                connection = self._get_connection()
+                try:
+                    connection.request(method,
+                                       url,
+                                       body=body,
+                                       headers=headers,
+                                       encode_chunked=encode_chunked)
+                    response = connection.getresponse()
+                    data = response.read()
+                    break
+                except (http.client.RemoteDisconnected,
+                        ConnectionResetError,
+                        BrokenPipeError):
+                    # The daemon closed an idle keep-alive connection,
+                    # retry once unless the body was a one-shot stream.
+                    self._drop_connection()
+                    if attempt or encode_chunked:
+                        raise
+                except Exception:
+                    self._drop_connection()
+                    raise
+            if response.will_close:
+                self._drop_connection()
+        self._check_response(response, data)
+        if not raw and response.getheader('Content-Type', '').startswith(
+                'application/json'):
+            return json.loads(data) if data else None
+        return data
+
+    def exec_run(self,
+                 container,
+                 cmd,
+                 timeout=TIMEOUT,
+                 handle_stdout=None,
+                 handle_stderr=None):
+        """
+        Run a command inside a container with the exec API.
+        :param container: The container name or id.
+        :param cmd: The command as a list of arguments.
+        :param timeout: How long to permit the command to run.
+        :param handle_stdout: Optional callable invoked with stdout lines.
+        :param handle_stderr: Optional callable invoked with stderr lines.
+        :return: A tuple of exit code, stdout lines and stderr lines.
+        """
+
+        exec_id = self.request(
+            'POST',
+            '/containers/{0}/exec'.format(quote(container)),
+            body={'AttachStdout': True,
+                  'AttachStderr': True,
+                  'Cmd': cmd})['Id']
+        deadline = time.time() + timeout
+        buffers = {
+            STDOUT: deque(maxlen=OUTPUT_BUFFER_LINES),
+            STDERR: deque(maxlen=OUTPUT_BUFFER_LINES),
+        }
+        handlers = {STDOUT: handle_stdout, STDERR: handle_stderr}
+        partial = {STDOUT: '', STDERR: ''}
+
+        def _append(stream_type, line):
+            buffers[stream_type].append(line)
+            if handlers[stream_type]:
+                handlers[stream_type](line)
+
+        connection = UnixHTTPConnection(self.socket_path, timeout)
+        try:
+            connection.request(
+                'POST',
+                self._url('/exec/{0}/start'.format(exec_id)),
+                body=json.dumps({'Detach': False, 'Tty': False}),
+                headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            if response.status >= 400:
+                self._check_response(response, response.read())
+            for stream_type, payload in _iter_frames(response):
+                if time.time() > deadline:
+                    raise socket.timeout()
+                if stream_type not in buffers:
+                    continue
+                text = partial[stream_type] + payload.decode(
+                    'utf-8', errors='replace')
+                lines = text.split('\n')
+                partial[stream_type] = lines.pop()
+                for line in lines:
+                    _append(stream_type, line + '\n')
+        except socket.timeout:
+            raise EcosystemTimeout('The timeout was reached.')
+        finally:
+            connection.close()
+        for stream_type, line in partial.items():
+            if line:
+                _append(stream_type, line)
+        result = self.request('GET', '/exec/{0}/json'.format(exec_id))
+        return result['ExitCode'], buffers[STDOUT], buffers[STDERR]
+
+    def put_archive(self, container, local_path, remote_dir):
+        """
+        Copy a local file or directory into a container directory.
+        :param container: The container name or id.
+        :param local_path: The local file or directory.
+        :param remote_dir: The destination directory in the container.
+        :return: The remote path.
+        """
+
+        arcname = posixpath.basename(local_path.rstrip('/\\'))
+        self.request('PUT',
+                     '/containers/{0}/archive'.format(quote(container)),
+                     body=_tar_stream(local_path, arcname),
+                     headers={'Content-Type': 'application/x-tar'},
+                     path=remote_dir)
+        return posixpath.join(remote_dir, arcname)
+
+    def get_archive(self, container, remote_path, local_path):
+        """
+        Copy a file from a container to a local file.
+        :param container: The container name or id.
+        :param remote_path: The file path in the container.
+        :param local_path: The local destination file.
+        :return: The local path.
+        """
+
+        connection = UnixHTTPConnection(self.socket_path, self.timeout)
+        try:
+            connection.request(
+                'GET',
+                self._url('/containers/{0}/archive'.format(quote(container)),
+                          path=remote_path))
+            response = connection.getresponse()
+            if response.status >= 400:
+                self._check_response(response, response.read())
+            with tarfile.open(fileobj=response, mode='r|') as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    source = tar.extractfile(member)
+                    with open(local_path, 'wb') as outfile:
+                        while True:
+                            chunk = source.read(STREAM_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            outfile.write(chunk)
+                    return local_path
+        finally:
+            connection.close()
+        raise EcosystemTestException(
+            'No file {0} in container {1}.'.format(remote_path, container))
+
+    def containers(self):
+        """
+        List all containers in the same format as "docker ps -a".
+        :return: A list of dicts.
+        """
+
+        return [{'ID': c['Id'],
+                 'Image': c['Image'],
+                 'Names': ','.join(n.lstrip('/') for n in c['Names']),
+                 'State': c['State'],
+                 'Status': c['Status']}
+                for c in self.request('GET', '/containers/json', all=1)]
+
+    def images(self):
+        """
+        List images in the same format as "docker images".
+        :return: A list of dicts.
+        """
+
+        images = []
+        for image in self.request('GET', '/images/json'):
+            for repo_tag in image.get('RepoTags') or []:
+                repository, _, tag = repo_tag.rpartition(':')
+                images.append({'ID': image['Id'],
+                               'Repository': repository,
+                               'Tag': tag})
+        return images
+
+    def remove_container(self, name):
+        return self.request('DELETE', '/containers/{0}'.format(quote(name)))
+
+    def remove_image(self, name):
+        return self.request('DELETE', '/images/{0}'.format(quote(name)))
+
+    def load_image(self, filename):
+        """
+        Load an image from a tar archive, like "docker load -i".
+        :param filename: The image archive.
+        :return: The loaded image name, if the daemon reported it.
+        """
+
+        def _read_chunks():
+            with open(filename, 'rb') as infile:
+                while True:
+                    chunk = infile.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        result = self.request('POST',
+                              '/images/load',
+                              body=_read_chunks(),
+                              headers={'Content-Type': 'application/x-tar'},
+                              raw=True,
+                              quiet=1)
+        image_name = None
+        for line in result.decode('utf-8').splitlines():
+            message = json.loads(line) if line.strip() else {}
+            if 'error' in message:
+                raise EcosystemTestException(message['error'])
+            stream = message.get('stream', '')
+            if 'Loaded image' in stream:
+                image_name = stream.split()[-1]
+        return image_name
+
+    def run_container(self, name, image, ports):
+        """
+        Create and start a detached container, like "docker run -d".
+        :param name: The container name.
+        :param image: The image name.
+        :param ports: Ports to publish on the same host port.
+        :return: The container id.
+        """
+
+        container_id = self.request(
+            'POST',
+            '/containers/create',
+            body={'Image': image,
+                  'ExposedPorts': {
+                      '{0}/tcp'.format(p): {} for p in ports},
+                  'HostConfig': {
+                      'PortBindings': {
+                          '{0}/tcp'.format(p): [{'HostPort': str(p)}]
+                          for p in ports}}},
+            name=name)['Id']
+        self.request('POST', '/containers/{0}/start'.format(container_id))
+        return container_id
+
+
+def get_docker_client(socket_path=None):
+    """
+    Get the shared Docker Engine API client.
+    :param socket_path: The daemon socket, defaults to DOCKER_SOCKET.
+    :return: DockerEngineClient
+    """
+
+    socket_path = socket_path or DOCKER_SOCKET
+    if not socket_path:
+        raise EcosystemTestException(
+            'The Docker Engine API needs a unix:// DOCKER_HOST, '
+            'not {0}.'.format(DOCKER_HOST))
+    with _clients_lock:
+        if socket_path not in _clients:
+            logger.debug('Connecting to docker daemon at {0}.'.format(
+                socket_path))
+            _clients[socket_path] = DockerEngineClient(socket_path)
+        return _clients[socket_path]
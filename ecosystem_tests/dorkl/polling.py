@@ -0,0 +1,91 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import random
+import asyncio
+
+from ecosystem_tests.dorkl.constansts import (POLL_JITTER,
+                                              POLL_MAX_INTERVAL,
+                                              POLL_BACKOFF_FACTOR,
+                                              POLL_INITIAL_INTERVAL)
+
+
+class AdaptivePoller(object):
+    """Iterate over poll attempts until a timeout, with backoff.
+
+    The first polls are fast. Every further poll waits `factor` times
+    longer, up to `maximum` seconds, with +/- `jitter` randomization so
+    parallel waiters don't hit the manager in lockstep. Call `reset` when
+    there is new activity to go back to fast polling.
+
+        for attempt in AdaptivePoller(timeout):
+            if done():
+                return
+        raise EcosystemTimeout(...)
+
+    Use `async for` to wait with asyncio.sleep instead.
+    """
+
+    def __init__(self,
+                 timeout,
+                 initial=POLL_INITIAL_INTERVAL,
+                 maximum=POLL_MAX_INTERVAL,
+                 factor=POLL_BACKOFF_FACTOR,
+                 jitter=POLL_JITTER,
+                 sleep=time.sleep):
+        self.timeout = timeout
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.interval = initial
+        self.start = None
+        self._sleep = sleep
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start if self.start else 0
+
+    def reset(self):
+        self.interval = self.initial
+
+    def next_interval(self):
+        interval = self.interval * random.uniform(
+            1 - self.jitter, 1 + self.jitter)
+        self.interval = min(self.interval * self.factor, self.maximum)
+        return interval
+
+    def __iter__(self):
+        self.start = time.time()
+        attempt = 0
+        while True:
+            yield attempt
+            attempt += 1
+            remaining = self.timeout - self.elapsed
+            if remaining <= 0:
+                return
+            self._sleep(min(self.next_interval(), remaining))
+
+    async def __aiter__(self):
+        self.start = time.time()
+        attempt = 0
+        while True:
+            yield attempt
+            attempt += 1
+            remaining = self.timeout - self.elapsed
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(self.next_interval(), remaining))
@@ -429,7 +429,8 @@ def handle_deployment_update(blueprint_file_name,
     try:
         logger.info('Blueprints list: {0}'.format(
             cloudify_exec('cfy blueprints list')))
-        blueprints_upload(blueprint_file_name, update_bp_name)
+        update_bp_name = blueprints_upload(
+            blueprint_file_name, update_bp_name, test_name=test_name)
         deployment_update(test_name,
                           update_bp_name,
                           inputs,
@@ -0,0 +1,231 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import uuid
+import queue
+import atexit
+import subprocess
+from threading import Lock, Thread, BoundedSemaphore
+from collections import deque
+from shlex import split, quote
+
+from ecosystem_tests.dorkl.constansts import (logger,
+                                              TIMEOUT,
+                                              OUTPUT_BUFFER_LINES,
+                                              DOCKER_EXEC_POOL_SIZE)
+from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
+                                              EcosystemTestException)
+
+SESSION_SHELL = '/bin/bash'
+EXIT_MARKER = '__ECOSYSTEM_EXIT_{0}__'
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def _feed_queue(pipe, lines):
+    with pipe:
+        for line in iter(pipe.readline, ''):
+            lines.put(line)
+    lines.put(None)
+
+
+class DockerExecSession(object):
+    """A long-lived shell inside the manager container.
+
+    Commands are written to the shell's stdin one at a time. Every command
+    is followed by a unique marker on stdout (carrying the exit code) and
+    on stderr, so the output of each command can be framed without
+    forking a new "docker exec" process.
+    """
+
+    def __init__(self, container_name, shell=SESSION_SHELL):
+        self.container_name = container_name
+        self._process = subprocess.Popen(
+            ['docker', 'exec', '-i', container_name, shell],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1)
+        self._stdout = queue.Queue()
+        self._stderr = queue.Queue()
+        for pipe, lines in [(self._process.stdout, self._stdout),
+                            (self._process.stderr, self._stderr)]:
+            reader = Thread(target=_feed_queue, args=(pipe, lines))
+            reader.daemon = True
+            reader.start()
+
+    @property
+    def alive(self):
+        return self._process.poll() is None
+
+    def execute(self,
+                cmd,
+                timeout=TIMEOUT,
+                handle_stdout=None,
+                handle_stderr=None):
+        """
+        Run a command in the session and wait for its exit marker.
+        :param cmd: The command, with the same quoting as for docker exec.
+        :param timeout: How long to permit the command to run.
+        :param handle_stdout: Optional callable invoked with stdout lines.
+        :param handle_stderr: Optional callable invoked with stderr lines.
+        :return: A tuple of exit code, stdout lines and stderr lines.
+        """
+
+        if not self.alive:
+            raise EcosystemTestException(
+                'The exec session to {0} is closed.'.format(
+                    self.container_name))
+        marker = EXIT_MARKER.format(uuid.uuid4().hex)
+        # Re-quote the arguments so the shell sees exactly the argv that
+        # "docker exec <container> <cmd>" would have received.
+        command = ' '.join(quote(arg) for arg in split(cmd))
+        self._process.stdin.write(
+            '{command} </dev/null; '
+            'echo "{marker} $?"; echo "{marker}" >&2\n'.format(
+                command=command, marker=marker))
+        self._process.stdin.flush()
+
+        deadline = time.time() + timeout
+        stdout_lines = deque(maxlen=OUTPUT_BUFFER_LINES)
+        stderr_lines = deque(maxlen=OUTPUT_BUFFER_LINES)
+        exit_line = self._read_until_marker(
+            self._stdout, marker, deadline, stdout_lines, handle_stdout)
+        self._read_until_marker(
+            self._stderr, marker, deadline, stderr_lines, handle_stderr)
+        return int(exit_line.split()[-1]), stdout_lines, stderr_lines
+
+    def _read_until_marker(self, lines, marker, deadline, buffer, handler):
+        while True:
+            try:
+                line = lines.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                # The command is still running, so the session can't be
+                # handed back to the pool.
+                self.kill()
+                raise EcosystemTimeout('The timeout was reached.')
+            if line is None:
+                self.kill()
+                raise EcosystemTestException(
+                    'The exec session to {0} exited unexpectedly.'.format(
+                        self.container_name))
+            if marker in line:
+                # Output that doesn't end with a new line shares its last
+                # line with the marker.
+                output, line = line.split(marker, 1)
+                if output:
+                    buffer.append(output)
+                    if handler:
+                        handler(output)
+                return marker + line
+            buffer.append(line)
+            if handler:
+                handler(line)
+
+    def close(self):
+        if self.alive:
+            try:
+                self._process.stdin.close()
+            except (OSError, ValueError):
+                pass
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.kill()
+
+    def kill(self):
+        if self.alive:
+            self._process.kill()
+        self._process.wait()
+
+
+class DockerExecSessionPool(object):
+    """Up to `size` exec sessions that are reused between commands."""
+
+    def __init__(self, container_name, size=DOCKER_EXEC_POOL_SIZE):
+        self.container_name = container_name
+        self.size = max(size, 1)
+        self._idle = []
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(self.size)
+
+    def _acquire(self):
+        with self._lock:
+            while self._idle:
+                session = self._idle.pop()
+                if session.alive:
+                    return session
+        logger.debug('Opening exec session to {0}.'.format(
+            self.container_name))
+        return DockerExecSession(self.container_name)
+
+    def _release(self, session):
+        with self._lock:
+            self._idle.append(session)
+
+    def execute(self,
+                cmd,
+                timeout=TIMEOUT,
+                handle_stdout=None,
+                handle_stderr=None):
+        """
+        Run a command on an idle session, opening one if needed.
+        :return: A tuple of exit code, stdout lines and stderr lines.
+        """
+
+        with self._slots:
+            session = self._acquire()
+            try:
+                result = session.execute(
+                    cmd, timeout, handle_stdout, handle_stderr)
+            except Exception:
+                session.close()
+                raise
+            self._release(session)
+            return result
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
+
+
+def get_session_pool(container_name, size=None):
+    """
+    Get the shared exec session pool of a container.
+    :param container_name: The manager container name.
+    :param size: The pool size, defaults to DOCKER_EXEC_POOL_SIZE.
+    :return: DockerExecSessionPool
+    """
+
+    with _pools_lock:
+        if container_name not in _pools:
+            _pools[container_name] = DockerExecSessionPool(
+                container_name, size or DOCKER_EXEC_POOL_SIZE)
+        return _pools[container_name]
+
+
+@atexit.register
+def close_session_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -15,20 +15,22 @@
 
 import os
 import json
-import shutil
 
-import requests
 from tqdm import tqdm
 from urllib.parse import urlparse
 from tempfile import NamedTemporaryFile
 
-from ecosystem_tests.dorkl.commands import handle_process
+from ecosystem_tests.dorkl.constansts import DOCKER_TRANSPORT
+from ecosystem_tests.dorkl.docker_api import get_docker_client
+from ecosystem_tests.dorkl.commands import handle_process, docker_exec_api
 from ecosystem_tests.ecosystem_tests_cli.logger import logger
 from ecosystem_cicd_tools.new_cicd.s3 import download_from_s3
+from ecosystem_cicd_tools.new_cicd.cache import fetch_url
 from ecosystem_tests.ecosystem_tests_cli.utilities import (
     get_universal_path)
 from .utils import get_url
 
+MANAGER_PORTS = [8000, 80, 443, 5671]
 DOCKER_RUN_COMMAND = """-d --name {container_name} \
     -p 8000:8000 -p 80:80 -p 443:443 -p 5671:5671 {image_name}
 """
@@ -66,20 +68,30 @@ def image_exists(image_name):
 
 
 def docker_ps():
+    if DOCKER_TRANSPORT == 'api':
+        return get_docker_client().containers()
     return handle_list_response(docker('ps -a'))
 
 
 def docker_rm(name):
+    if DOCKER_TRANSPORT == 'api':
+        return get_docker_client().remove_container(name)
     return docker('rm {name}'.format(name=name))
 
 
 def docker_images():
+    if DOCKER_TRANSPORT == 'api':
+        return get_docker_client().images()
     return handle_list_response(docker('images'))
 
 
 def docker_load(filename):
     with tqdm(desc='docker load -i {filename}'.format(filename=filename),
               total=100) as pbar:
+        if DOCKER_TRANSPORT == 'api':
+            image_name = get_docker_client().load_image(filename)
+            pbar.update(100)
+            return image_name
         result = docker('load -i {filename}'.format(
             filename=filename), json_format=False)
         pbar.update(80)
@@ -90,6 +102,8 @@ def docker_load(filename):
 
 
 def docker_rmi(image_name):
+    if DOCKER_TRANSPORT == 'api':
+        return get_docker_client().remove_image(image_name)
     return docker('rmi {image_name}'.format(image_name=image_name),
                   json_format=False)
 
@@ -122,11 +136,9 @@ def get_repo_and_tag(image_name):
 
 def download_file(url, local_filename):
     with tqdm(desc='requests GET {}'.format(url), total=100) as pbar:
-        with requests.get(url, stream=True) as r:
-            pbar.update(20)
-            with open(local_filename, 'wb') as f:
-                shutil.copyfileobj(r.raw, f)
-                pbar.update(80)
+        pbar.update(20)
+        fetch_url(url, local_filename)
+        pbar.update(80)
 
 
 def download_and_load_docker_image(url, image_name=None):
@@ -160,6 +172,12 @@ def docker_exec(command, interactive=True):
 
 
 def start_container(container_name, image_name):
+    if DOCKER_TRANSPORT == 'api':
+        get_docker_client().run_container(
+            container_name, image_name, MANAGER_PORTS)
+        return docker_exec_api(container_name,
+                               'cfy_manager wait-for-starter',
+                               log=False)
     docker_run(DOCKER_RUN_COMMAND.format(
         image_name=image_name,
         container_name=container_name)
@@ -15,9 +15,11 @@
 
 import os
 import json
+from tempfile import TemporaryDirectory
 
 from ecosystem_cicd_tools.new_cicd import s3
 from ecosystem_cicd_tools.new_cicd import actions
+from ecosystem_cicd_tools.new_cicd.plugins_index import load_plugins_json
 from ...ecosystem_tests_cli import (logger, ecosystem_tests)
 
 
@@ -26,25 +28,54 @@ from ...ecosystem_tests_cli import (logger, ecosystem_tests)
 @ecosystem_tests.options.plugins_yaml_version
 @ecosystem_tests.options.upload_to_s3
 @ecosystem_tests.options.directory
-def generate_plugins_json(plugins_yaml_version, upload_to_s3, directory):
-    json_formatted_string, filename = get_plugins_json(plugins_yaml_version)
+@ecosystem_tests.options.incremental
+def generate_plugins_json(plugins_yaml_version,
+                          upload_to_s3,
+                          directory,
+                          incremental=False):
+    json_formatted_string, filename, report = get_plugins_json(
+        plugins_yaml_version, incremental)
     filename = output_file(directory, filename, json_formatted_string)
+    if report:
+        output_file(directory,
+                    os.path.splitext(os.path.basename(filename))[0] +
+                    '_diff.json',
+                    json.dumps(report, indent=4))
     if upload_to_s3:
         upload_file(filename)
 
 
-def get_plugins_json(plugins_yaml_version):
+def get_plugins_json(plugins_yaml_version, incremental=False):
     if plugins_yaml_version == 'v1':
         filename = 'plugins.json'
-        new_json = actions.populate_plugins_json()
+        plugin_yaml_name = 'plugin.yaml'
     elif plugins_yaml_version == 'v2':
         filename = 'v2_plugins.json'
-        new_json = actions.populate_plugins_json('v2_plugin.yaml')
+        plugin_yaml_name = 'v2_plugin.yaml'
     else:
         raise RuntimeError('Unsupported plugins YAML version {}.'.format(
             plugins_yaml_version))
+    previous = get_published_plugins_json(filename) if incremental else None
+    report = None
+    if previous:
+        new_json, report = actions.update_plugins_json(
+            previous, plugin_yaml_name)
+    else:
+        new_json = actions.populate_plugins_json(plugin_yaml_name)
     json_formatted_string = json.dumps(new_json, indent=4)
-    return json_formatted_string, filename
+    return json_formatted_string, filename, report
+
+
+def get_published_plugins_json(filename):
+    with TemporaryDirectory() as directory:
+        local_path = os.path.join(directory, filename)
+        s3.download_from_s3(
+            local_path, '{}/{}'.format(s3.BUCKET_FOLDER, filename))
+        if not os.path.exists(local_path):
+            logger.logger.info(
+                'No published {}, generating all plugins.'.format(filename))
+            return
+        return load_plugins_json(local_path)
 
 
 def output_file(directory, filename, json_formatted_string):
@@ -13,8 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import sys
 import pytest
-from os import environ
+import subprocess
 
 import yaml
 from nose.tools import nottest
@@ -29,6 +31,10 @@ from ecosystem_tests.ecosystem_tests_cli import (
     decorators,
     ecosystem_tests
 )
+from ecosystem_tests.ecosystem_tests_cli.scheduler import (
+    TEST_ID_ENVAR_NAME,
+    run_blueprint_tests
+)
 
 
 @nottest
@@ -46,6 +52,7 @@ from ecosystem_tests.ecosystem_tests_cli import (
 @ecosystem_tests.options.nested_test
 @ecosystem_tests.options.dry_run
 @ecosystem_tests.options.required_ips
+@ecosystem_tests.options.workers
 @decorators.timer_decorator
 def local_blueprint_test(blueprint_path,
                          test_id,
@@ -57,7 +64,8 @@ def local_blueprint_test(blueprint_path,
                          container_name,
                          nested_test,
                          dry_run,
-                         required_ips):
+                         required_ips,
+                         workers):
 
     bp_test_ids = utilities.validate_and_generate_test_ids(
         blueprint_path, test_id)
@@ -73,11 +81,9 @@ def local_blueprint_test(blueprint_path,
                               container_name,
                               nested_test)
 
-    for blueprint, test_id in bp_test_ids:
-        environ['__ECOSYSTEM_TEST_ID'] = test_id
-        blueprint = get_universal_path(blueprint)
+    def run_test(blueprint, test_id):
         basic_blueprint_test_dev(
-            blueprint_file_name=blueprint,
+            blueprint_file_name=get_universal_path(blueprint),
             test_name=test_id,
             inputs=inputs,
             timeout=timeout,
@@ -85,10 +91,19 @@ def local_blueprint_test(blueprint_path,
             on_failure=on_failure,
             uninstall_on_success=uninstall_on_success,
             user_defined_check=nested_test_executor if nested_test else None,
-            user_defined_check_params={
-                'nested_tests': nested_test
-            } if nested_test else None)
-        del environ['__ECOSYSTEM_TEST_ID']
+            user_defined_check_params=nested_test_params(
+                nested_test, test_id, workers))
+
+    run_blueprint_tests(bp_test_ids, run_test, workers)
+
+
+def nested_test_params(nested_test, test_id, workers):
+    if not nested_test:
+        return
+    params = {'nested_tests': nested_test}
+    if workers > 1:
+        params['test_id'] = test_id
+    return params
 
 
 def handle_dry_run(bp_test_ids,
@@ -148,12 +163,25 @@ def handle_dry_run(bp_test_ids,
     logger.logger.info(dry_run_str)
 
 
-def nested_test_executor(nested_tests=None):
+def nested_test_executor(nested_tests=None, test_id=None):
+    """
+    Run nested tests with pytest.
+    :param nested_tests: The nested tests in pytest notation.
+    :param test_id: When given, run each nested test in its own process
+    with the test id in its environment, so that concurrent blueprint tests
+    don't share pytest or os.environ state.
+    """
     nested_tests = nested_tests or []
     for nested_test in nested_tests:
         logger.logger.info('Executing nested test: {test_path} '.format(
             test_path=nested_test))
-        nested_result = pytest.main(['-s', nested_test])
+        if test_id:
+            env = dict(os.environ)
+            env[TEST_ID_ENVAR_NAME] = test_id
+            nested_result = subprocess.call(
+                [sys.executable, '-m', 'pytest', '-s', nested_test], env=env)
+        else:
+            nested_result = pytest.main(['-s', nested_test])
         if nested_result != 0:
             raise Exception(
                 'Nested test {test_path} failed! '
@@ -13,7 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
 import sys
 import pytest
 from pathlib import Path
@@ -27,6 +26,7 @@ from ecosystem_tests.ecosystem_tests_cli.utilities import (
     get_universal_path)
 from ecosystem_tests.ecosystem_tests_cli.commands.local_blueprint_test import (
     handle_dry_run,
+    nested_test_params,
     nested_test_executor
 )
 from ecosystem_tests.ecosystem_tests_cli import (
@@ -35,6 +35,7 @@ from ecosystem_tests.ecosystem_tests_cli import (
     decorators,
     ecosystem_tests
 )
+from ecosystem_tests.ecosystem_tests_cli.scheduler import run_blueprint_tests
 
 
 @nottest
@@ -54,6 +55,7 @@ from ecosystem_tests.ecosystem_tests_cli import (
 @ecosystem_tests.options.nested_test
 @ecosystem_tests.options.dry_run
 @ecosystem_tests.options.required_ips
+@ecosystem_tests.options.workers
 @decorators.timer_decorator
 def remote_blueprint_test(blueprint_path,
                           test_id,
@@ -67,7 +69,8 @@ def remote_blueprint_test(blueprint_path,
                           cloudify_hostname,
                           nested_test,
                           dry_run,
-                          required_ips):
+                          required_ips,
+                          workers):
 
     bp_test_ids = utilities.validate_and_generate_test_ids(
         blueprint_path, test_id)
@@ -84,8 +87,7 @@ def remote_blueprint_test(blueprint_path,
                               cloudify_host=cloudify_host,
                               cloudify_tenant=cloudify_tenant)
 
-    for blueprint, test_id in bp_test_ids:
-        os.environ['__ECOSYSTEM_TEST_ID'] = test_id
+    def run_test(blueprint, test_id):
         blueprint = Path(blueprint).resolve().as_posix()
         logger.logger.info('Starting with {}:{}'.format(test_id, blueprint))
         basic_blueprint_test_dev(
@@ -97,7 +99,7 @@ def remote_blueprint_test(blueprint_path,
             on_failure=on_failure,
             uninstall_on_success=uninstall_on_success,
             user_defined_check=nested_test_executor if nested_test else None,
-            user_defined_check_params={
-                'nested_tests': nested_test
-            } if nested_test else None)
-        del os.environ['__ECOSYSTEM_TEST_ID']
+            user_defined_check_params=nested_test_params(
+                nested_test, test_id, workers))
+
+    run_blueprint_tests(bp_test_ids, run_test, workers)
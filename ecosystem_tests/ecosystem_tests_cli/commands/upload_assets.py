@@ -34,11 +34,13 @@ INCLUDE_NAMES = ['plugin.yaml', 'v2_plugin.yaml']
 @ecosystem_tests.options.assets
 @ecosystem_tests.options.repo
 @ecosystem_tests.options.org
+@ecosystem_tests.options.verify_only
 def upload_assets(assets,
                   repo,
                   github_token=None,
                   org=None,
-                  release=None):
+                  release=None,
+                  verify_only=False):
 
     copy_files_to_workspace()
     assets = get_assets_dict(assets)
@@ -62,6 +64,14 @@ def upload_assets(assets,
     if github_token:
         kwargs['github_token'] = github_token
 
+    if verify_only:
+        diffs = actions.reconcile_release_assets(**kwargs)
+        if not all(diff.ok for diff in diffs.values()):
+            raise RuntimeError(
+                'The {} {} release assets are not in sync.'.format(
+                    repo, release))
+        return
+
     logger.logger.info(
         'Uploading these assets to the {} {} release: {}.'.format(
             repo, release, ', '.join(kwargs['assets'].keys())))
@@ -19,6 +19,7 @@ import yaml
 
 from ecosystem_cicd_tools.new_cicd import s3
 from ecosystem_cicd_tools.new_cicd import actions
+from ecosystem_cicd_tools.new_cicd.plugins_index import PluginsIndex
 from ...ecosystem_tests_cli import (
     logger,
     ecosystem_tests
@@ -43,6 +44,9 @@ def verify_plugins_json(name, plugin_version, plugins_yaml_version):
             plugins_yaml_version):
         raise RuntimeError(
             'Failed to find {} {}'.format(name, plugin_version))
+    record = PluginsIndex(plugins_json_content).get(name, plugin_version)
+    if record:
+        actions.reconcile_plugins_json_assets(record.data)
 
 
 def download_file(plugins_yaml_version):
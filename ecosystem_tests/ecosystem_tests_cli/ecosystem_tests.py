@@ -274,6 +274,13 @@ class Options(object):
                                          is_flag=True,
                                          help='If to upload to s3.')
 
+        self.incremental = click.option(
+            '--incremental',
+            type=click.BOOL,
+            is_flag=True,
+            help='Only update the plugins that changed since the '
+                 'published plugins JSON.')
+
         self.plugins_yaml_version = click.option('-pyv',
                                                  '--plugins-yaml-version',
                                                  default='v1',
@@ -307,6 +314,13 @@ class Options(object):
                                     type=click.STRING,
                                     help='Github release name.')
 
+        self.verify_only = click.option(
+            '--verify-only',
+            type=click.BOOL,
+            is_flag=True,
+            help='Compare the assets with Github, S3 and the marketplace '
+                 'without uploading them.')
+
         self.github_token = click.option('-gt',
                                          '--github-token',
                                          default=TOKEN,
@@ -461,5 +475,11 @@ class Options(object):
                                               'test. Checks by the reqion in '
                                               'AWS_REGION_NAME env var.')
 
+        self.workers = click.option('--workers',
+                                    type=click.INT,
+                                    default=1,
+                                    show_default=1,
+                                    help=helptexts.WORKERS)
+
 
 options = Options()
@@ -32,6 +32,10 @@ TEST_TIMEOUT = 'Test timeout (seconds).'
 
 TEST_ID = 'Test id, the name of the test deployment.'
 
+WORKERS = 'How many blueprint tests to run concurrently against the ' \
+          'manager. Failed tests do not stop the others, and a summary ' \
+          'is printed at the end.'
+
 NESTED_TEST = 'Nested tests, will run by pytest, should be specified in the ' \
               'pytest notation like: path/to/module.py::TestClass::test_method'
 
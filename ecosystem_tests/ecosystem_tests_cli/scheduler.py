@@ -0,0 +1,115 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .logger import logger
+from .constants import RED, GREEN, RESET
+from .exceptions import EcosystemTestCliException
+
+TEST_ID_ENVAR_NAME = '__ECOSYSTEM_TEST_ID'
+
+# Whether the blueprint test in this thread runs alongside other tests.
+current_test = threading.local()
+
+
+def running_concurrently():
+    """
+    :return: True if this thread runs one of several concurrent tests.
+    """
+    return getattr(current_test, 'concurrent', False)
+
+
+class BlueprintTestResult(object):
+
+    def __init__(self, blueprint, test_id):
+        self.blueprint = blueprint
+        self.test_id = test_id
+        self.error = None
+        self.duration = 0
+
+    @property
+    def passed(self):
+        return self.error is None
+
+
+def _run_one(run_test, blueprint, test_id, set_environ):
+    result = BlueprintTestResult(blueprint, test_id)
+    current_test.concurrent = not set_environ
+    if set_environ:
+        os.environ[TEST_ID_ENVAR_NAME] = test_id
+    start = time.time()
+    try:
+        run_test(blueprint, test_id)
+    except (Exception, SystemExit) as e:
+        # Failed tests are reported in the summary, the others keep going.
+        logger.error(RED + 'Test {0} failed: {1}'.format(
+            test_id, traceback.format_exc()) + RESET)
+        result.error = e
+    finally:
+        result.duration = time.time() - start
+        if set_environ:
+            del os.environ[TEST_ID_ENVAR_NAME]
+        current_test.concurrent = False
+    return result
+
+
+def log_summary(results):
+    lines = ['Blueprint tests summary:']
+    for result in results:
+        status = GREEN + 'PASSED' if result.passed else RED + 'FAILED'
+        lines.append('{status}{reset} {test_id} {blueprint} '
+                     '({duration:.0f}s)'.format(status=status,
+                                                reset=RESET,
+                                                test_id=result.test_id,
+                                                blueprint=result.blueprint,
+                                                duration=result.duration))
+    logger.info('\n'.join(lines))
+
+
+def run_blueprint_tests(bp_test_ids, run_test, workers=1):
+    """
+    Run blueprint tests, up to `workers` of them at the same time.
+    Every test runs to completion even if another one fails.
+    :param bp_test_ids: A list of (blueprint, test_id) tuples.
+    :param run_test: Callable that receives a blueprint and a test id.
+    :param workers: How many tests to run concurrently.
+    :return: A list of BlueprintTestResult, in the order of bp_test_ids.
+    """
+
+    workers = max(min(workers, len(bp_test_ids)), 1)
+    if workers == 1:
+        # Serial tests also export the test id to the environment, for
+        # nested tests that are executed in the same process.
+        results = [_run_one(run_test, blueprint, test_id, True)
+                   for blueprint, test_id in bp_test_ids]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(
+                _run_one, run_test, blueprint, test_id, False)
+                for blueprint, test_id in bp_test_ids]
+        results = [future.result() for future in futures]
+
+    log_summary(results)
+    failed = [result.test_id for result in results if not result.passed]
+    if failed:
+        raise EcosystemTestCliException(
+            '{0} of {1} blueprint tests failed: {2}'.format(
+                len(failed), len(results), ', '.join(failed)))
+    return results
@@ -0,0 +1,551 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""asyncio twin of nerdl.api.
+
+One event loop can follow many executions at once, each with its own
+timeout, over a single pooled aiohttp session:
+
+    async with AsyncCloudifyClient() as client:
+        await wait_for_executions(execution_ids, client=client)
+
+The blocking functions in nerdl.api run these coroutines with `run`.
+"""
+
+import re
+import ssl
+import asyncio
+import functools
+
+import aiohttp
+from cloudify.models_states import BlueprintUploadState
+from cloudify_rest_client import exceptions, executions
+
+from ecosystem_tests.dorkl.polling import AdaptivePoller
+from ecosystem_tests.dorkl.blueprint_cache import (blueprint_digest,
+                                                   find_cached_blueprint)
+from ecosystem_tests.dorkl.constansts import (EVENTS_BATCH_SIZE,
+                                              BLUEPRINT_DIGEST_LABEL)
+from ecosystem_tests.ecosystem_tests_cli.logger import logger
+from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
+                                              EcosystemTestException)
+from ecosystem_tests.nerdl.utils import (get_client,
+                                         CLIENT_POOL_SIZE,
+                                         generate_progress_handler)
+
+JIBBERISH = [
+    'Creating node instance',
+    'Node instance created',
+    'Starting node instance',
+    'Node instance started',
+    'Subgraph started',
+    'Subgraph succeeded',
+    'Stopping node instance',
+    'Stopped node instance',
+    'Deleting node instance',
+    'Deleted node instance',
+]
+JIBBERISH_MATCHER = re.compile('|'.join(re.escape(s) for s in JIBBERISH))
+# Logs below these levels are filtered by the manager, not downloaded.
+LOG_LEVELS = ['info', 'warning', 'error']
+RESOURCE_TIMEOUT = 120
+DEP_CREATE = 'create_deployment_environment'
+# The state of a resource that the manager no longer knows about.
+DELETED = 'deleted'
+
+
+def run(coroutine):
+    """
+    Run a coroutine from blocking code.
+    :param coroutine: The coroutine to run in a new event loop.
+    :return: The coroutine result.
+    """
+
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def _query(params):
+    """aiohttp only accepts strings, and repeats keys for list values."""
+    query = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            query.append((key, str(item)))
+    return query
+
+
+class AsyncCloudifyClient(object):
+    """Minimal async REST client for the manager endpoints nerdl polls.
+
+    The URL, auth headers and certificate settings are taken from the
+    blocking client for the same connection details, so both talk to
+    the same manager as the same user.
+    """
+
+    def __init__(self, client_kwargs=None, pool_size=CLIENT_POOL_SIZE):
+        self.client_kwargs = client_kwargs
+        http = get_client(client_kwargs)._client
+        self.url = http.url
+        self.headers = {k: v for k, v in http.headers.items()
+                        if v is not None}
+        self.pool_size = pool_size
+        verify = http.get_request_verify()
+        if verify is False:
+            self._ssl = False
+        elif verify is True:
+            self._ssl = None
+        else:
+            self._ssl = ssl.create_default_context(cafile=verify)
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size,
+                                               ssl=self._ssl),
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(sock_connect=5,
+                                              sock_read=300))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def request(self,
+                      method,
+                      uri,
+                      data=None,
+                      params=None,
+                      expected_status_code=(200,)):
+        async with self.session.request(method,
+                                        self.url + uri,
+                                        json=data,
+                                        params=_query(params or {})) as resp:
+            if resp.status not in expected_status_code:
+                body = await resp.text()
+                try:
+                    message = (await resp.json(content_type=None)).get(
+                        'message') or body
+                except ValueError:
+                    message = body
+                raise exceptions.CloudifyClientError(
+                    '{0}: {1}'.format(resp.status, message),
+                    status_code=resp.status)
+            if resp.status == 204:
+                return
+            return await resp.json(content_type=None)
+
+    async def get(self, uri, _include=None, **params):
+        if _include:
+            params['_include'] = ','.join(_include)
+        return await self.request('GET', uri, params=params)
+
+
+def with_async_client(func):
+    """
+    Async counterpart of nerdl.utils.with_client.
+    Callers that pass their own client keep using it, so many coroutines
+    can share one connection pool. Otherwise a client is opened and closed
+    around the call.
+    """
+
+    @functools.wraps(func)
+    async def wrapper_inner(*args, **kwargs):
+        if kwargs.get('client'):
+            return await func(*args, **kwargs)
+        async with AsyncCloudifyClient() as client:
+            kwargs['client'] = client
+            return await func(*args, **kwargs)
+    return wrapper_inner
+
+
+class WaitResult(object):
+    """How a wait_for_state call ended, for timing reports."""
+
+    def __init__(self,
+                 description,
+                 state,
+                 attempts,
+                 elapsed,
+                 resource_id=None):
+        self.description = description
+        self.state = state
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.resource_id = resource_id
+
+    def __repr__(self):
+        return '<WaitResult {0}: {1} after {2} polls in {3:.1f}s>'.format(
+            self.description, self.state, self.attempts, self.elapsed)
+
+
+async def wait_for_state(get_state,
+                         states,
+                         timeout,
+                         description,
+                         failed_states=()):
+    """
+    Poll a resource state with backoff until it reaches one of `states`.
+    :param get_state: A coroutine function without arguments.
+    :param states: The states that end the wait.
+    :param timeout: Seconds to wait.
+    :param description: What we are waiting for, for logs and errors.
+    :param failed_states: States that end the wait with an error.
+    :return: WaitResult
+    """
+
+    poller = AdaptivePoller(timeout)
+    state = None
+    async for attempt in poller:
+        state = await get_state()
+        if state in failed_states:
+            raise EcosystemTestException(
+                'Failed {0}: state is {1}.'.format(description, state))
+        if state in states:
+            result = WaitResult(description, state, attempt + 1,
+                                poller.elapsed)
+            logger.debug(result)
+            return result
+    raise EcosystemTimeout(
+        'Timed out after {0} seconds waiting for {1}, state is {2}.'.format(
+            timeout, description, state))
+
+
+@with_async_client
+async def blueprint_state(blueprint_id, client):
+    try:
+        result = await client.get('/blueprints/{0}'.format(blueprint_id),
+                                  _include=['state'])
+    except exceptions.CloudifyClientError as e:
+        if e.status_code == 404:
+            return DELETED
+        raise
+    return result.get('state')
+
+
+@with_async_client
+async def deployment_create_state(deployment_id, client):
+    """
+    The status of the deployment environment creation execution.
+    """
+
+    try:
+        response = await client.get('/executions',
+                                    _include=['status'],
+                                    deployment_id=deployment_id,
+                                    workflow_id=DEP_CREATE,
+                                    _sort='-created_at',
+                                    _size=1)
+    except exceptions.CloudifyClientError as e:
+        if e.status_code == 404:
+            return DELETED
+        raise
+    if response['items']:
+        return response['items'][0].get('status')
+
+
+@with_async_client
+async def deployment_state(deployment_id, client):
+    try:
+        result = await client.get('/deployments/{0}'.format(deployment_id),
+                                  _include=['deployment_status'])
+    except exceptions.CloudifyClientError as e:
+        if e.status_code == 404:
+            return DELETED
+        raise
+    return result.get('deployment_status')
+
+
+@with_async_client
+async def upload_blueprint(main_file_path,
+                           blueprint_id,
+                           client,
+                           test_name=None):
+    """
+    Upload a blueprint, unless the same content is already uploaded as
+    blueprint_id, or with test_name, as any blueprint of the test.
+    :return: WaitResult, with the id of the uploaded or reused blueprint.
+    """
+
+    digest = blueprint_digest(main_file_path)
+    blueprints = await client.get('/blueprints',
+                                  _include=['id', 'state', 'labels'],
+                                  _size=1000)
+    cached_id = find_cached_blueprint(blueprints['items'],
+                                      digest,
+                                      None if test_name else blueprint_id,
+                                      test_name)
+    if cached_id:
+        logger.info('Blueprint {0} is unchanged, using {1}.'.format(
+            main_file_path, cached_id))
+        return WaitResult('blueprint {0} upload'.format(cached_id),
+                          BlueprintUploadState.UPLOADED,
+                          0,
+                          0.0,
+                          resource_id=cached_id)
+    logger.info('Uploading blueprint {}'.format(blueprint_id))
+    # Packing and streaming the blueprint archive is left to the blocking
+    # client, in a worker thread so the event loop keeps running.
+    await asyncio.get_event_loop().run_in_executor(
+        None,
+        functools.partial(
+            get_client(client.client_kwargs).blueprints.upload,
+            main_file_path,
+            blueprint_id,
+            labels=[{BLUEPRINT_DIGEST_LABEL: digest}],
+            progress_callback=generate_progress_handler(main_file_path, '')))
+    result = await wait_for_state(
+        functools.partial(blueprint_state, blueprint_id, client=client),
+        [BlueprintUploadState.UPLOADED],
+        RESOURCE_TIMEOUT,
+        'blueprint {0} upload'.format(blueprint_id),
+        failed_states=BlueprintUploadState.FAILED_STATES)
+    result.resource_id = blueprint_id
+    logger.info('Blueprint {} uploaded.'.format(blueprint_id))
+    return result
+
+
+@with_async_client
+async def delete_blueprint(blueprint_id, client):
+    await client.request('DELETE',
+                         '/blueprints/{0}'.format(blueprint_id),
+                         params={'force': False},
+                         expected_status_code=(200, 204))
+    result = await wait_for_state(
+        functools.partial(blueprint_state, blueprint_id, client=client),
+        [DELETED],
+        RESOURCE_TIMEOUT,
+        'blueprint {0} deletion'.format(blueprint_id))
+    logger.info('Blueprint {} deleted.'.format(blueprint_id))
+    return result
+
+
+@with_async_client
+async def create_deployment(blueprint_id, deployment_id, inputs, client):
+    await client.request('PUT',
+                         '/deployments/{0}'.format(deployment_id),
+                         data={'blueprint_id': blueprint_id,
+                               'inputs': inputs,
+                               'display_name': deployment_id,
+                               'visibility': 'tenant'},
+                         expected_status_code=(200, 201))
+    # A failed environment creation is reported, with its events, by
+    # wait_for_deployment_create.
+    result = await wait_for_state(
+        functools.partial(deployment_create_state,
+                          deployment_id,
+                          client=client),
+        executions.Execution.END_STATES,
+        RESOURCE_TIMEOUT,
+        'deployment {0} creation'.format(deployment_id))
+    logger.info('Deployment {} created.'.format(deployment_id))
+    return result
+
+
+@with_async_client
+async def delete_deployment(deployment_id, client):
+    await client.request('DELETE',
+                         '/deployments/{0}'.format(deployment_id),
+                         params={'force': False,
+                                 'delete_logs': False,
+                                 'recursive': False},
+                         expected_status_code=(200, 204))
+    result = await wait_for_state(
+        functools.partial(deployment_state, deployment_id, client=client),
+        [DELETED],
+        RESOURCE_TIMEOUT,
+        'deployment {0} deletion'.format(deployment_id))
+    logger.info('Deployment {} deleted.'.format(deployment_id))
+    return result
+
+
+@with_async_client
+async def get_execution_status(execution_id, client):
+    execution = await client.get('/executions/{0}'.format(execution_id),
+                                 _include=['status'])
+    return execution.get('status')
+
+
+@with_async_client
+async def get_events(execution_id,
+                     offset,
+                     client,
+                     size=EVENTS_BATCH_SIZE,
+                     include_logs=False,
+                     levels=None):
+    params = {'execution_id': execution_id,
+              'type': ['cloudify_event'],
+              '_offset': offset,
+              '_size': size,
+              '_sort': '@timestamp'}
+    if include_logs:
+        params['type'].append('cloudify_log')
+        params['level'] = levels or LOG_LEVELS
+    response = await client.get('/events', **params)
+    return response['items'], \
+        response['metadata']['pagination']['total']
+
+
+class EventCursor(object):
+    """Read the events of an execution incrementally.
+
+    The cursor keeps the offset between calls, so every event is downloaded
+    once, and drains full batches in one `fetch` so a burst of events does
+    not wait for the next poll.
+    """
+
+    def __init__(self,
+                 execution_id,
+                 size=EVENTS_BATCH_SIZE,
+                 include_logs=False,
+                 levels=None):
+        self.execution_id = execution_id
+        self.size = size
+        self.include_logs = include_logs
+        self.levels = levels
+        self.offset = 0
+
+    async def fetch(self, client):
+        """
+        :param client: AsyncCloudifyClient.
+        :return: The events that were added since the last fetch.
+        """
+
+        events = []
+        while True:
+            batch, total = await get_events(self.execution_id,
+                                            self.offset,
+                                            client=client,
+                                            size=self.size,
+                                            include_logs=self.include_logs,
+                                            levels=self.levels)
+            self.offset += len(batch)
+            events.extend(batch)
+            if len(batch) < self.size or self.offset >= total:
+                return events
+
+
+def log_event(execution_id, event, status):
+    """
+    Log one execution event the way nerdl always has, and fail fast on a
+    NonRecoverableError of an execution that already failed.
+    """
+
+    if JIBBERISH_MATCHER.match(event.get('message') or ''):
+        return
+    message = '{}:{}:{}:{}'.format(
+        event.get('deployment_id'),
+        event.get('workflow_id'),
+        event.get('node_name'),
+        event.get('message')
+    )
+    error_causes = event.get('error_causes') or []
+    if error_causes:
+        logger.error('{}:{}'.format(message, error_causes))
+        for cause in error_causes:
+            if cause.get('type') == 'NonRecoverableError' and \
+                    status == executions.Execution.FAILED:
+                raise EcosystemTestException(
+                    'Execution {} failed....'.format(execution_id))
+    elif 'nothing to do' not in message:
+        logger.info(message)
+
+
+async def _follow_execution(execution_id, client):
+    status = await get_execution_status(execution_id, client=client)
+    logger.info('Checking execution {} status: {}'.format(
+        execution_id, status))
+    cursor = EventCursor(execution_id)
+    poller = AdaptivePoller(float('inf'))
+    async for _ in poller:
+        status = await get_execution_status(execution_id, client=client)
+        logger.debug('Execution {} is {}'.format(execution_id, status))
+        events = await cursor.fetch(client)
+        if events:
+            poller.reset()
+        for event in events:
+            log_event(execution_id, event, status)
+        if status in executions.Execution.END_STATES:
+            if status == executions.Execution.FAILED:
+                raise EcosystemTestException(
+                    'Execution {} failed....'.format(execution_id))
+            logger.info('Execution {} in state {}'.format(
+                execution_id, status))
+            return status
+
+
+@with_async_client
+async def wait_for_execution(execution_id, timeout=1800, client=None):
+    """
+    Follow an execution until it ends, logging its events.
+    On timeout, the pending requests are cancelled.
+    :param execution_id: The execution to follow.
+    :param timeout: Seconds to wait.
+    :param client: AsyncCloudifyClient.
+    :return: The execution end status.
+    """
+
+    try:
+        return await asyncio.wait_for(
+            _follow_execution(execution_id, client), timeout)
+    except asyncio.TimeoutError:
+        raise EcosystemTimeout(
+            'Failed to verify execution {} '
+            'completion in {} seconds.'.format(execution_id, timeout))
+
+
+@with_async_client
+async def wait_for_executions(execution_ids, timeout=1800, client=None):
+    """
+    Follow many executions concurrently, over one connection pool.
+    Every execution is followed to its end even if another one fails.
+    :param execution_ids: The executions to follow.
+    :param timeout: Seconds to wait for each execution.
+    :param client: AsyncCloudifyClient.
+    :return: A dict of execution id to end status.
+    """
+
+    results = await asyncio.gather(
+        *[wait_for_execution(execution_id, timeout=timeout, client=client)
+          for execution_id in execution_ids],
+        return_exceptions=True)
+    failed = []
+    for execution_id, result in zip(execution_ids, results):
+        if isinstance(result, Exception):
+            logger.error('Execution {} failed: {}'.format(
+                execution_id, result))
+            failed.append(execution_id)
+    if failed:
+        raise EcosystemTestException(
+            '{0} of {1} executions failed: {2}'.format(
+                len(failed), len(execution_ids), ', '.join(failed)))
+    return dict(zip(execution_ids, results))
@@ -24,64 +24,26 @@ import tempfile
 import contextlib
 from urllib.parse import urlparse
 
+from ecosystem_tests.nerdl import aio
+from ecosystem_tests.nerdl.aio import DEP_CREATE
 from ecosystem_tests.nerdl.utils import (
     zip_files,
+    with_client,
     download_file,
     get_local_path,
     generate_progress_handler,
 )
 from ecosystem_tests.ecosystem_tests_cli.logger import logger
+from ecosystem_tests.dorkl.exceptions import (EcosystemTimeout,
+                                              EcosystemTestException)
 from cloudify_rest_client import (
-    utils, exceptions, executions, CloudifyClient)
+    utils, exceptions, executions)
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-DEP_CREATE = 'create_deployment_environment'
-JIBBERISH = [
-    'Creating node instance',
-    'Node instance created',
-    'Starting node instance',
-    'Node instance started',
-    'Subgraph started',
-    'Subgraph succeeded',
-    'Stopping node instance',
-    'Stopped node instance',
-    'Deleting node instance',
-    'Deleted node instance',
-]
 PLUGIN_ID_EXC_REG = r'Plugin\sid=\`[A-Za-z0-9\-]{1,50}\`'
 
 
-def with_client(func):
-    """
-    :param func: This is fn to be called.
-    :return: a wrapper object encapsulating the invoked function
-    """
-
-    def wrapper_inner(*args, **kwargs):
-        kwargs['client'] = CloudifyClient(**get_client_kwargs_from_env())
-        return func(*args, **kwargs)
-    return wrapper_inner
-
-
-def get_client_kwargs_from_env():
-    client_kwargs = {'protocol': 'https'}
-    if 'CLOUDIFY_HOST' in os.environ:
-        client_kwargs['host'] = os.environ['CLOUDIFY_HOST']
-    if 'CLOUDIFY_TENANT' in os.environ:
-        client_kwargs['tenant'] = os.environ['CLOUDIFY_TENANT']
-    elif 'CIRCLE_PROJECT_REPONAME' in os.environ:
-        client_kwargs['tenant'] = os.environ['CIRCLE_PROJECT_REPONAME']
-    if 'CLOUDIFY_TOKEN' in os.environ:
-        client_kwargs['token'] = os.environ['CLOUDIFY_TOKEN']
-    if 'CLOUDIFY_CERTIFICATE' in os.environ and os.path.exists(
-            os.environ['CLOUDIFY_CERTIFICATE']):
-        client_kwargs['cert'] = os.environ['CLOUDIFY_CERTIFICATE']
-    else:
-        client_kwargs['trust_all'] = True
-    return client_kwargs
-
-
 @with_client
 def list_blueprints(client):
     include = ['id', 'main_file_name', 'labels']
@@ -117,56 +79,18 @@ def get_node_instance(node_instance_id, client):
         node_instance_id, _include=['id', 'state', 'runtime_properties'])
 
 
-@with_client
-def upload_blueprint(main_file_path, blueprint_id, client):
-    logger.info('Uploading blueprint {}'.format(blueprint_id))
-    client.blueprints.upload(
-        main_file_path,
-        blueprint_id,
-        progress_callback=generate_progress_handler(main_file_path, ''),
-    )
-    timeout = 120
-    start = time.time()
-    while int(time.time() - start) < timeout:
-        if blueprint_exists(blueprint_id):
-            logger.info('Blueprint {} uploaded.'.format(blueprint_id))
-            return
-        time.sleep(5)
-    logger.error('Failed to upload blueprint.')
-    sys.exit(1)
+def upload_blueprint(main_file_path, blueprint_id, test_name=None):
+    return aio.run(aio.upload_blueprint(
+        main_file_path, blueprint_id, test_name=test_name))
 
 
-@with_client
-def delete_blueprint(blueprint_id, client):
-    client.blueprints.delete(blueprint_id)
-    timeout = 120
-    start = time.time()
-    while int(time.time() - start) < timeout:
-        if not blueprint_exists(blueprint_id):
-            logger.info('Blueprint {} deleted.'.format(blueprint_id))
-            return
-        time.sleep(5)
-    logger.error('Failed to delete blueprint.')
-    sys.exit(1)
+def delete_blueprint(blueprint_id):
+    return aio.run(aio.delete_blueprint(blueprint_id))
 
 
-@with_client
-def create_deployment(blueprint_id, deployment_id, inputs, client):
-    client.deployments.create(
-        blueprint_id=blueprint_id,
-        deployment_id=deployment_id,
-        inputs=inputs,
-        display_name=deployment_id
-    )
-    timeout = 120
-    start = time.time()
-    while int(time.time() - start) < timeout:
-        if deployment_exists(deployment_id):
-            logger.info('Deployment {} created.'.format(deployment_id))
-            return
-        time.sleep(5)
-    logger.error('Failed to create deployment.')
-    sys.exit(1)
+def create_deployment(blueprint_id, deployment_id, inputs):
+    return aio.run(
+        aio.create_deployment(blueprint_id, deployment_id, inputs))
 
 
 @with_client
@@ -179,24 +103,15 @@ def update_deployment_wrapper(main_file_name,
                               update_id,
                               inputs,
                               deployment_id):
-    upload_blueprint(main_file_name, update_id)
+    update_id = upload_blueprint(
+        main_file_name, update_id, test_name=deployment_id).resource_id
     update_deployment(deployment_id, update_id, inputs)
     exec_id = get_execution(deployment_id, 'update')
     wait_for_execution(exec_id)
 
 
-@with_client
-def delete_deployment(deployment_id, client):
-    client.deployments.delete(deployment_id)
-    timeout = 120
-    start = time.time()
-    while int(time.time() - start) < timeout:
-        if not deployment_exists(deployment_id):
-            logger.info('Deployment {} deleted.'.format(deployment_id))
-            return
-        time.sleep(5)
-    logger.error('Failed to delete deployment.')
-    sys.exit(1)
+def delete_deployment(deployment_id):
+    return aio.run(aio.delete_deployment(deployment_id))
 
 
 @with_client
@@ -221,55 +136,8 @@ def start_execution(deployment_id, client, workflow, params=None):
         return client.executions.start(deployment_id, workflow)
 
 
-@with_client
-def wait_for_execution(execution_id, client, timeout=1800):
-    exec = client.executions.get(execution_id, _include=['status'])
-    logger.info('Checking execution {} status: {}'.format(
-        execution_id,
-        exec.get('status')))
-    total = 0
-    start = time.time()
-    while int(time.time() - start) < timeout:
-        exec = client.executions.get(execution_id, _include=['status'])
-        logger.info('Exec is {}'.format(exec))
-        events, total = client.events.get(execution_id, total)
-        for event in events:
-            em = event.get('message', '')
-            if any([em.startswith(s) for s in JIBBERISH]):
-                continue
-            message = '{}:{}:{}:{}'.format(
-                event.get('deployment_id'),
-                event.get('workflow_id'),
-                event.get('node_name'),
-                event.get('message')
-            )
-            error_causes = event.get('error_causes', [])
-            if error_causes:
-                message = '{}:{}'.format(
-                    message, error_causes)
-                logger.error(message)
-                for cause in error_causes:
-                    if cause.get('type') == 'NonRecoverableError' and \
-                            exec.get('status') in executions.Execution.FAILED:
-                        raise Exception('Execution {} failed....'.format(
-                            execution_id))
-            else:
-                if 'nothing to do' not in message:
-                    logger.info(message)
-
-        if exec.get('status') in executions.Execution.END_STATES:
-            if exec.get('status').lower() == executions.Execution.FAILED:
-                raise Exception('Execution {} failed....'.format(
-                    execution_id))
-            logger.info('Workflow ID {} in state {}'.format(
-                event.get('workflow_id'), exec.get('status')))
-            return exec.get('status')
-        time.sleep(5)
-        # TODO: Add Logger Here.
-    raise Exception(
-        'Failed to verify execution {} '
-        'completion in {} seconds.'.format(
-            execution_id, timeout))
+def wait_for_execution(execution_id, timeout=1800):
+    return aio.run(aio.wait_for_execution(execution_id, timeout=timeout))
 
 
 @with_client
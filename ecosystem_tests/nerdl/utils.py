@@ -20,13 +20,22 @@ import zipfile
 import requests
 import tempfile
 import contextlib
+from threading import Lock
 from urllib.parse import urlparse
 
+from requests.adapters import HTTPAdapter
+
 from ecosystem_tests.ecosystem_tests_cli.logger import logger
+from ecosystem_cicd_tools.new_cicd.cache import fetch_url
 
 from cloudify_rest_client import CloudifyClient
 
 DEP_CREATE = 'create_deployment_environment'
+# Keep-alive connections per manager host, shared by concurrent callers.
+CLIENT_POOL_SIZE = int(os.environ.get('CLOUDIFY_CLIENT_POOL_SIZE', 10))
+
+_clients = {}
+_clients_lock = Lock()
 
 
 def with_client(func):
@@ -36,14 +45,67 @@ def with_client(func):
     """
 
     def wrapper_inner(*args, **kwargs):
-        kwargs['client'] = CloudifyClient(**get_client_kwargs_from_env())
+        kwargs['client'] = get_client()
         return func(*args, **kwargs)
     return wrapper_inner
 
 
-def download_file(url, destination=None, keep_name=False):
-    CHUNK_SIZE = 1024
+def get_client_kwargs_from_env():
+    client_kwargs = {'protocol': 'https'}
+    if 'CLOUDIFY_HOST' in os.environ:
+        client_kwargs['host'] = os.environ['CLOUDIFY_HOST']
+    if 'CLOUDIFY_TENANT' in os.environ:
+        client_kwargs['tenant'] = os.environ['CLOUDIFY_TENANT']
+    elif 'CIRCLE_PROJECT_REPONAME' in os.environ:
+        client_kwargs['tenant'] = os.environ['CIRCLE_PROJECT_REPONAME']
+    if 'CLOUDIFY_TOKEN' in os.environ:
+        client_kwargs['token'] = os.environ['CLOUDIFY_TOKEN']
+    if 'CLOUDIFY_CERTIFICATE' in os.environ and os.path.exists(
+            os.environ['CLOUDIFY_CERTIFICATE']):
+        client_kwargs['cert'] = os.environ['CLOUDIFY_CERTIFICATE']
+    else:
+        client_kwargs['trust_all'] = True
+    return client_kwargs
+
 
+def get_client(client_kwargs=None):
+    """
+    Get a process-wide CloudifyClient for the given connection details.
+    Clients are cached by host, tenant, token and certificate settings, and
+    share a keep-alive requests session with CLIENT_POOL_SIZE connections,
+    so TLS handshakes are not repeated for every API call.
+    :param client_kwargs: CloudifyClient kwargs, defaults to the env vars.
+    :return: CloudifyClient
+    """
+
+    client_kwargs = client_kwargs or get_client_kwargs_from_env()
+    key = tuple(sorted(client_kwargs.items()))
+    with _clients_lock:
+        if key not in _clients:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=CLIENT_POOL_SIZE,
+                                  pool_maxsize=CLIENT_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _clients[key] = (
+                CloudifyClient(session=session, **client_kwargs), session)
+        return _clients[key][0]
+
+
+def invalidate_clients():
+    """
+    Drop all cached clients and close their connections.
+    Call this when the manager credentials rotate.
+    """
+
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for _, session in clients:
+        session.close()
+
+
+def download_file(url, destination=None, keep_name=False):
     if not destination:
         if keep_name:
             path = urlparse(url).path
@@ -54,20 +116,10 @@ def download_file(url, destination=None, keep_name=False):
             os.close(fd)
 
     try:
-        response = requests.get(url, stream=True)
+        fetch_url(url, destination)
     except requests.exceptions.RequestException as ex:
         logger.error('Failed to call GET on {0}'.format(url))
         sys.exit(1)
-
-    final_url = response.url
-    if final_url != url:
-        logger.debug('Redirected to {0}'.format(final_url))
-        pass
-
-    try:
-        with open(destination, 'wb') as destination_file:
-            for chunk in response.iter_content(CHUNK_SIZE):
-                destination_file.write(chunk)
     except IOError as ex:
         logger.error('Failed to write to {0}'.format(destination))
         sys.exit(1)
@@ -0,0 +1,213 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import json
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import socketserver
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler
+
+from mock import patch
+from testtools import TestCase
+
+from ..dorkl import docker_api
+from ..dorkl.constansts import get_docker_socket
+from ..dorkl.docker_api import DockerEngineClient
+from ..dorkl.exceptions import EcosystemTestException
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *_):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if not size:
+                    self.rfile.readline()
+                    return body
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _send(self, status, body=b'', content_type='application/json'):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_body()
+        if url.path.endswith('/exec'):
+            self.server.commands.append(json.loads(body)['Cmd'])
+            return self._send(201, {'Id': 'exec1'})
+        if url.path.endswith('/exec/exec1/start'):
+            cmd = self.server.commands[-1]
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'application/vnd.docker.multiplexed-stream')
+            self.end_headers()
+            for stream_type, payload in [(1, ' '.join(cmd) + '\nmore'),
+                                         (1, ' output\n'),
+                                         (2, 'warning\n')]:
+                payload = payload.encode('utf-8')
+                self.wfile.write(
+                    struct.pack('>BxxxL', stream_type, len(payload)))
+                self.wfile.write(payload)
+            self.close_connection = True
+            return
+        self._send(404, {'message': 'page not found'})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.endswith('/exec/exec1/json'):
+            exit_code = 1 if self.server.commands[-1][0] == 'false' else 0
+            return self._send(200, {'ExitCode': exit_code})
+        if url.path.endswith('/archive'):
+            path = parse_qs(url.query)['path'][0]
+            if path not in self.server.files:
+                return self._send(404, {'message': 'no such file'})
+            return self._send(200,
+                              self.server.files[path],
+                              'application/x-tar')
+        self._send(404, {'message': 'page not found'})
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        remote_dir = parse_qs(url.query)['path'][0]
+        with tarfile.open(fileobj=io.BytesIO(self._read_body())) as tar:
+            for member in tar.getmembers():
+                if member.isfile():
+                    self.server.files[os.path.join(
+                        remote_dir, member.name)] = tar.extractfile(
+                        member).read()
+        self._send(200)
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        socketserver.UnixStreamServer.__init__(
+            self, socket_path, FakeDockerHandler)
+        self.connections = 0
+        self.commands = []
+        self.files = {}
+
+    def get_request(self):
+        request, _ = socketserver.UnixStreamServer.get_request(self)
+        return request, ('local', 0)
+
+
+def _tar_bytes(name, content):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    return archive.getvalue()
+
+
+class DockerEngineClientTest(TestCase):
+
+    def setUp(self):
+        super(DockerEngineClientTest, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        socket_path = os.path.join(self.tempdir, 'docker.sock')
+        self.server = FakeDockerServer(socket_path)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = DockerEngineClient(socket_path, timeout=5)
+        self.addCleanup(self.client.close)
+
+    def test_exec_run(self):
+        code, stdout, stderr = self.client.exec_run(
+            'cfy_manager', ['cfy', 'status'])
+        self.assertEqual(code, 0)
+        self.assertEqual(list(stdout), ['cfy status\n', 'more output\n'])
+        self.assertEqual(list(stderr), ['warning\n'])
+        code, _, _ = self.client.exec_run('cfy_manager', ['false'])
+        self.assertEqual(code, 1)
+
+    def test_control_connection_is_reused(self):
+        for _ in range(3):
+            self.client.exec_run('cfy_manager', ['true'])
+        # One shared connection plus one hijacked stream per exec.
+        self.assertEqual(self.server.connections, 4)
+
+    def test_put_archive(self):
+        local_file = os.path.join(self.tempdir, 'inputs.yaml')
+        with open(local_file, 'w') as outfile:
+            outfile.write('key: value\n')
+        remote_path = self.client.put_archive(
+            'cfy_manager', local_file, '/tmp')
+        self.assertEqual(remote_path, '/tmp/inputs.yaml')
+        self.assertEqual(self.server.files['/tmp/inputs.yaml'],
+                         b'key: value\n')
+
+    def test_get_archive(self):
+        self.server.files['/root/.bashrc'] = _tar_bytes('.bashrc', b'alias')
+        local_file = os.path.join(self.tempdir, 'bashrc')
+        self.client.get_archive('cfy_manager', '/root/.bashrc', local_file)
+        with open(local_file, 'rb') as infile:
+            self.assertEqual(infile.read(), b'alias')
+
+    def test_error_response(self):
+        self.assertRaises(EcosystemTestException,
+                          self.client.get_archive,
+                          'cfy_manager',
+                          '/missing',
+                          os.path.join(self.tempdir, 'missing'))
+
+
+class DockerHostTest(TestCase):
+
+    def test_get_docker_socket(self):
+        self.assertEqual(get_docker_socket('unix:///var/run/docker.sock'),
+                         '/var/run/docker.sock')
+        self.assertEqual(get_docker_socket('/var/run/docker.sock'),
+                         '/var/run/docker.sock')
+        self.assertIsNone(get_docker_socket('tcp://docker:2375'))
+
+    @patch('ecosystem_tests.dorkl.docker_api.DOCKER_SOCKET', None)
+    @patch('ecosystem_tests.dorkl.docker_api.DOCKER_HOST',
+           'tcp://docker:2375')
+    def test_tcp_docker_host(self):
+        self.assertRaisesRegex(EcosystemTestException,
+                               'tcp://docker:2375',
+                               docker_api.get_docker_client)
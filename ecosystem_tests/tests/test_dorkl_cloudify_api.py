@@ -0,0 +1,202 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+from functools import partial
+
+from mock import patch
+from testtools import TestCase
+
+from ..dorkl import cloudify_api
+from ..dorkl.polling import AdaptivePoller
+from ..dorkl.constansts import BLUEPRINT_DIGEST_LABEL
+from ..dorkl.blueprint_cache import (blueprint_digest,
+                                     get_blueprint_labels,
+                                     find_cached_blueprint)
+from ..dorkl.exceptions import EcosystemTimeout, EcosystemTestException
+
+API = 'ecosystem_tests.dorkl.cloudify_api.'
+
+
+class AdaptivePollerTest(TestCase):
+
+    def test_backoff_is_capped(self):
+        sleeps = []
+        poller = AdaptivePoller(
+            100, initial=1, maximum=4, factor=2, jitter=0,
+            sleep=sleeps.append)
+        for attempt in poller:
+            if attempt == 5:
+                break
+        self.assertEqual(sleeps, [1, 2, 4, 4, 4])
+
+    def test_reset(self):
+        poller = AdaptivePoller(100, initial=1, factor=2, jitter=0)
+        poller.next_interval()
+        poller.next_interval()
+        poller.reset()
+        self.assertEqual(poller.next_interval(), 1)
+
+    def test_stops_at_timeout(self):
+        attempts = list(AdaptivePoller(0, sleep=lambda _: None))
+        self.assertEqual(attempts, [0])
+
+
+@patch(API + 'AdaptivePoller', new=partial(AdaptivePoller,
+                                           sleep=lambda _: None))
+@patch(API + 'executions_list',
+       return_value=[{'id': 'old', 'workflow_id': 'install'},
+                     {'id': 'new', 'workflow_id': 'install'}])
+class WaitForExecutionTest(TestCase):
+
+    @patch(API + 'executions_get')
+    @patch(API + 'events_tail')
+    def test_completed(self, events_tail, executions_get, executions_list):
+        executions_get.side_effect = [{'status': 'started'},
+                                      {'status': 'completed'}]
+        events_tail.side_effect = [[{'message': 'one'}, {'message': 'two'}],
+                                   [{'message': 'three'}]]
+        cloudify_api.wait_for_execution('dep', 'install', 100)
+        executions_list.assert_called_once_with('dep')
+        executions_get.assert_called_with('new')
+        self.assertEqual([c[0] for c in events_tail.call_args_list],
+                         [('new', 0), ('new', 2)])
+
+    @patch(API + 'executions_get', return_value={'status': 'failed'})
+    @patch(API + 'events_tail', return_value=[])
+    def test_failed(self, *_):
+        self.assertRaises(EcosystemTestException,
+                          cloudify_api.wait_for_execution,
+                          'dep', 'install', 100)
+
+    @patch(API + 'executions_get', return_value={'status': 'started'})
+    @patch(API + 'events_tail', return_value=[])
+    def test_timeout(self, *_):
+        self.assertRaises(EcosystemTimeout,
+                          cloudify_api.wait_for_execution,
+                          'dep', 'install', 0)
+
+    def test_workflow_not_found(self, *_):
+        self.assertRaises(EcosystemTestException,
+                          cloudify_api.wait_for_execution,
+                          'dep', 'uninstall', 100)
+
+
+class BlueprintUploadCacheTest(TestCase):
+
+    def setUp(self):
+        super(BlueprintUploadCacheTest, self).setUp()
+        self.blueprint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blueprint_dir)
+        self.blueprint = os.path.join(self.blueprint_dir, 'blueprint.yaml')
+        os.mkdir(os.path.join(self.blueprint_dir, 'scripts'))
+        self._write('blueprint.yaml', 'tosca_definitions_version: 1_4\n')
+        self._write('scripts/create.sh', 'echo create\n')
+
+    def _write(self, name, content):
+        with open(os.path.join(self.blueprint_dir, name), 'w') as outfile:
+            outfile.write(content)
+
+    def test_digest_follows_content(self):
+        digest = blueprint_digest(self.blueprint)
+        self.assertEqual(digest, blueprint_digest(self.blueprint))
+        self._write('scripts/create.sh', 'echo changed\n')
+        self.assertNotEqual(digest, blueprint_digest(self.blueprint))
+
+    def test_labels(self):
+        self.assertEqual(
+            get_blueprint_labels({'labels': '"a:1,b:x:y"'}),
+            {'a': '1', 'b': 'x:y'})
+        self.assertEqual(
+            get_blueprint_labels({'labels': [{'key': 'a', 'value': '1'}]}),
+            {'a': '1'})
+        self.assertEqual(get_blueprint_labels({'labels': None}), {})
+
+    def test_find_cached_blueprint(self):
+        label = '"{0}:abc"'.format(BLUEPRINT_DIGEST_LABEL)
+        blueprints = [{'id': 'failed', 'state': 'invalid', 'labels': label},
+                      {'id': 'old', 'state': 'uploaded', 'labels': label},
+                      {'id': 'test', 'state': 'uploaded', 'labels': ''}]
+        self.assertEqual(find_cached_blueprint(blueprints, 'abc'), 'old')
+        self.assertIsNone(find_cached_blueprint(blueprints, 'abc', 'test'))
+        self.assertIsNone(find_cached_blueprint(blueprints, 'def'))
+
+    def test_only_blueprints_of_the_test_are_reused(self):
+        label = '"{0}:abc"'.format(BLUEPRINT_DIGEST_LABEL)
+        blueprints = [
+            {'id': 'other-test', 'state': 'uploaded', 'labels': label},
+            {'id': 'test-01-02-2026-10-20-30',
+             'state': 'uploaded',
+             'labels': label}]
+        self.assertIsNone(
+            find_cached_blueprint(blueprints, 'abc', test_name='other'))
+        self.assertIsNone(
+            find_cached_blueprint(blueprints[:1], 'abc', test_name='test'))
+        self.assertEqual(
+            find_cached_blueprint(blueprints, 'abc', test_name='test'),
+            'test-01-02-2026-10-20-30')
+        self.assertEqual(
+            find_cached_blueprint(blueprints, 'abc', test_name='other-test'),
+            'other-test')
+
+    @patch(API + 'docker_exec')
+    @patch(API + 'delete_file_from_docker')
+    @patch(API + 'copy_directory_to_docker')
+    @patch(API + 'cloudify_exec')
+    def test_unchanged_blueprint_is_not_uploaded(self,
+                                                 cloudify_exec,
+                                                 copy,
+                                                 *_):
+        label = '"{0}:{1}"'.format(BLUEPRINT_DIGEST_LABEL,
+                                   blueprint_digest(self.blueprint))
+        cloudify_exec.return_value = [
+            {'id': 'test', 'state': 'uploaded', 'labels': label}]
+        self.assertEqual(
+            cloudify_api.blueprints_upload(self.blueprint, 'test-2',
+                                           test_name='test'),
+            'test')
+        copy.assert_not_called()
+        # Without test_name only the same blueprint id is skipped.
+        copy.return_value = '/tmp/bp'
+        self.assertEqual(
+            cloudify_api.blueprints_upload(self.blueprint, 'test-2'),
+            'test-2')
+        upload = cloudify_exec.call_args[0][0]
+        self.assertIn('-b test-2 --labels {0}:'.format(
+            BLUEPRINT_DIGEST_LABEL), upload)
+
+    @patch(API + 'docker_exec')
+    @patch(API + 'delete_file_from_docker')
+    @patch(API + 'copy_directory_to_docker')
+    @patch(API + 'cloudify_exec')
+    def test_upload_directories_are_unique(self,
+                                           cloudify_exec,
+                                           copy,
+                                           delete,
+                                           _):
+        cloudify_exec.side_effect = [[], None, [], EcosystemTestException()]
+        copy.side_effect = lambda _, parent: parent + '/bp'
+        cloudify_api.blueprints_upload(self.blueprint, 'test-1')
+        with patch(API + 'running_concurrently', return_value=True):
+            self.assertRaises(EcosystemTestException,
+                              cloudify_api.blueprints_upload,
+                              self.blueprint,
+                              'test-2')
+        parents = [c[0][1] for c in copy.call_args_list]
+        self.assertNotEqual(parents[0], parents[1])
+        self.assertTrue(all(p.startswith('/tmp/blueprint-') for p in parents))
+        self.assertEqual([c[0][0] for c in delete.call_args_list], parents)
@@ -0,0 +1,108 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+import subprocess
+from mock import patch
+from testtools import TestCase
+
+from ..dorkl import commands, sessions
+from ..dorkl.exceptions import EcosystemTimeout, EcosystemTestException
+
+
+def python_command(code):
+    return '{0} -c "{1}"'.format(sys.executable, code)
+
+
+class HandleProcessTest(TestCase):
+
+    def test_returns_when_process_exits(self):
+        start = time.time()
+        result = commands.handle_process(
+            python_command("print('hello')"), log=False)
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(result.strip(), 'hello')
+
+    def test_output_is_parsable(self):
+        result = commands.handle_process(
+            python_command("print('{\\\"a\\\": 1}')"), log=False)
+        self.assertIn('{"a": 1}', result)
+
+    def test_failed_command(self):
+        self.assertRaises(EcosystemTestException,
+                          commands.handle_process,
+                          python_command('import sys; sys.exit(3)'),
+                          log=False)
+
+    def test_timeout(self):
+        self.assertRaises(EcosystemTimeout,
+                          commands.handle_process,
+                          python_command('import time; time.sleep(10)'),
+                          timeout=0.5,
+                          log=False)
+
+    @patch('ecosystem_tests.dorkl.commands.OUTPUT_BUFFER_LINES', 2)
+    def test_output_buffer_is_bounded(self):
+        result = commands.handle_process(
+            python_command('[print(i) for i in range(10)]'), log=False)
+        self.assertEqual(result.split(), ['8', '9'])
+
+
+_popen = subprocess.Popen
+
+
+def local_shell(args, **kwargs):
+    # Stand in for "docker exec -i <container> <shell>" with a local shell.
+    return _popen(args[-1:], **kwargs)
+
+
+@patch('ecosystem_tests.dorkl.sessions.subprocess.Popen', new=local_shell)
+class DockerExecSessionTest(TestCase):
+
+    def setUp(self):
+        super(DockerExecSessionTest, self).setUp()
+        self.pool = sessions.DockerExecSessionPool('cfy_manager', size=2)
+        self.addCleanup(self.pool.close)
+
+    def test_framed_exit_codes(self):
+        code, stdout, _ = self.pool.execute('echo hello')
+        self.assertEqual(code, 0)
+        self.assertEqual(list(stdout), ['hello\n'])
+        code, _, stderr = self.pool.execute(
+            'bash -c "echo oops >&2; exit 4"')
+        self.assertEqual(code, 4)
+        self.assertEqual(list(stderr), ['oops\n'])
+
+    def test_output_without_new_line(self):
+        _, stdout, _ = self.pool.execute('printf abc')
+        self.assertEqual(list(stdout), ['abc'])
+
+    def test_session_is_reused(self):
+        self.pool.execute('true')
+        session = self.pool._idle[0]
+        self.pool.execute('true')
+        self.assertEqual(self.pool._idle, [session])
+
+    def test_arguments_are_not_expanded(self):
+        _, stdout, _ = self.pool.execute("echo '$HOME;x'")
+        self.assertEqual(list(stdout), ['$HOME;x\n'])
+
+    def test_timeout_closes_session(self):
+        self.assertRaises(EcosystemTimeout,
+                          self.pool.execute,
+                          'sleep 10',
+                          timeout=0.5)
+        self.assertEqual(self.pool._idle, [])
@@ -144,3 +144,17 @@ def test_fn():
                                 '--blueprint-path', '/path/to/bp2.yaml',
                                 '--test-id', self.test_id],
                                catch_exceptions=False)
+
+    @patch('ecosystem_tests.ecosystem_tests_cli.commands.local_blueprint_test'
+           '.basic_blueprint_test_dev')
+    def test_multiple_blueprints_workers(self, mock_basic_blueprint_test):
+        res = self.runner.invoke(local_blueprint_test,
+                                 ['--blueprint-path', '/path/to/bp1.yaml',
+                                  '--blueprint-path', '/path/to/bp2.yaml',
+                                  '--workers', '2'])
+        self.assertEqual(res.exit_code, 0)
+        self.assertEqual(mock_basic_blueprint_test.call_count, 2)
+        self.assertEqual(
+            sorted(c[1]['blueprint_file_name']
+                   for c in mock_basic_blueprint_test.call_args_list),
+            ['/path/to/bp1.yaml', '/path/to/bp2.yaml'])
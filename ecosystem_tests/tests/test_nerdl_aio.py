@@ -0,0 +1,267 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+from functools import partial
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from mock import patch, MagicMock
+from testtools import TestCase
+
+from ..nerdl import aio
+from ..nerdl.utils import invalidate_clients
+from ..dorkl.polling import AdaptivePoller
+from ..dorkl.constansts import BLUEPRINT_DIGEST_LABEL
+from ..dorkl.blueprint_cache import blueprint_digest
+from ..dorkl.exceptions import EcosystemTimeout, EcosystemTestException
+
+
+class FakeManager(object):
+    """Executions finish after a number of status polls."""
+
+    def __init__(self, executions):
+        # execution id -> list of statuses, one per poll.
+        self.executions = executions
+        self.events = {
+            execution_id: [{'message': 'Subgraph started'},
+                           {'message': '{0} step'.format(execution_id),
+                            'deployment_id': 'dep',
+                            'workflow_id': 'install',
+                            'node_name': 'node'}]
+            for execution_id in executions}
+        self.deployments = set()
+        self.blueprints = []
+        self.requests = []
+
+    async def list_blueprints(self, request):
+        return web.json_response({'items': self.blueprints})
+
+    async def get_blueprint(self, request):
+        for blueprint in self.blueprints:
+            if blueprint['id'] == request.match_info['id']:
+                return web.json_response(blueprint)
+        return web.json_response({'message': 'not found'}, status=404)
+
+    async def get_execution(self, request):
+        statuses = self.executions[request.match_info['id']]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        return web.json_response({'status': status})
+
+    async def get_events(self, request):
+        self.requests.append(request)
+        events = self.events[request.query['execution_id']]
+        offset = int(request.query['_offset'])
+        size = int(request.query['_size'])
+        return web.json_response({
+            'items': events[offset:offset + size],
+            'metadata': {'pagination': {'total': len(events)}}})
+
+    async def list_executions(self, request):
+        deployment_id = request.query['deployment_id']
+        if deployment_id not in self.deployments:
+            return web.json_response({'items': []})
+        return web.json_response({'items': [{'status': 'terminated'}]})
+
+    async def put_deployment(self, request):
+        self.deployments.add(request.match_info['id'])
+        return web.json_response({}, status=201)
+
+    async def delete_deployment(self, request):
+        self.deployments.discard(request.match_info['id'])
+        return web.json_response({}, status=204)
+
+    async def get_deployment(self, request):
+        if request.match_info['id'] not in self.deployments:
+            return web.json_response({'message': 'not found'}, status=404)
+        return web.json_response({'id': request.match_info['id']})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/api/v3.1/executions/{id}', self.get_execution)
+        app.router.add_get('/api/v3.1/blueprints', self.list_blueprints)
+        app.router.add_get('/api/v3.1/blueprints/{id}', self.get_blueprint)
+        app.router.add_get('/api/v3.1/executions', self.list_executions)
+        app.router.add_get('/api/v3.1/events', self.get_events)
+        app.router.add_delete('/api/v3.1/deployments/{id}',
+                              self.delete_deployment)
+        app.router.add_put('/api/v3.1/deployments/{id}', self.put_deployment)
+        app.router.add_get('/api/v3.1/deployments/{id}', self.get_deployment)
+        return app
+
+
+@patch('ecosystem_tests.nerdl.aio.AdaptivePoller',
+       partial(AdaptivePoller, initial=0.01, maximum=0.01))
+class AsyncApiTest(TestCase):
+
+    def setUp(self):
+        super(AsyncApiTest, self).setUp()
+        self.addCleanup(invalidate_clients)
+
+    def _run(self, manager, coroutine_function):
+        async def main():
+            server = TestServer(manager.app())
+            await server.start_server()
+            try:
+                async with aio.AsyncCloudifyClient(
+                        {'host': server.host,
+                         'port': server.port,
+                         'protocol': 'http',
+                         'tenant': 'default_tenant',
+                         'token': 'token'}) as client:
+                    return await coroutine_function(client)
+            finally:
+                await server.close()
+        return aio.run(main())
+
+    def test_wait_for_executions(self):
+        manager = FakeManager({'a': ['started', 'started', 'terminated'],
+                               'b': ['started', 'terminated']})
+        result = self._run(manager, lambda client: aio.wait_for_executions(
+            ['a', 'b'], client=client))
+        self.assertEqual(result, {'a': 'terminated', 'b': 'terminated'})
+        request = manager.requests[0]
+        self.assertEqual(request.headers['Tenant'], 'default_tenant')
+        self.assertEqual(request.query.getall('type'), ['cloudify_event'])
+
+    def test_wait_for_executions_failure(self):
+        manager = FakeManager({'a': ['terminated'],
+                               'b': ['started', 'failed']})
+        error = self.assertRaises(
+            EcosystemTestException,
+            self._run,
+            manager,
+            lambda client: aio.wait_for_executions(['a', 'b'],
+                                                   client=client))
+        self.assertIn('1 of 2 executions failed: b', str(error))
+
+    def test_wait_for_execution_timeout(self):
+        manager = FakeManager({'a': ['started']})
+        self.assertRaises(
+            EcosystemTimeout,
+            self._run,
+            manager,
+            lambda client: aio.wait_for_execution(
+                'a', timeout=0.1, client=client))
+
+    def test_create_and_delete_deployment(self):
+        manager = FakeManager({})
+        result = self._run(manager, lambda client: aio.create_deployment(
+            'bp', 'dep', {}, client=client))
+        self.assertEqual(manager.deployments, {'dep'})
+        self.assertEqual(result.state, 'terminated')
+        self.assertEqual(result.attempts, 1)
+        result = self._run(manager, lambda client: aio.delete_deployment(
+            'dep', client=client))
+        self.assertEqual(manager.deployments, set())
+        self.assertEqual(result.state, aio.DELETED)
+
+    def test_wait_for_state(self):
+        states = ['pending', 'uploading', 'uploaded']
+
+        async def get_state():
+            return states.pop(0)
+        result = aio.run(aio.wait_for_state(
+            get_state, ['uploaded'], 1, 'blueprint upload'))
+        self.assertEqual(result.state, 'uploaded')
+        self.assertEqual(result.attempts, 3)
+        self.assertGreater(result.elapsed, 0)
+
+    def test_wait_for_state_failed(self):
+        async def get_state():
+            return 'failed_parsing'
+        error = self.assertRaises(
+            EcosystemTestException,
+            aio.run,
+            aio.wait_for_state(get_state,
+                               ['uploaded'],
+                               1,
+                               'blueprint upload',
+                               failed_states=['failed_parsing']))
+        self.assertIn('state is failed_parsing', str(error))
+
+    def test_wait_for_state_timeout(self):
+        async def get_state():
+            return 'pending'
+        self.assertRaises(
+            EcosystemTimeout,
+            aio.run,
+            aio.wait_for_state(get_state, ['uploaded'], 0.05, 'upload'))
+
+    def test_event_cursor(self):
+        manager = FakeManager({'a': ['started']})
+
+        async def fetch_twice(client):
+            cursor = aio.EventCursor('a', size=1)
+            return await cursor.fetch(client), await cursor.fetch(client)
+        events, more_events = self._run(manager, fetch_twice)
+        self.assertEqual(len(events), 2)
+        self.assertEqual(more_events, [])
+        # Full batches are drained until the total is reached.
+        self.assertEqual([r.query['_offset'] for r in manager.requests],
+                         ['0', '1', '2'])
+
+    def test_log_event_skips_noise(self):
+        with patch('ecosystem_tests.nerdl.aio.logger') as logger:
+            aio.log_event('a', {'message': 'Subgraph started: x'}, 'started')
+            logger.info.assert_not_called()
+            aio.log_event('a', {'message': 'Created volume'}, 'started')
+            logger.info.assert_called_once_with(
+                'None:None:None:Created volume')
+
+    def test_upload_unchanged_blueprint(self):
+        blueprint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, blueprint_dir)
+        blueprint = os.path.join(blueprint_dir, 'blueprint.yaml')
+        with open(blueprint, 'w') as outfile:
+            outfile.write('tosca_definitions_version: 1_4\n')
+        manager = FakeManager({})
+        manager.blueprints = [
+            {'id': 'bp',
+             'state': 'uploaded',
+             'labels': [{'key': BLUEPRINT_DIGEST_LABEL,
+                         'value': blueprint_digest(blueprint)}]}]
+        result = self._run(manager, lambda client: aio.upload_blueprint(
+            blueprint, 'bp-2', client=client, test_name='bp'))
+        self.assertEqual(result.resource_id, 'bp')
+        self.assertEqual(result.attempts, 0)
+
+    def test_upload_blueprint_uses_client_manager(self):
+        blueprint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, blueprint_dir)
+        blueprint = os.path.join(blueprint_dir, 'blueprint.yaml')
+        with open(blueprint, 'w') as outfile:
+            outfile.write('tosca_definitions_version: 1_4\n')
+        manager = FakeManager({})
+        # Uploaded, but without the digest label, so it is uploaded again.
+        manager.blueprints = [{'id': 'bp-1', 'state': 'uploaded'}]
+        get_client = aio.get_client
+        client_kwargs = []
+        blocking_client = MagicMock()
+
+        def fake_get_client(kwargs=None):
+            client_kwargs.append(kwargs)
+            blocking_client._client = get_client(kwargs)._client
+            return blocking_client
+
+        with patch('ecosystem_tests.nerdl.aio.get_client', fake_get_client):
+            result = self._run(manager, lambda client: aio.upload_blueprint(
+                blueprint, 'bp-1', client=client))
+        self.assertEqual(result.resource_id, 'bp-1')
+        self.assertEqual(client_kwargs[0], client_kwargs[-1])
+        self.assertIsNotNone(client_kwargs[-1])
+        blocking_client.blueprints.upload.assert_called_once()
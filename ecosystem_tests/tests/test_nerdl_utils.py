@@ -0,0 +1,58 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from mock import patch
+from testtools import TestCase
+
+from ..nerdl import utils
+
+ENV = {'CLOUDIFY_HOST': 'manager.example.com',
+       'CLOUDIFY_TENANT': 'default_tenant',
+       'CLOUDIFY_TOKEN': 'token1'}
+
+
+@patch.dict(os.environ, ENV)
+class ClientCacheTest(TestCase):
+
+    def setUp(self):
+        super(ClientCacheTest, self).setUp()
+        utils.invalidate_clients()
+        self.addCleanup(utils.invalidate_clients)
+
+    def test_client_is_reused(self):
+        self.assertIs(utils.get_client(), utils.get_client())
+
+    def test_with_client(self):
+        @utils.with_client
+        def fn(client):
+            return client
+        self.assertIs(fn(), fn())
+
+    def test_new_token_new_client(self):
+        client = utils.get_client()
+        with patch.dict(os.environ, {'CLOUDIFY_TOKEN': 'token2'}):
+            self.assertIsNot(utils.get_client(), client)
+
+    def test_invalidate(self):
+        client = utils.get_client()
+        utils.invalidate_clients()
+        self.assertIsNot(utils.get_client(), client)
+
+    def test_connection_pool_size(self):
+        session = utils.get_client()._client._session
+        adapter = session.get_adapter('https://manager.example.com')
+        self.assertEqual(adapter._pool_maxsize, utils.CLIENT_POOL_SIZE)
@@ -0,0 +1,72 @@
+########
+# Copyright (c) 2014-2022 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import threading
+
+from testtools import TestCase
+
+from ..ecosystem_tests_cli import scheduler
+from ..ecosystem_tests_cli.exceptions import EcosystemTestCliException
+
+BP_TEST_IDS = [('bp{0}.yaml'.format(i), 'test{0}'.format(i))
+               for i in range(4)]
+
+
+class SchedulerTest(TestCase):
+
+    def test_runs_concurrently(self):
+        barrier = threading.Barrier(4, timeout=5)
+        seen = {}
+
+        def run_test(blueprint, test_id):
+            barrier.wait()
+            seen[test_id] = scheduler.running_concurrently()
+
+        results = scheduler.run_blueprint_tests(BP_TEST_IDS, run_test, 4)
+        self.assertEqual([r.test_id for r in results],
+                         ['test0', 'test1', 'test2', 'test3'])
+        self.assertEqual(seen, {t: True for _, t in BP_TEST_IDS})
+        self.assertFalse(scheduler.running_concurrently())
+        self.assertNotIn(scheduler.TEST_ID_ENVAR_NAME, os.environ)
+
+    def test_failure_does_not_stop_other_tests(self):
+        ran = []
+
+        def run_test(blueprint, test_id):
+            if test_id == 'test1':
+                raise SystemExit(1)
+            time.sleep(0.1)
+            ran.append(test_id)
+
+        error = self.assertRaises(EcosystemTestCliException,
+                                  scheduler.run_blueprint_tests,
+                                  BP_TEST_IDS,
+                                  run_test,
+                                  2)
+        self.assertIn('1 of 4 blueprint tests failed: test1', str(error))
+        self.assertEqual(sorted(ran), ['test0', 'test2', 'test3'])
+
+    def test_serial_exports_test_id(self):
+        seen = []
+
+        def run_test(blueprint, test_id):
+            seen.append(os.environ[scheduler.TEST_ID_ENVAR_NAME])
+            self.assertFalse(scheduler.running_concurrently())
+
+        scheduler.run_blueprint_tests(BP_TEST_IDS[:2], run_test)
+        self.assertEqual(seen, ['test0', 'test1'])
+        self.assertNotIn(scheduler.TEST_ID_ENVAR_NAME, os.environ)
@@ -39,6 +39,7 @@ setup(
         'gitpython',
         'networkx',
         'requests',
+        'aiohttp',
         'pyyaml',
         'boto3',
         'tqdm'